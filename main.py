@@ -20,7 +20,11 @@ from src.api.mcp_router import router as mcp_router
 from src.api.chatbot_router import router as chatbot_router
 from src.core.agent_registry import AgentRegistry
 from src.core.metrics_collector import metrics_collector
+from src.core.scheduler import scheduler
+from src.communication.agent_channel import agent_channels
 from src.database.connection import DatabaseManager
+from src.database.influx_client import influx_client
+from src.core.result_cache import result_cache
 
 # Configure logging
 logging.basicConfig(
@@ -54,7 +58,13 @@ async def lifespan(app: FastAPI):
         await db_manager.create_tables()
         logger.info("Database tables created successfully")
         
+        await influx_client.initialize(db_manager)
+        result_cache.initialize(db_manager)
+        await metrics_collector.start(db_manager)
+        logger.info("Metrics collector started successfully")
+        
         agent_registry = AgentRegistry(db_manager)
+        await agent_registry.start()
         set_agent_registry(agent_registry)
         logger.info("Agent registry initialized successfully")
         
@@ -96,6 +106,12 @@ async def lifespan(app: FastAPI):
     logger.info("Shutting down Agent Monitor Framework...")
     
     # Cleanup resources
+    await agent_channels.close_all()
+    if agent_registry:
+        await agent_registry.stop()
+    await metrics_collector.shutdown()
+    await scheduler.stop()
+    
     if db_manager:
         await db_manager.shutdown()
     
@@ -3,18 +3,31 @@ Python Agent Client Library for Agent Monitor Framework.
 """
 
 import asyncio
+import gzip
 import logging
-import psutil
+import os
+import random
+import re
+import tempfile
 import time
 import httpx
 from datetime import datetime
-from typing import Dict, Any, Optional, Callable
+from typing import Dict, Any, Optional, Callable, Tuple
 from dataclasses import dataclass
 
 from ..models import (
     AgentInfo, AgentMetrics, ResourceMetrics, PerformanceMetrics, AIMetrics,
     AgentType, DeploymentType, AgentStatus
 )
+from ..communication import wire_format
+from ..communication.delta import DeltaEncoder
+from .sampler import ResourceSampler
+from .spool import MetricsSpool
+from .instrumentation import TaskInstrumentation
+from .stream import MonitorStream, WEBSOCKETS_AVAILABLE
+
+# Statuses worth retrying later; other rejections are not fixed by resending
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +44,24 @@ class AgentConfig:
     description: Optional[str] = None
     tags: list = None
     custom_metrics: Dict[str, Any] = None
+    wire_format: str = "binary"  # "binary", "msgpack" or "json"
+    delta_reporting: bool = False  # send only changed fields (JSON/msgpack)
+    delta_full_interval: int = 60  # reports between full snapshots in delta mode
+    sample_interval: float = 5.0  # background resource sampling period (seconds)
+    report_process_metrics: bool = True  # add the host process's CPU/RSS/threads to custom metrics
+    spool_enabled: bool = True  # keep samples on disk while the monitor is unreachable
+    spool_path: Optional[str] = None  # defaults to a per-agent file in the temp directory
+    spool_max_bytes: int = 50 * 1024 * 1024
+    spool_max_age: float = 86400.0  # seconds
+    replay_batch_size: int = 500  # spooled samples per replayed request
+    retry_base_delay: float = 1.0  # seconds; doubles per failed replay, with full jitter
+    retry_max_delay: float = 300.0
+    transport: str = "http"  # "http", or "websocket" for one persistent multiplexed connection
+    adaptive_intervals: bool = True  # follow the intervals the monitor recommends in its replies
+    min_metrics_interval: float = 5.0  # seconds; bounds on any interval set by the monitor
+    max_metrics_interval: float = 600.0
+    min_heartbeat_interval: float = 5.0
+    max_heartbeat_interval: float = 120.0
     
     def __post_init__(self):
         if self.tags is None:
@@ -49,13 +80,27 @@ class AgentMonitorClient:
         self._monitoring_task: Optional[asyncio.Task] = None
         self._heartbeat_task: Optional[asyncio.Task] = None
         self._start_time = time.time()
-        self._task_counters = {
-            "completed": 0,
-            "failed": 0,
-            "pending": 0
-        }
-        self._response_times = []
+        # Task counters and response times, safe to record from any thread
+        self.instruments = TaskInstrumentation()
+        self._last_avg_response_time = 0.0
         self._custom_metrics_callbacks: Dict[str, Callable] = {}
+        self._content_type = self._select_content_type(config.wire_format)
+        self._delta_encoder = DeltaEncoder(config.delta_full_interval) if config.delta_reporting else None
+        self._sampler = ResourceSampler(interval=config.sample_interval)
+        self._stream: Optional[MonitorStream] = None
+        
+        # Report intervals; the monitor adjusts them in its replies and config pushes
+        self.metrics_interval = 60.0
+        self.heartbeat_interval = 30.0
+        self.server_config: Dict[str, Any] = {}
+        self._spool: Optional[MetricsSpool] = None
+        self._replay_task: Optional[asyncio.Task] = None
+        if config.spool_enabled:
+            self._spool = MetricsSpool(
+                config.spool_path or self._default_spool_path(config.agent_name),
+                max_bytes=config.spool_max_bytes,
+                max_age=config.spool_max_age
+            )
         
         # HTTP client for API communication
         self._http_client = httpx.AsyncClient(
@@ -111,6 +156,24 @@ class AgentMonitorClient:
             return
         
         self.is_monitoring = True
+        self._sampler.start()
+        
+        # Replay anything left over from a previous run
+        if self._spool is not None:
+            await self._spool.open()
+            if len(self._spool):
+                self._ensure_replay()
+        
+        if self.config.transport == "websocket":
+            if WEBSOCKETS_AVAILABLE:
+                self._stream = MonitorStream(
+                    self._stream_url(),
+                    on_config=self._apply_server_config,
+                    binary=self._content_type != wire_format.JSON
+                )
+                self._stream.start()
+            else:
+                logger.warning("websockets is not installed; reporting over HTTP")
         
         # Start metrics collection task
         self._monitoring_task = asyncio.create_task(self._metrics_collection_loop())
@@ -123,6 +186,7 @@ class AgentMonitorClient:
     async def stop_monitoring(self):
         """Stop background monitoring tasks"""
         self.is_monitoring = False
+        self._sampler.stop()
         
         if self._monitoring_task:
             self._monitoring_task.cancel()
@@ -138,6 +202,20 @@ class AgentMonitorClient:
             except asyncio.CancelledError:
                 pass
         
+        if self._stream is not None:
+            await self._stream.stop()
+            self._stream = None
+        
+        if self._replay_task:
+            self._replay_task.cancel()
+            try:
+                await self._replay_task
+            except asyncio.CancelledError:
+                pass
+            self._replay_task = None
+        if self._spool is not None:
+            self._spool.close()
+        
         logger.info("Agent monitoring stopped")
     
     async def send_heartbeat(self) -> bool:
@@ -145,106 +223,385 @@ class AgentMonitorClient:
         if not self.agent_id:
             return False
         
+        if self._stream is not None and self._stream.is_connected:
+            try:
+                reply = await self._stream.request({"type": "heartbeat"})
+                if reply.get("type") == "ack":
+                    self._follow_recommendation(reply)
+                    return True
+            except ConnectionError:
+                pass
+        
         try:
             response = await self._http_client.post(
                 f"/api/v1/agents/{self.agent_id}/heartbeat"
             )
-            return response.status_code == 200
+            if response.status_code == 200:
+                self._follow_recommendation(self._reply_json(response))
+                return True
+            return False
         except Exception as e:
             logger.error(f"Failed to send heartbeat: {e}")
             return False
     
     async def report_metrics(self, custom_metrics: Optional[Dict[str, Any]] = None) -> bool:
-        """Report performance metrics"""
+        """Report performance metrics.
+        
+        If the monitor is unreachable (or overloaded) the sample goes to the
+        spool and is replayed later; returns True only if it was delivered now.
+        """
         if not self.agent_id:
             return False
         
         try:
             metrics = await self._collect_metrics(custom_metrics)
+        except Exception as e:
+            logger.error(f"Failed to collect metrics: {e}")
+            return False
+        
+        if self._spool is not None and len(self._spool):
+            # Queue behind the backlog so samples arrive in order
+            await self._spool_metrics(metrics)
+            return False
+        
+        try:
+            if self._stream is not None and self._stream.is_connected:
+                status_code, detail = await self._report_over_stream(metrics)
+            else:
+                if self._delta_encoder is not None:
+                    response = await self._report_delta(metrics)
+                else:
+                    response = await self._report_full(metrics)
+                status_code, detail = response.status_code, response.text
+                if status_code == 200:
+                    self._follow_recommendation(self._reply_json(response))
+        except (httpx.TransportError, ConnectionError) as e:
+            logger.warning(f"Monitor unreachable: {e}")
+            status_code, detail = None, str(e)
+        except Exception as e:
+            logger.error(f"Failed to report metrics: {e}")
+            return False
+        
+        if status_code == 200:
+            return True
+        if self._spool is not None and (status_code is None or status_code in RETRYABLE_STATUS_CODES):
+            await self._spool_metrics(metrics)
+        elif status_code is not None:
+            logger.error(f"Monitor rejected metrics: {status_code} - {detail}")
+        return False
+    
+    async def _report_over_stream(self, metrics: AgentMetrics) -> Tuple[int, str]:
+        """Send a sample (or delta) over the stream; returns an HTTP-style status and detail"""
+        if self._delta_encoder is not None:
+            reply = await self._stream.request({"type": "delta", "delta": self._delta_encoder.encode(metrics)})
+            if reply.get("type") == "snapshot_required":
+                logger.info("Monitor requested a full metrics snapshot")
+                self._delta_encoder.reset()
+                reply = await self._stream.request({"type": "delta", "delta": self._delta_encoder.encode(metrics)})
+        else:
+            reply = await self._stream.request({"type": "metrics", "sample": metrics.model_dump(mode="json")})
+        
+        if reply.get("type") == "ack":
+            self._follow_recommendation(reply)
+            return 200, ""
+        return (503 if reply.get("retry") else 422), reply.get("error", "")
+    
+    async def report_status(self, status: AgentStatus) -> bool:
+        """Report a status change (e.g. MAINTENANCE) to the monitor"""
+        if not self.agent_id:
+            return False
+        
+        try:
+            if self._stream is not None and self._stream.is_connected:
+                reply = await self._stream.request({"type": "status", "status": status.value})
+                return reply.get("type") == "ack"
             
-            response = await self._http_client.post(
-                f"/api/v1/agents/{self.agent_id}/metrics",
-                json=metrics.model_dump(mode='json')
+            response = await self._http_client.put(
+                f"/api/v1/agents/{self.agent_id}/status",
+                params={"status": status.value}
             )
-            
             return response.status_code == 200
         except Exception as e:
-            logger.error(f"Failed to report metrics: {e}")
+            logger.error(f"Failed to report status: {e}")
             return False
     
+    def _apply_server_config(self, config: Dict[str, Any]):
+        """Adopt config pushed by the monitor (collection intervals etc.)"""
+        self.server_config = {k: v for k, v in config.items() if k != "type"}
+        self._apply_intervals(config)
+        logger.debug(f"Monitor config applied: {self.server_config}")
+    
+    def _follow_recommendation(self, reply: Dict[str, Any]):
+        """Adopt the next intervals the monitor recommended in a heartbeat/metrics reply"""
+        if self.config.adaptive_intervals:
+            self._apply_intervals(reply)
+    
+    @staticmethod
+    def _reply_json(response: httpx.Response) -> Dict[str, Any]:
+        try:
+            body = response.json()
+        except ValueError:
+            return {}
+        return body if isinstance(body, dict) else {}
+    
+    def _apply_intervals(self, values: Dict[str, Any]):
+        """Set report intervals from monitor-supplied values, within the configured bounds"""
+        previous = (self.metrics_interval, self.heartbeat_interval)
+        metrics_interval = values.get("metrics_interval")
+        if isinstance(metrics_interval, (int, float)) and metrics_interval > 0:
+            self.metrics_interval = min(self.config.max_metrics_interval,
+                                        max(self.config.min_metrics_interval, float(metrics_interval)))
+        heartbeat_interval = values.get("heartbeat_interval")
+        if isinstance(heartbeat_interval, (int, float)) and heartbeat_interval > 0:
+            self.heartbeat_interval = min(self.config.max_heartbeat_interval,
+                                          max(self.config.min_heartbeat_interval, float(heartbeat_interval)))
+        if (self.metrics_interval, self.heartbeat_interval) != previous:
+            logger.debug(
+                f"Report intervals now {self.metrics_interval}s (metrics), {self.heartbeat_interval}s (heartbeat)"
+            )
+    
+    def _stream_url(self) -> str:
+        base = self.config.monitor_url.rstrip("/")
+        if base.startswith("https://"):
+            base = "wss://" + base[len("https://"):]
+        elif base.startswith("http://"):
+            base = "ws://" + base[len("http://"):]
+        return f"{base}/api/v1/agents/{self.agent_id}/stream"
+    
+    async def _report_full(self, metrics: AgentMetrics) -> httpx.Response:
+        """Send a complete sample in the negotiated wire format"""
+        response = await self._post_metrics(metrics, self._content_type)
+        if response.status_code in (415, 422) and self._content_type != wire_format.JSON:
+            # Monitor does not understand this format - retry as JSON
+            response = await self._post_metrics(metrics, wire_format.JSON)
+            if response.status_code == 200:
+                logger.info(f"Monitor rejected {self._content_type} metrics; falling back to JSON")
+                self._content_type = wire_format.JSON
+        return response
+    
+    async def _report_delta(self, metrics: AgentMetrics) -> httpx.Response:
+        """Send only the fields that changed since the last report"""
+        # Deltas are documents rather than fixed-schema frames: msgpack unless JSON was chosen
+        content_type = wire_format.JSON
+        if self._content_type != wire_format.JSON and wire_format.MSGPACK_AVAILABLE:
+            content_type = wire_format.MSGPACK
+        payload = self._delta_encoder.encode(metrics)
+        response = await self._post_delta(payload, content_type)
+        
+        if response.status_code == 409:
+            # Monitor lost our baseline (restart or missed report) - resend in full
+            logger.info("Monitor requested a full metrics snapshot")
+            self._delta_encoder.reset()
+            response = await self._post_delta(self._delta_encoder.encode(metrics), content_type)
+        elif response.status_code == 404 and self._reply_json(response).get("detail") == "Not Found":
+            # No such route - monitor predates delta reporting
+            logger.info("Monitor does not accept metrics deltas; sending full samples")
+            self._delta_encoder = None
+            response = await self._report_full(metrics)
+        
+        return response
+    
+    async def _post_delta(self, payload: Dict[str, Any], content_type: str) -> httpx.Response:
+        return await self._http_client.post(
+            f"/api/v1/agents/{self.agent_id}/metrics:delta",
+            content=wire_format.encode_payload(payload, content_type),
+            headers={"Content-Type": content_type}
+        )
+    
+    async def _post_metrics(self, metrics: AgentMetrics, content_type: str) -> httpx.Response:
+        return await self._http_client.post(
+            f"/api/v1/agents/{self.agent_id}/metrics",
+            content=wire_format.encode_metrics([metrics], content_type),
+            headers={"Content-Type": content_type}
+        )
+    
+    async def _spool_metrics(self, metrics: AgentMetrics):
+        """Keep a sample on disk until the monitor accepts it again"""
+        try:
+            await self._spool.append(metrics)
+        except Exception as e:
+            logger.error(f"Failed to spool metrics, sample dropped: {e}")
+            return
+        if self._delta_encoder is not None:
+            # The monitor's delta baseline is unknown once reports go missing
+            self._delta_encoder.reset()
+        self._ensure_replay()
+    
+    def _ensure_replay(self):
+        if self._replay_task is None or self._replay_task.done():
+            self._replay_task = asyncio.create_task(self._replay_spool())
+    
+    async def _replay_spool(self):
+        """Drain the spool in compressed batches, backing off while the monitor is down.
+        
+        Delays use exponential backoff with full jitter (a random wait up to
+        the current cap), which also staggers agents reconnecting after a
+        monitor restart.
+        """
+        attempt = 0
+        delay = random.uniform(0, self.config.retry_base_delay)
+        while len(self._spool):
+            await asyncio.sleep(delay)
+            try:
+                rows = await self._spool.peek(self.config.replay_batch_size)
+                if not rows:
+                    break
+                response = await self._post_spooled([payload for _, payload in rows])
+                delivered = response.status_code == 200
+                if not delivered and response.status_code not in RETRYABLE_STATUS_CODES:
+                    logger.error(
+                        f"Monitor rejected {len(rows)} spooled samples "
+                        f"({response.status_code} - {response.text}); discarding them"
+                    )
+                    delivered = True
+            except httpx.TransportError as e:
+                logger.debug(f"Spool replay failed, monitor still unreachable: {e}")
+                delivered = False
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Spool replay failed: {e}")
+                delivered = False
+            
+            if delivered:
+                await self._spool.remove(rows[-1][0])
+                attempt = 0
+                delay = 0
+            else:
+                attempt += 1
+                cap = min(self.config.retry_max_delay, self.config.retry_base_delay * 2 ** attempt)
+                delay = random.uniform(0, cap)
+        
+        if self._spool.dropped:
+            logger.warning(f"Metrics spool drained; {self._spool.dropped} samples were dropped by its caps")
+            self._spool.dropped = 0
+    
+    async def _post_spooled(self, payloads: list) -> httpx.Response:
+        """Send already-serialized samples as one gzip-compressed batch"""
+        body = b'{"metrics":[' + b",".join(payloads) + b"]}"
+        return await self._http_client.post(
+            "/api/v1/agents/metrics:batch",
+            content=gzip.compress(body, compresslevel=6),
+            headers={"Content-Type": wire_format.JSON, "Content-Encoding": "gzip"}
+        )
+    
+    @staticmethod
+    def _default_spool_path(agent_name: str) -> str:
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", agent_name) or "agent"
+        return os.path.join(tempfile.gettempdir(), "agent_monitor", f"{safe_name}.spool.sqlite3")
+    
+    @staticmethod
+    def _select_content_type(name: str) -> str:
+        """Map the configured wire format to a content type (JSON if unavailable)"""
+        name = (name or "json").lower()
+        if name == "binary":
+            return wire_format.BINARY
+        if name == "msgpack":
+            if wire_format.MSGPACK_AVAILABLE:
+                return wire_format.MSGPACK
+            logger.warning("msgpack is not installed; reporting metrics as JSON")
+        return wire_format.JSON
+    
+    def get_process_metrics(self) -> Dict[str, Any]:
+        """Latest resource usage of this agent's own process"""
+        sample = self._sampler.latest()
+        return dict(sample.process) if sample else {}
+    
     def register_custom_metric(self, name: str, callback: Callable[[], Any]):
         """Register a custom metric callback"""
         self._custom_metrics_callbacks[name] = callback
     
     def record_task_completed(self, response_time_ms: Optional[float] = None):
-        """Record a completed task"""
-        self._task_counters["completed"] += 1
-        if response_time_ms is not None:
-            self._response_times.append(response_time_ms)
-            # Keep only last 100 response times
-            if len(self._response_times) > 100:
-                self._response_times = self._response_times[-100:]
+        """Record a completed task (thread-safe)"""
+        self.instruments.record_success(response_time_ms)
     
     def record_task_failed(self):
-        """Record a failed task"""
-        self._task_counters["failed"] += 1
+        """Record a failed task (thread-safe)"""
+        self.instruments.record_failure()
     
     def set_pending_tasks(self, count: int):
-        """Set the number of pending tasks"""
-        self._task_counters["pending"] = count
+        """Set the number of pending tasks (thread-safe)"""
+        self.instruments.tasks_pending.set(count)
+    
+    def track_task(self):
+        """Context manager (``with`` or ``async with``) that times a task and records success or failure"""
+        return self.instruments.track()
+    
+    def timed(self, func: Callable) -> Callable:
+        """Decorator that records each call of a sync or async function as a task"""
+        return self.instruments.timed(func)
+    
+    def counter(self, name: str):
+        """Named thread-safe counter, reported as a custom metric"""
+        return self.instruments.counter(name)
+    
+    def gauge(self, name: str):
+        """Named thread-safe gauge, reported as a custom metric"""
+        return self.instruments.gauge(name)
     
     async def _collect_metrics(self, custom_metrics: Optional[Dict[str, Any]] = None) -> AgentMetrics:
         """Collect current metrics"""
-        # Collect system resource metrics
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('/')
-        net_io = psutil.net_io_counters()
+        # System resource metrics come from the background sampler's latest snapshot;
+        # only sample inline (in a worker thread) before its first tick
+        sample = self._sampler.latest()
+        if sample is None:
+            sample = await asyncio.to_thread(self._sampler.sample)
         
         resource_metrics = ResourceMetrics(
-            cpu_usage_percent=cpu_percent,
-            memory_usage_bytes=memory.used,
-            memory_usage_percent=memory.percent,
-            disk_usage_bytes=disk.used,
-            disk_io_read_bytes=net_io.bytes_recv if net_io else 0,
-            disk_io_write_bytes=net_io.bytes_sent if net_io else 0,
-            network_io_rx_bytes=net_io.bytes_recv if net_io else 0,
-            network_io_tx_bytes=net_io.bytes_sent if net_io else 0
+            cpu_usage_percent=sample.cpu_percent,
+            memory_usage_bytes=sample.memory_used_bytes,
+            memory_usage_percent=sample.memory_percent,
+            disk_usage_bytes=sample.disk_used_bytes,
+            disk_io_read_bytes=sample.disk_read_bytes,
+            disk_io_write_bytes=sample.disk_write_bytes,
+            network_io_rx_bytes=sample.net_rx_bytes,
+            network_io_tx_bytes=sample.net_tx_bytes
         )
         
         # Collect performance metrics
         uptime = int(time.time() - self._start_time)
-        avg_response_time = (
-            sum(self._response_times) / len(self._response_times) 
-            if self._response_times else 0.0
-        )
+        response_sketch = self.instruments.response_times.collect()
+        if response_sketch.count:
+            self._last_avg_response_time = response_sketch.mean
         
-        total_tasks = self._task_counters["completed"] + self._task_counters["failed"]
+        tasks_completed = int(self.instruments.tasks_completed.value())
+        tasks_failed = int(self.instruments.tasks_failed.value())
+        total_tasks = tasks_completed + tasks_failed
         error_rate = (
-            self._task_counters["failed"] / total_tasks 
+            tasks_failed / total_tasks 
             if total_tasks > 0 else 0.0
         )
         success_rate = 1.0 - error_rate
         
         performance_metrics = PerformanceMetrics(
-            tasks_completed=self._task_counters["completed"],
-            tasks_failed=self._task_counters["failed"],
-            tasks_pending=self._task_counters["pending"],
-            average_response_time_ms=avg_response_time,
-            throughput_per_second=self._task_counters["completed"] / max(1, uptime),
+            tasks_completed=tasks_completed,
+            tasks_failed=tasks_failed,
+            tasks_pending=max(0, int(self.instruments.tasks_pending.value())),
+            average_response_time_ms=self._last_avg_response_time,
+            throughput_per_second=tasks_completed / max(1, uptime),
             error_rate=error_rate,
             success_rate=success_rate,
-            uptime_seconds=uptime
+            uptime_seconds=uptime,
+            response_time_p50_ms=response_sketch.quantile(0.5),
+            response_time_p90_ms=response_sketch.quantile(0.9),
+            response_time_p99_ms=response_sketch.quantile(0.99),
+            response_time_max_ms=response_sketch.max if response_sketch.count else None
         )
         
         # Collect custom metrics
         collected_custom_metrics = custom_metrics or {}
+        for name, value in self.instruments.custom_values().items():
+            collected_custom_metrics.setdefault(name, value)
         for name, callback in self._custom_metrics_callbacks.items():
             try:
                 collected_custom_metrics[name] = callback()
             except Exception as e:
                 logger.error(f"Failed to collect custom metric {name}: {e}")
         
+        if self.config.report_process_metrics:
+            for name, value in sample.process.items():
+                collected_custom_metrics.setdefault(name, value)
+        
         # Extract AI-specific metrics from custom metrics
         ai_metrics = None
         ai_metric_fields = {}
@@ -280,7 +637,8 @@ class AgentMonitorClient:
             health_checks={
                 "system_health": True,  # Could be more sophisticated
                 "connectivity": True
-            }
+            },
+            sketches={"response_time_ms": response_sketch.to_dict()} if response_sketch.count else {}
         )
         
         return metrics
@@ -290,24 +648,24 @@ class AgentMonitorClient:
         while self.is_monitoring:
             try:
                 await self.report_metrics()
-                await asyncio.sleep(60)  # Collect metrics every minute
+                await asyncio.sleep(self.metrics_interval)
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in metrics collection loop: {e}")
-                await asyncio.sleep(60)
+                await asyncio.sleep(self.metrics_interval)
     
     async def _heartbeat_loop(self):
         """Background task for periodic heartbeat"""
         while self.is_monitoring:
             try:
                 await self.send_heartbeat()
-                await asyncio.sleep(30)  # Send heartbeat every 30 seconds
+                await asyncio.sleep(self.heartbeat_interval)
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in heartbeat loop: {e}")
-                await asyncio.sleep(30)
+                await asyncio.sleep(self.heartbeat_interval)
     
     async def __aenter__(self):
         """Async context manager entry"""
@@ -0,0 +1,221 @@
+"""
+Agent Instrumentation - Thread-safe counters, gauges and task timers for agent code.
+"""
+
+import functools
+import inspect
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..utils.quantiles import QuantileSketch
+
+
+def _thread_gone(owner: "weakref.ref[threading.Thread]") -> bool:
+    thread = owner()
+    return thread is None or not thread.is_alive()
+
+
+class ShardedCounter:
+    """Monotonic counter with one shard per thread.
+    
+    Each thread only ever writes its own shard, so increments need no lock;
+    ``value()`` sums the shards. Shards of finished threads are folded into
+    a retired total on read, so counts from short-lived threads are kept
+    without keeping a shard per thread forever.
+    """
+    
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[Tuple["weakref.ref[threading.Thread]", List[float]]] = []
+        self._retired = 0
+        self._lock = threading.Lock()
+    
+    def _new_shard(self) -> List[float]:
+        shard = [0]
+        with self._lock:
+            self._shards.append((weakref.ref(threading.current_thread()), shard))
+        self._local.shard = shard
+        return shard
+    
+    def inc(self, amount: float = 1):
+        try:
+            self._local.shard[0] += amount
+        except AttributeError:
+            self._new_shard()[0] += amount
+    
+    def _total(self) -> float:
+        """Retired plus live shard sum, folding finished threads' shards (lock held)"""
+        live = []
+        for owner, shard in self._shards:
+            if _thread_gone(owner):
+                # The owner can no longer write this shard
+                self._retired += shard[0]
+            else:
+                live.append((owner, shard))
+        self._shards = live
+        return self._retired + sum(shard[0] for _, shard in live)
+    
+    def value(self) -> float:
+        with self._lock:
+            return self._total()
+
+
+class ShardedGauge(ShardedCounter):
+    """Gauge that can be moved up and down from any thread, or set outright.
+    
+    ``set`` records a base offset against the current shard sum instead of
+    touching other threads' shards, so it never races with ``inc``/``dec``.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self._base = 0
+    
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+    
+    def set(self, value: float):
+        with self._lock:
+            self._base = value - self._total()
+    
+    def value(self) -> float:
+        return self._base + super().value()
+
+
+class ShardedSketch:
+    """Per-thread QuantileSketch shards, merged and reset on ``collect()``.
+    
+    Each shard has its own lock, which is only ever contended by the
+    collector, so recording stays O(1) and effectively uncontended.
+    Shards of finished threads are merged one last time and dropped.
+    """
+    
+    def __init__(self, accuracy: float = 0.01):
+        self.accuracy = accuracy
+        self._local = threading.local()
+        self._shards: List[Tuple["weakref.ref[threading.Thread]", list]] = []
+        self._lock = threading.Lock()
+    
+    def add(self, value: float):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._local.shard = [threading.Lock(), QuantileSketch(self.accuracy)]
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+        with shard[0]:
+            shard[1].add(value)
+    
+    def collect(self) -> QuantileSketch:
+        """Merge every shard into one sketch and start a new interval"""
+        merged = QuantileSketch(self.accuracy)
+        with self._lock:
+            shards = self._shards
+            self._shards = [(owner, shard) for owner, shard in shards if not _thread_gone(owner)]
+        for _, shard in shards:
+            with shard[0]:
+                sketch, shard[1] = shard[1], QuantileSketch(self.accuracy)
+            merged.merge(sketch)
+        return merged
+
+
+class _TaskTimer:
+    """Context manager (sync or async) that times one task and records its outcome"""
+    
+    __slots__ = ("_instruments", "_started")
+    
+    def __init__(self, instruments: "TaskInstrumentation"):
+        self._instruments = instruments
+        self._started = 0.0
+    
+    def __enter__(self):
+        self._instruments.in_flight.inc()
+        self._started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        elapsed_ms = (time.perf_counter() - self._started) * 1000.0
+        self._instruments.in_flight.dec()
+        if exc_type is None:
+            self._instruments.record_success(elapsed_ms)
+        else:
+            self._instruments.record_failure()
+        return False
+    
+    async def __aenter__(self):
+        return self.__enter__()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class TaskInstrumentation:
+    """Task counters, gauges and response time distribution for one agent.
+    
+    Safe to call from any thread and from async code. ``track()`` and
+    ``timed`` record duration and success/failure around a block or
+    function; named counters and gauges are reported as custom metrics.
+    """
+    
+    def __init__(self, accuracy: float = 0.01):
+        self.tasks_completed = ShardedCounter()
+        self.tasks_failed = ShardedCounter()
+        self.tasks_pending = ShardedGauge()
+        self.in_flight = ShardedGauge()
+        self.response_times = ShardedSketch(accuracy)
+        self._counters: Dict[str, ShardedCounter] = {}
+        self._gauges: Dict[str, ShardedGauge] = {}
+        self._lock = threading.Lock()
+    
+    def record_success(self, response_time_ms: Optional[float] = None):
+        self.tasks_completed.inc()
+        if response_time_ms is not None:
+            self.response_times.add(response_time_ms)
+    
+    def record_failure(self):
+        self.tasks_failed.inc()
+    
+    def track(self) -> _TaskTimer:
+        """``with``/``async with`` block timed and recorded as one task"""
+        return _TaskTimer(self)
+    
+    def timed(self, func: Callable) -> Callable:
+        """Decorator recording each call (sync or async) as one task"""
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                async with _TaskTimer(self):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _TaskTimer(self):
+                return func(*args, **kwargs)
+        return wrapper
+    
+    def counter(self, name: str) -> ShardedCounter:
+        """Named counter, created on first use"""
+        counter = self._counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(name, ShardedCounter())
+        return counter
+    
+    def gauge(self, name: str) -> ShardedGauge:
+        """Named gauge, created on first use"""
+        gauge = self._gauges.get(name)
+        if gauge is None:
+            with self._lock:
+                gauge = self._gauges.setdefault(name, ShardedGauge())
+        return gauge
+    
+    def custom_values(self) -> Dict[str, Any]:
+        """Current values of the named counters and gauges, plus tasks in flight"""
+        with self._lock:
+            metrics = list(self._counters.items()) + list(self._gauges.items())
+        values = {name: metric.value() for name, metric in metrics}
+        values["tasks_in_flight"] = self.in_flight.value()
+        return values
@@ -0,0 +1,134 @@
+"""
+Resource Sampler - Collects host and process resource usage off the event loop.
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ResourceSample:
+    """One snapshot of host and process resource usage"""
+    timestamp: float
+    cpu_percent: float
+    memory_used_bytes: int
+    memory_percent: float
+    disk_used_bytes: int
+    disk_read_bytes: int
+    disk_write_bytes: int
+    net_rx_bytes: int
+    net_tx_bytes: int
+    process: Dict[str, Any] = field(default_factory=dict)
+
+
+class ResourceSampler:
+    """Samples psutil counters on a background thread.
+    
+    CPU usage comes from non-blocking ``cpu_percent(interval=None)`` calls,
+    i.e. the average since the previous tick. Slow-changing values
+    (filesystem usage) are refreshed every ``slow_interval`` seconds and I/O
+    counters every tick. Readers get the latest snapshot via ``latest()``,
+    which never makes a system call.
+    """
+    
+    def __init__(self, interval: float = 5.0, slow_interval: float = 60.0, disk_path: str = "/"):
+        self.interval = interval
+        self.slow_interval = slow_interval
+        self.disk_path = disk_path
+        self._process = psutil.Process(os.getpid())
+        self._latest: Optional[ResourceSample] = None
+        self._disk_used = 0
+        self._disk_checked_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        
+        # Prime the CPU counters so the first tick reports a real average
+        psutil.cpu_percent(interval=None)
+        self._process.cpu_percent(interval=None)
+    
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="agent-monitor-sampler", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+    
+    def latest(self) -> Optional[ResourceSample]:
+        """Most recent snapshot, or None before the first tick"""
+        with self._lock:
+            return self._latest
+    
+    def sample(self) -> ResourceSample:
+        """Take a snapshot now (blocking; call from a worker thread)"""
+        now = time.monotonic()
+        if not self._disk_checked_at or now - self._disk_checked_at >= self.slow_interval:
+            try:
+                self._disk_used = psutil.disk_usage(self.disk_path).used
+            except OSError as e:
+                logger.debug(f"Failed to read disk usage for {self.disk_path}: {e}")
+            self._disk_checked_at = now
+        
+        memory = psutil.virtual_memory()
+        disk_io = psutil.disk_io_counters()
+        net_io = psutil.net_io_counters()
+        
+        snapshot = ResourceSample(
+            timestamp=time.time(),
+            cpu_percent=psutil.cpu_percent(interval=None),
+            memory_used_bytes=memory.used,
+            memory_percent=memory.percent,
+            disk_used_bytes=self._disk_used,
+            disk_read_bytes=disk_io.read_bytes if disk_io else 0,
+            disk_write_bytes=disk_io.write_bytes if disk_io else 0,
+            net_rx_bytes=net_io.bytes_recv if net_io else 0,
+            net_tx_bytes=net_io.bytes_sent if net_io else 0,
+            process=self._sample_process()
+        )
+        with self._lock:
+            self._latest = snapshot
+        return snapshot
+    
+    def _sample_process(self) -> Dict[str, Any]:
+        """Resource usage of the host agent's own process"""
+        try:
+            with self._process.oneshot():
+                memory = self._process.memory_info()
+                metrics = {
+                    "process_cpu_percent": self._process.cpu_percent(interval=None),
+                    "process_memory_rss_bytes": memory.rss,
+                    "process_memory_percent": round(self._process.memory_percent(), 3),
+                    "process_num_threads": self._process.num_threads(),
+                }
+                if hasattr(self._process, "num_fds"):
+                    metrics["process_open_fds"] = self._process.num_fds()
+                return metrics
+        except psutil.Error as e:
+            logger.debug(f"Failed to sample process metrics: {e}")
+            return {}
+    
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Resource sampling failed: {e}")
+            self._stop.wait(self.interval)
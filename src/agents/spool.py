@@ -0,0 +1,138 @@
+"""
+Metrics Spool - Bounded on-disk queue for samples the monitor could not accept.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from ..models import AgentMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsSpool:
+    """Append-only SQLite queue of serialized samples, capped by size and age.
+    
+    Samples are stored as their JSON encoding so a batch can be replayed
+    without re-validating them. When the spool grows past ``max_bytes`` the
+    oldest samples are dropped; samples older than ``max_age`` seconds are
+    dropped on every append and read. All file access runs in worker threads.
+    """
+    
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, max_age: float = 86400.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._count = 0
+        self._bytes = 0
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS samples ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, payload BLOB NOT NULL)"
+            )
+            self._count, self._bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM samples"
+            ).fetchone()
+        return self._conn
+    
+    async def open(self):
+        """Open the spool file, picking up samples left by a previous run"""
+        await asyncio.to_thread(self._locked, self._expire)
+        if self._count:
+            logger.info(f"Metrics spool {self.path} holds {self._count} samples from a previous run")
+    
+    async def append(self, metrics: AgentMetrics):
+        await asyncio.to_thread(self._locked, self._append, metrics.model_dump_json().encode())
+    
+    async def peek(self, limit: int) -> List[Tuple[int, bytes]]:
+        """Oldest ``limit`` samples as (row id, JSON payload)"""
+        return await asyncio.to_thread(self._locked, self._peek, limit)
+    
+    async def remove(self, last_id: int):
+        """Delete every sample up to and including ``last_id``"""
+        await asyncio.to_thread(self._locked, self._remove, last_id)
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+    
+    def _locked(self, fn, *args):
+        with self._lock:
+            self._connect()
+            return fn(*args)
+    
+    def _append(self, payload: bytes):
+        self._conn.execute("INSERT INTO samples (created_at, payload) VALUES (?, ?)", (time.time(), payload))
+        self._count += 1
+        self._bytes += len(payload)
+        self._expire()
+    
+    def _peek(self, limit: int) -> List[Tuple[int, bytes]]:
+        self._expire()
+        return self._conn.execute("SELECT id, payload FROM samples ORDER BY id LIMIT ?", (limit,)).fetchall()
+    
+    def _remove(self, last_id: int):
+        count, size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM samples WHERE id <= ?", (last_id,)
+        ).fetchone()
+        self._conn.execute("DELETE FROM samples WHERE id <= ?", (last_id,))
+        self._count -= count
+        self._bytes -= size
+    
+    def _expire(self):
+        """Enforce the age and size caps, oldest samples first"""
+        cutoff_id = None
+        if self.max_age:
+            row = self._conn.execute(
+                "SELECT MAX(id) FROM samples WHERE created_at < ?", (time.time() - self.max_age,)
+            ).fetchone()
+            cutoff_id = row[0]
+        
+        if self._bytes - self._bytes_through(cutoff_id) > self.max_bytes:
+            # Walk from the oldest end until what remains fits
+            excess = self._bytes - self.max_bytes
+            running = 0
+            for row_id, length in self._conn.execute("SELECT id, LENGTH(payload) FROM samples ORDER BY id"):
+                running += length
+                if running >= excess:
+                    cutoff_id = max(cutoff_id or 0, row_id)
+                    break
+        
+        if cutoff_id is not None:
+            before = self._count
+            self._remove(cutoff_id)
+            # Warn once per outage; every further append would repeat it
+            log = logger.debug if self.dropped else logger.warning
+            self.dropped += before - self._count
+            log(f"Metrics spool full or stale: dropped {before - self._count} oldest samples")
+    
+    def _bytes_through(self, row_id: Optional[int]) -> int:
+        if row_id is None:
+            return 0
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM samples WHERE id <= ?", (row_id,)
+        ).fetchone()[0]
@@ -0,0 +1,148 @@
+"""
+Monitor Stream - Client side of the persistent per-agent WebSocket channel.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import random
+from typing import Any, Callable, Dict, Optional
+
+from ..communication import wire_format
+
+# Optional websockets import
+try:
+    import websockets
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    websockets = None
+    WEBSOCKETS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class MonitorStream:
+    """Keeps one WebSocket open to the monitor and multiplexes messages over it.
+    
+    ``send`` is fire-and-forget; ``request`` tags the message with an id
+    and waits for the monitor's reply. ``config`` messages pushed by the
+    monitor are handed to ``on_config``. Dropped connections are re-opened
+    with exponential backoff and full jitter; requests in flight at that
+    point fail with ConnectionError.
+    """
+    
+    def __init__(
+        self,
+        url: str,
+        on_config: Optional[Callable[[Dict[str, Any]], None]] = None,
+        binary: bool = True,
+        reply_timeout: float = 10.0,
+        retry_base_delay: float = 1.0,
+        retry_max_delay: float = 60.0
+    ):
+        if not WEBSOCKETS_AVAILABLE:
+            raise RuntimeError("websockets is not installed")
+        
+        self.url = url
+        self.on_config = on_config
+        self.binary = binary and wire_format.MSGPACK_AVAILABLE
+        self.reply_timeout = reply_timeout
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._ws = None
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def is_connected(self) -> bool:
+        return self._ws is not None
+    
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def send(self, message: Dict[str, Any]):
+        ws = self._ws
+        if ws is None:
+            raise ConnectionError("Monitor stream is not connected")
+        try:
+            await ws.send(self._encode(message))
+        except websockets.ConnectionClosed as e:
+            raise ConnectionError(f"Monitor stream closed: {e}") from e
+    
+    async def request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a message and wait for the reply with the same id"""
+        message_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            await self.send({**message, "id": message_id})
+            return await asyncio.wait_for(future, self.reply_timeout)
+        except asyncio.TimeoutError as e:
+            raise ConnectionError("Monitor did not reply in time") from e
+        finally:
+            self._pending.pop(message_id, None)
+    
+    def _encode(self, message: Dict[str, Any]):
+        if self.binary:
+            return wire_format.encode_payload(message, wire_format.MSGPACK)
+        return json.dumps(message, separators=(",", ":"))
+    
+    def _decode(self, frame) -> Dict[str, Any]:
+        if isinstance(frame, bytes):
+            return wire_format.decode_payload(frame, wire_format.MSGPACK)
+        return json.loads(frame)
+    
+    async def _run(self):
+        attempt = 0
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, ping_timeout=20) as ws:
+                    self._ws = ws
+                    attempt = 0
+                    logger.info("Monitor stream connected")
+                    async for frame in ws:
+                        self._dispatch(self._decode(frame))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"Monitor stream error: {e}")
+            finally:
+                self._ws = None
+                for future in self._pending.values():
+                    if not future.done():
+                        future.set_exception(ConnectionError("Monitor stream closed"))
+            
+            attempt += 1
+            cap = min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt)
+            delay = random.uniform(0, cap)
+            logger.info(f"Monitor stream disconnected; reconnecting in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    
+    def _dispatch(self, message: Dict[str, Any]):
+        message_id = message.get("id")
+        if message_id is not None:
+            future = self._pending.get(message_id)
+            if future is not None and not future.done():
+                future.set_result(message)
+            return
+        
+        if message.get("type") == "config":
+            if self.on_config:
+                try:
+                    self.on_config(message)
+                except Exception as e:
+                    logger.error(f"Failed to apply monitor config: {e}")
+        elif message.get("type") == "nack":
+            logger.warning(f"Monitor rejected a stream message: {message.get('error')}")
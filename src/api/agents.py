@@ -2,17 +2,26 @@
 Agents API Router - Handles agent registration and management with database persistence.
 """
 
+import json
 import logging
 from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException, Query, Body
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Query, Body, Response, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from ..models import (
     AgentInfo, AgentSummary, AgentMetrics, RegisterResponse,
-    AgentStatus, AgentType, DeploymentType
+    AgentStatus, AgentType, DeploymentType, MetricsBatch, MetricsBatchResponse, AgentConfigUpdate
 )
 from ..core.metrics_collector import metrics_collector
+from ..communication.wire_format import (
+    decode_metrics, decode_payload, decompress_body, normalize_content_type, supported_content_types,
+    BatchTooLargeError, WireFormatError,
+    JSON, MSGPACK, BINARY
+)
+from ..communication.delta import DeltaGapError
+from ..communication.agent_channel import agent_channels, CLOSE_UNKNOWN_AGENT
+from ..config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +42,58 @@ def get_agent_registry():
     return agent_registry
 
 
+# OpenAPI description of the negotiated metrics request bodies
+METRICS_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            JSON: {"schema": {"type": "object"}},
+            MSGPACK: {"schema": {"type": "string", "format": "binary"}},
+            BINARY: {"schema": {"type": "string", "format": "binary"}},
+        }
+    }
+}
+
+
+async def read_metrics_payload(request: Request, max_samples: Optional[int] = None) -> List[AgentMetrics]:
+    """Decode a metrics request body according to its Content-Type (413 past ``max_samples``)"""
+    content_type = normalize_content_type(request.headers.get("content-type"))
+    supported = supported_content_types()
+    if content_type not in supported:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported metrics content type '{content_type}'",
+            headers={"Accept": ", ".join(supported)}
+        )
+    
+    try:
+        body = decompress_body(
+            await request.body(),
+            request.headers.get("content-encoding"),
+            settings.monitoring.max_metrics_body_bytes
+        )
+        return decode_metrics(body, content_type, max_samples)
+    except BatchTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except WireFormatError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+async def ingest_agent_sample(agent: AgentInfo, metrics: AgentMetrics):
+    """Store one sample from a known agent and count it as a heartbeat"""
+    metrics_collector.set_agent_dimensions(agent.id, agent.environment, agent.type)
+    await metrics_collector.receive_metrics(metrics)
+    await get_agent_registry().record_heartbeat(agent.id)
+
+
+async def recommended_intervals(agent_id: str, agent: Optional[AgentInfo] = None) -> dict:
+    """Reporting intervals the agent should use next, returned with every heartbeat and metrics reply"""
+    if agent is None:
+        agent = await get_agent_registry().get_agent(agent_id)
+    degraded = agent is not None and agent.status == AgentStatus.ERROR
+    return metrics_collector.recommend_intervals(agent_id, agent_channels.get_config(agent_id), degraded)
+
+
 @router.post("/register", response_model=RegisterResponse)
 async def register_agent(agent_info: AgentInfo):
     """Register a new agent"""
@@ -56,8 +117,9 @@ async def register_agent(agent_info: AgentInfo):
 async def deregister_agent(agent_id: str):
     """Deregister an agent"""
     try:
-        # Stop metrics collection
-        await metrics_collector.stop_collection_for_agent(agent_id)
+        # Stop metrics collection and drop in-memory metrics and channel state
+        await metrics_collector.remove_agent(agent_id)
+        await agent_channels.remove_agent(agent_id)
         
         # Remove from registry
         agent_registry = get_agent_registry()
@@ -76,40 +138,61 @@ async def deregister_agent(agent_id: str):
 
 @router.get("/", response_model=List[AgentSummary])
 async def list_agents(
+    response: Response,
     environment: Optional[str] = Query(None, description="Filter by environment"),
     agent_type: Optional[AgentType] = Query(None, description="Filter by agent type"),
     status: Optional[AgentStatus] = Query(None, description="Filter by status"),
-    limit: int = Query(50, ge=1, le=100, description="Maximum number of agents to return")
+    limit: int = Query(50, ge=1, le=1000, description="Maximum number of agents to return"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's X-Next-Cursor")
 ):
-    """Get list of all registered agents"""
+    """Get list of registered agents, one keyset page at a time (ordered by last update)"""
     try:
         agent_registry = get_agent_registry()
         
-        # Get all agents
-        if environment:
-            agents = await agent_registry.get_agents_by_environment(environment)
-        elif agent_type:
-            agents = await agent_registry.get_agents_by_type(agent_type.value)
-        else:
-            agents = await agent_registry.get_all_agents()
-        
-        # Filter by status if specified
-        if status:
-            agents = [agent for agent in agents if agent.status == status]
-        
-        # Convert to summaries
-        summaries = []
-        for agent in agents[:limit]:
-            summary = await agent_registry.get_agent_summary(agent.id)
-            if summary:
-                summaries.append(summary)
+        # Filtering, ordering and pagination happen in a single query
+        summaries, next_cursor = await agent_registry.list_agent_summaries(
+            environment=environment,
+            agent_type=agent_type,
+            status=status,
+            limit=limit,
+            after=cursor
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         
         return summaries
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to list agents: {e}")
         raise HTTPException(status_code=500, detail="Failed to list agents")
 
 
+@router.get("/export")
+async def export_agents(
+    environment: Optional[str] = Query(None, description="Filter by environment"),
+    agent_type: Optional[AgentType] = Query(None, description="Filter by agent type"),
+    status: Optional[AgentStatus] = Query(None, description="Filter by status")
+):
+    """Stream the agent inventory as NDJSON (one AgentInfo per line)"""
+    agent_registry = get_agent_registry()
+    
+    async def generate():
+        try:
+            async for agent in agent_registry.iter_agents(environment, agent_type, status):
+                yield agent.model_dump_json() + "\n"
+        except Exception as e:
+            # Headers are already sent; end the stream with an error record
+            logger.error(f"Agent export failed: {e}")
+            yield json.dumps({"error": "Agent export failed"}) + "\n"
+    
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=agents.ndjson"}
+    )
+
+
 @router.get("/{agent_id}", response_model=AgentInfo)
 async def get_agent(agent_id: str):
     """Get detailed information about a specific agent"""
@@ -152,7 +235,12 @@ async def agent_heartbeat(agent_id: str):
         success = await agent_registry.record_heartbeat(agent_id)
         
         if success:
-            return {"status": "success", "message": "Heartbeat recorded", "timestamp": datetime.utcnow()}
+            return {
+                "status": "success",
+                "message": "Heartbeat recorded",
+                "timestamp": datetime.utcnow(),
+                **await recommended_intervals(agent_id)
+            }
         else:
             raise HTTPException(status_code=404, detail="Agent not found")
     except HTTPException:
@@ -162,10 +250,15 @@ async def agent_heartbeat(agent_id: str):
         raise HTTPException(status_code=500, detail="Failed to record heartbeat")
 
 
-@router.post("/{agent_id}/metrics")
-async def submit_agent_metrics(agent_id: str, metrics: AgentMetrics):
-    """Submit metrics from an agent"""
+@router.post("/{agent_id}/metrics", openapi_extra=METRICS_REQUEST_BODY)
+async def submit_agent_metrics(agent_id: str, request: Request):
+    """Submit metrics from an agent (JSON, msgpack or binary frame)"""
     try:
+        samples = await read_metrics_payload(request)
+        if len(samples) != 1:
+            raise HTTPException(status_code=400, detail="Expected exactly one metrics sample")
+        metrics = samples[0]
+        
         agent_registry = get_agent_registry()
         agent = await agent_registry.get_agent(agent_id)
         if not agent:
@@ -178,17 +271,15 @@ async def submit_agent_metrics(agent_id: str, metrics: AgentMetrics):
                 detail=f"Metrics agent_id '{metrics.agent_id}' does not match URL agent_id '{agent_id}'"
             )
         
-        # Store metrics via metrics collector
-        await metrics_collector.receive_metrics(metrics)
-        
-        # Update last_seen timestamp for the agent
-        await agent_registry.record_heartbeat(agent_id)
+        # Store metrics and update the agent's last_seen timestamp
+        await ingest_agent_sample(agent, metrics)
         
         return {
             "status": "success", 
             "message": "Metrics received and stored",
             "timestamp": datetime.utcnow(),
-            "agent_id": agent_id
+            "agent_id": agent_id,
+            **await recommended_intervals(agent_id, agent)
         }
     except HTTPException:
         raise
@@ -197,6 +288,219 @@ async def submit_agent_metrics(agent_id: str, metrics: AgentMetrics):
         raise HTTPException(status_code=500, detail="Failed to submit agent metrics")
 
 
+@router.post("/{agent_id}/metrics:delta")
+async def submit_agent_metrics_delta(agent_id: str, request: Request):
+    """Submit a delta-encoded metrics sample (JSON or msgpack).
+    
+    Responds 409 with ``snapshot_required`` when the delta cannot be applied
+    (missed sequence number or no baseline); the agent then sends a full snapshot.
+    """
+    try:
+        content_type = normalize_content_type(request.headers.get("content-type"))
+        if content_type not in (JSON, MSGPACK) or content_type not in supported_content_types():
+            raise HTTPException(
+                status_code=415,
+                detail=f"Unsupported delta content type '{content_type}'",
+                headers={"Accept": ", ".join(t for t in supported_content_types() if t != BINARY)}
+            )
+        try:
+            payload = decode_payload(await request.body(), content_type)
+        except WireFormatError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if not isinstance(payload, dict) or "seq" not in payload or "timestamp" not in payload:
+            raise HTTPException(status_code=422, detail="Expected a delta object with 'seq' and 'timestamp'")
+        
+        if payload.setdefault("agent_id", agent_id) != agent_id:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Metrics agent_id '{payload['agent_id']}' does not match URL agent_id '{agent_id}'"
+            )
+        
+        agent_registry = get_agent_registry()
+        agent = await agent_registry.get_agent(agent_id)
+        if not agent:
+            raise HTTPException(status_code=404, detail="Agent not found")
+        
+        try:
+            metrics = metrics_collector.delta_decoder.apply(payload)
+        except DeltaGapError as e:
+            return JSONResponse(status_code=409, content={
+                "status": "snapshot_required",
+                "message": str(e),
+                "agent_id": agent_id,
+                "expected_seq": e.expected_seq
+            })
+        except (ValueError, TypeError, KeyError) as e:
+            raise HTTPException(status_code=422, detail=f"Invalid metrics delta: {e}")
+        
+        if metrics is not None:
+            await ingest_agent_sample(agent, metrics)
+        else:
+            await agent_registry.record_heartbeat(agent_id)
+        
+        return {
+            "status": "success" if metrics is not None else "duplicate",
+            "message": "Metrics received and stored" if metrics is not None else "Delta already applied",
+            "timestamp": datetime.utcnow(),
+            "agent_id": agent_id,
+            "seq": payload["seq"],
+            **await recommended_intervals(agent_id, agent)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to submit metrics delta for agent {agent_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to submit agent metrics")
+
+
+@router.websocket("/{agent_id}/stream")
+async def agent_stream(websocket: WebSocket, agent_id: str):
+    """Persistent channel carrying an agent's heartbeats, metrics and status updates.
+    
+    Agents send ``{"type": ...}`` messages as JSON text or msgpack binary
+    frames: ``heartbeat``, ``metrics`` (``sample``), ``delta`` (a metrics
+    delta payload) and ``status``. Messages with an ``id`` are answered with
+    ``ack``, ``nack`` or ``snapshot_required`` carrying the same id; acks
+    include the recommended ``metrics_interval``/``heartbeat_interval``. The
+    server pushes ``config`` messages (collection intervals etc.) on connect
+    and whenever they change.
+    """
+    await websocket.accept()
+    agent_registry = get_agent_registry()
+    agent = await agent_registry.get_agent(agent_id)
+    if not agent:
+        await websocket.close(code=CLOSE_UNKNOWN_AGENT)
+        return
+    
+    channel = await agent_channels.attach(agent_id, websocket)
+    try:
+        await channel.send({"type": "config", **agent_channels.get_config(agent_id)})
+        await agent_registry.record_heartbeat(agent_id)
+        while True:
+            try:
+                message = await channel.receive()
+            except WireFormatError as e:
+                await channel.send({"type": "nack", "error": str(e), "retry": False})
+                continue
+            
+            reply = await handle_channel_message(agent, message)
+            if reply is not None and "id" in message:
+                await channel.send({"id": message["id"], **reply})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Agent {agent_id} channel failed: {e}")
+    finally:
+        agent_channels.detach(agent_id, channel)
+
+
+async def handle_channel_message(agent: AgentInfo, message: dict) -> Optional[dict]:
+    """Process one channel message; returns the reply for messages that expect one"""
+    message_type = message.get("type")
+    try:
+        if message_type == "heartbeat":
+            await get_agent_registry().record_heartbeat(agent.id)
+            return {"type": "ack", **await recommended_intervals(agent.id)}
+        
+        if message_type == "metrics":
+            metrics = AgentMetrics.model_validate(message.get("sample"))
+            if metrics.agent_id != agent.id:
+                return {"type": "nack", "error": "Metrics agent_id does not match channel", "retry": False}
+            await ingest_agent_sample(agent, metrics)
+            return {"type": "ack", **await recommended_intervals(agent.id)}
+        
+        if message_type == "delta":
+            payload = message.get("delta")
+            if not isinstance(payload, dict) or "seq" not in payload or "timestamp" not in payload:
+                return {"type": "nack", "error": "Expected a delta object with 'seq' and 'timestamp'", "retry": False}
+            payload["agent_id"] = agent.id
+            try:
+                metrics = metrics_collector.delta_decoder.apply(payload)
+            except DeltaGapError as e:
+                return {"type": "snapshot_required", "expected_seq": e.expected_seq}
+            if metrics is not None:
+                await ingest_agent_sample(agent, metrics)
+            return {"type": "ack", "duplicate": metrics is None, **await recommended_intervals(agent.id)}
+        
+        if message_type == "status":
+            await get_agent_registry().update_agent_status(agent.id, AgentStatus(message.get("status")))
+            return {"type": "ack"}
+        
+        return {"type": "nack", "error": f"Unknown message type '{message_type}'", "retry": False}
+    except (ValueError, TypeError, KeyError) as e:
+        return {"type": "nack", "error": f"Invalid {message_type} message: {e}", "retry": False}
+    except Exception as e:
+        logger.error(f"Failed to handle {message_type} message from agent {agent.id}: {e}")
+        return {"type": "nack", "error": "Internal error", "retry": True}
+
+
+@router.put("/{agent_id}/channel/config")
+async def push_agent_config(agent_id: str, changes: AgentConfigUpdate):
+    """Change the config an agent runs with (e.g. metrics_interval) and push it over its channel"""
+    agent_registry = get_agent_registry()
+    agent = await agent_registry.get_agent(agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    delivered = await agent_channels.push_config(agent_id, changes.model_dump(exclude_unset=True))
+    return {
+        "status": "success",
+        "agent_id": agent_id,
+        "config": agent_channels.get_config(agent_id),
+        "delivered": delivered
+    }
+
+
+@router.post("/metrics:batch", response_model=MetricsBatchResponse, openapi_extra=METRICS_REQUEST_BODY)
+async def submit_metrics_batch(request: Request):
+    """Submit a batch of metrics samples for many agents (JSON, msgpack or binary frame)"""
+    try:
+        batch = MetricsBatch.model_construct(
+            metrics=await read_metrics_payload(request, settings.monitoring.max_metrics_batch_size)
+        )
+        
+        agent_registry = get_agent_registry()
+        
+        # Resolve agent existence once per distinct agent ID
+        agent_ids = {metrics.agent_id for metrics in batch.metrics}
+        missing_dimensions = [a for a in agent_ids if not metrics_collector.has_agent_dimensions(a)]
+        if missing_dimensions:
+            # Unseen agents: fetch environment/type for fleet rollups in the same query
+            dimensions = await agent_registry.get_agent_dimensions(missing_dimensions)
+            for agent_id, (environment, agent_type) in dimensions.items():
+                metrics_collector.set_agent_dimensions(agent_id, environment, agent_type)
+            known_agent_ids = set(dimensions)
+            if len(missing_dimensions) < len(agent_ids):
+                known_agent_ids |= await agent_registry.get_existing_agent_ids(
+                    list(agent_ids.difference(missing_dimensions))
+                )
+        else:
+            known_agent_ids = await agent_registry.get_existing_agent_ids(list(agent_ids))
+        unknown_agent_ids = sorted(agent_ids - known_agent_ids)
+        
+        accepted = [metrics for metrics in batch.metrics if metrics.agent_id in known_agent_ids]
+        
+        if accepted:
+            await metrics_collector.receive_metrics_batch(accepted)
+            await agent_registry.record_heartbeats(list(known_agent_ids))
+        
+        if unknown_agent_ids:
+            logger.warning(f"Metrics batch contained {len(unknown_agent_ids)} unknown agents")
+        
+        return MetricsBatchResponse(
+            status="success" if not unknown_agent_ids else ("partial" if accepted else "rejected"),
+            accepted=len(accepted),
+            rejected=len(batch.metrics) - len(accepted),
+            agents=len(known_agent_ids),
+            unknown_agents=unknown_agent_ids
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to submit metrics batch: {e}")
+        raise HTTPException(status_code=500, detail="Failed to submit metrics batch")
+
+
 @router.get("/{agent_id}/metrics", response_model=AgentMetrics)
 async def get_agent_metrics(agent_id: str):
     """Get metrics for a specific agent"""
@@ -2,14 +2,18 @@
 Metrics API Router - Handles metrics queries and dashboard data.
 """
 
+import json
 import logging
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 
-from ..models import MetricsQuery, MetricsResponse, AgentMetrics
-from ..core.agent_registry import agent_registry
+from ..models import MetricsQuery, MetricsResponse, AgentMetrics, AgentStatus, AgentType
 from ..core.metrics_collector import metrics_collector
+from ..core.result_cache import result_cache
+from ..communication.export_format import ENCODERS, EXPORT_FORMATS, supported_export_formats
+from .agents import get_agent_registry
 
 logger = logging.getLogger(__name__)
 
@@ -25,14 +29,37 @@ async def query_metrics(
     aggregation: Optional[str] = Query(None, description="Aggregation method"),
     interval: Optional[str] = Query(None, description="Time interval for aggregation")
 ):
-    """Query historical metrics"""
+    """Query historical metrics.
+    
+    Each agent is answered from its in-memory buffer when that reaches back
+    to ``start_time``, otherwise from the time series store. ``aggregation``
+    (mean/avg, min, max, sum, count, first, last) and ``interval`` (e.g.
+    ``5m``) bucket the points like Flux ``aggregateWindow``. ``data`` holds
+    one columnar series per agent.
+    
+    Results are cached: queries running up to now for one result cache
+    bucket, ranges that ended in the past until evicted.
+    """
     try:
+        # Cache on the query as asked, so open-ended polls share a bucket
+        params = {
+            "agent_ids": agent_ids,
+            "start_time": start_time,
+            "end_time": end_time,
+            "metric_names": metric_names,
+            "aggregation": aggregation,
+            "interval": interval
+        }
+        
         # Set default time range if not provided
         if not end_time:
             end_time = datetime.utcnow()
         if not start_time:
             start_time = end_time - timedelta(hours=24)
         
+        if start_time >= end_time:
+            raise HTTPException(status_code=422, detail="start_time must be before end_time")
+        
         query = MetricsQuery(
             agent_ids=agent_ids,
             start_time=start_time,
@@ -42,42 +69,99 @@ async def query_metrics(
             interval=interval
         )
         
-        # TODO: Implement actual time series database query
-        # For now, return mock response
-        mock_data = []
-        agents_list = agent_ids or []
-        
-        if not agent_ids:
-            # Get all agents if none specified
-            all_agents = await agent_registry.get_all_agents()
-            agents_list = [agent.id for agent in all_agents]
-        
-        # Get recent metrics for each agent
-        for agent_id in agents_list:
-            recent_metrics = await metrics_collector.get_recent_metrics(agent_id, 10)
-            for metric in recent_metrics:
-                mock_data.append({
-                    "agent_id": agent_id,
-                    "timestamp": metric.timestamp,
-                    "cpu_usage": metric.resource_metrics.cpu_usage_percent,
-                    "memory_usage": metric.resource_metrics.memory_usage_percent,
-                    "tasks_completed": metric.performance_metrics.tasks_completed,
-                    "response_time": metric.performance_metrics.average_response_time_ms
-                })
-        
-        return MetricsResponse(
-            query=query,
-            total_points=len(mock_data),
-            agents=agents_list,
-            time_range={"start": start_time, "end": end_time},
-            data=mock_data
-        )
+        async def compute():
+            agents_list = agent_ids or []
+            if not agent_ids:
+                # Get all agents if none specified
+                agent_registry = get_agent_registry()
+                all_agents = await agent_registry.get_all_agents()
+                agents_list = [agent.id for agent in all_agents]
+            
+            try:
+                series = await metrics_collector.query_metrics(query, agents_list)
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            
+            return MetricsResponse(
+                query=query,
+                total_points=sum(len(s.timestamps) for s in series),
+                agents=agents_list,
+                time_range={"start": start_time, "end": end_time},
+                data=series
+            )
         
+        return await result_cache.get_or_compute("metrics_query", params, compute, stop=params["end_time"])
+    
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to query metrics: {e}")
         raise HTTPException(status_code=500, detail="Failed to query metrics")
 
 
+@router.get("/export")
+async def export_metrics(
+    agent_ids: Optional[List[str]] = Query(None, description="Filter by agent IDs (all agents if omitted)"),
+    start_time: Optional[datetime] = Query(None, description="Start time for export"),
+    end_time: Optional[datetime] = Query(None, description="End time for export"),
+    metric_names: Optional[List[str]] = Query(None, description="Specific metrics to export (all if omitted)"),
+    aggregation: Optional[str] = Query(None, description="Aggregation method"),
+    interval: Optional[str] = Query(None, description="Time interval for aggregation"),
+    format: str = Query("ndjson", description="ndjson, csv or arrow")
+):
+    """Stream historical metrics from the time series store.
+    
+    Rows (time, agent_id, measurement, field, value) are read from the
+    store in chunks and written out as they arrive, so exports of any
+    length run in constant memory. ``arrow`` is an Arrow IPC stream and
+    needs pyarrow on the server.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    if format not in supported_export_formats():
+        raise HTTPException(status_code=406, detail=f"Export format {format} is not available on this server")
+    
+    if not end_time:
+        end_time = datetime.utcnow()
+    if not start_time:
+        start_time = end_time - timedelta(hours=24)
+    if start_time >= end_time:
+        raise HTTPException(status_code=422, detail="start_time must be before end_time")
+    
+    query = MetricsQuery(
+        agent_ids=agent_ids,
+        start_time=start_time,
+        end_time=end_time,
+        metric_names=metric_names,
+        aggregation=aggregation,
+        interval=interval
+    )
+    try:
+        chunks = metrics_collector.stream_metrics(query, agent_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    media_type, extension = EXPORT_FORMATS[format]
+    
+    async def generate():
+        try:
+            async for data in ENCODERS[format](chunks):
+                yield data
+        except Exception as e:
+            # Headers are already sent; NDJSON can still carry an error record
+            logger.error(f"Metrics export failed: {e}")
+            if format == "ndjson":
+                yield (json.dumps({"error": "Metrics export failed"}) + "\n").encode()
+    
+    return StreamingResponse(
+        generate(),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=metrics.{extension}"}
+    )
+
+
 @router.get("/recent/{agent_id}")
 async def get_recent_metrics(
     agent_id: str,
@@ -86,6 +170,7 @@ async def get_recent_metrics(
     """Get recent metrics for a specific agent"""
     try:
         # Verify agent exists
+        agent_registry = get_agent_registry()
         agent = await agent_registry.get_agent(agent_id)
         if not agent:
             raise HTTPException(status_code=404, detail="Agent not found")
@@ -97,7 +182,7 @@ async def get_recent_metrics(
             "count": len(recent_metrics),
             "metrics": recent_metrics
         }
-        
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -110,90 +195,135 @@ async def get_agent_metrics_summary(agent_id: str):
     """Get metrics summary for a specific agent"""
     try:
         # Verify agent exists
+        agent_registry = get_agent_registry()
         agent = await agent_registry.get_agent(agent_id)
         if not agent:
             raise HTTPException(status_code=404, detail="Agent not found")
         
-        summary = await metrics_collector.get_metrics_summary(agent_id)
+        async def compute():
+            return {
+                "agent_id": agent_id,
+                "summary": await metrics_collector.get_metrics_summary(agent_id)
+            }
+        
+        return await result_cache.get_or_compute("agent_summary", {"agent_id": agent_id}, compute)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to get metrics summary for {agent_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get metrics summary")
+
+
+@router.get("/summary/{agent_id}/stats")
+async def get_agent_field_stats(
+    agent_id: str,
+    field: str = Query("average_response_time_ms", description="Metric field to summarize"),
+    minutes: int = Query(15, ge=1, le=1440, description="Trailing window in minutes"),
+    quantiles: List[float] = Query([0.5, 0.95, 0.99], description="Quantiles to estimate")
+):
+    """Get windowed statistics and quantiles for one metric field of an agent"""
+    try:
+        if any(q < 0.0 or q > 1.0 for q in quantiles):
+            raise HTTPException(status_code=400, detail="Quantiles must be between 0 and 1")
+        
+        stats = await metrics_collector.get_field_window_stats(agent_id, field, minutes * 60, quantiles)
+        if stats is None:
+            raise HTTPException(status_code=404, detail="No metrics found for agent")
         
         return {
             "agent_id": agent_id,
-            "summary": summary
+            "field": field,
+            "minutes": minutes,
+            "stats": stats
         }
-        
+    
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to get metrics summary for {agent_id}: {e}")
-        raise HTTPException(status_code=500, detail="Failed to get metrics summary")
+        logger.error(f"Failed to get field stats for {agent_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get field stats")
 
 
 @router.get("/system/summary")
 async def get_system_metrics_summary():
     """Get system-wide metrics summary"""
     try:
-        summary = await metrics_collector.get_system_metrics_summary()
-        return summary
+        return await result_cache.get_or_compute(
+            "system_summary", {}, metrics_collector.get_system_metrics_summary
+        )
     except Exception as e:
         logger.error(f"Failed to get system metrics summary: {e}")
         raise HTTPException(status_code=500, detail="Failed to get system metrics summary")
 
 
 @router.get("/dashboard/data")
-async def get_dashboard_data():
+async def get_dashboard_data(
+    response: Response,
+    environment: Optional[str] = Query(None, description="Filter agents by environment"),
+    agent_type: Optional[AgentType] = Query(None, description="Filter agents by type"),
+    status: Optional[AgentStatus] = Query(None, description="Filter agents by status"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Maximum number of agent summaries"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's X-Next-Cursor")
+):
     """Get comprehensive dashboard data"""
     try:
-        # Get agents summary
-        agents = await agent_registry.get_all_agents()
-        agents_summary = []
-        
-        for agent in agents:
-            summary = await agent_registry.get_agent_summary(agent.id)
-            if summary:
-                agents_summary.append(summary)
-        
-        # Get system metrics
-        system_metrics = await metrics_collector.get_system_metrics_summary()
-        
-        # Calculate additional dashboard stats
-        total_agents = len(agents)
-        online_agents = len([a for a in agents if a.status == "online"])
-        warning_agents = len([a for a in agents if a.status == "warning"])
-        error_agents = len([a for a in agents if a.status == "error"])
-        offline_agents = len([a for a in agents if a.status == "offline"])
-        
-        # Get environment distribution
-        environments = {}
-        for agent in agents:
-            env = agent.environment
-            environments[env] = environments.get(env, 0) + 1
-        
-        # Get agent type distribution
-        agent_types = {}
-        for agent in agents:
-            agent_type = agent.type.value
-            agent_types[agent_type] = agent_types.get(agent_type, 0) + 1
+        agent_registry = get_agent_registry()
         
-        dashboard_data = {
-            "timestamp": datetime.utcnow(),
-            "overview": {
-                "total_agents": total_agents,
-                "online_agents": online_agents,
-                "warning_agents": warning_agents,
-                "error_agents": error_agents,
-                "offline_agents": offline_agents,
-                "health_score": (online_agents / max(1, total_agents)) * 100
-            },
-            "agents": agents_summary,
-            "system_metrics": system_metrics,
-            "distributions": {
-                "environments": environments,
-                "agent_types": agent_types
-            }
+        params = {
+            "environment": environment,
+            "agent_type": agent_type,
+            "status": status,
+            "limit": limit,
+            "cursor": cursor
         }
         
-        return dashboard_data
+        async def compute():
+            # Agent summaries in one query, fleet counts in one GROUP BY
+            agents_summary, next_cursor = await agent_registry.list_agent_summaries(
+                environment=environment,
+                agent_type=agent_type,
+                status=status,
+                limit=limit,
+                after=cursor
+            )
+            counts = await agent_registry.get_fleet_counts()
+            
+            # Get system metrics
+            system_metrics = await metrics_collector.get_system_metrics_summary()
+            
+            # Calculate additional dashboard stats
+            status_counts = {name.lower(): count for name, count in counts["status"].items()}
+            total_agents = sum(status_counts.values())
+            online_agents = status_counts.get("online", 0)
+            
+            dashboard_data = {
+                "timestamp": datetime.utcnow(),
+                "overview": {
+                    "total_agents": total_agents,
+                    "online_agents": online_agents,
+                    "warning_agents": status_counts.get("warning", 0),
+                    "error_agents": status_counts.get("error", 0),
+                    "offline_agents": status_counts.get("offline", 0),
+                    "health_score": (online_agents / max(1, total_agents)) * 100
+                },
+                "agents": agents_summary,
+                "system_metrics": system_metrics,
+                "distributions": {
+                    "environments": counts["environment"],
+                    "agent_types": counts["type"]
+                }
+            }
+            
+            return {"data": dashboard_data, "next_cursor": next_cursor}
         
+        cached = await result_cache.get_or_compute("dashboard_data", params, compute)
+        if cached["next_cursor"]:
+            response.headers["X-Next-Cursor"] = cached["next_cursor"]
+        return cached["data"]
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to get dashboard data: {e}")
         raise HTTPException(status_code=500, detail="Failed to get dashboard data")
@@ -207,61 +337,72 @@ async def get_agent_trends(
     """Get performance trends for a specific agent"""
     try:
         # Verify agent exists
+        agent_registry = get_agent_registry()
         agent = await agent_registry.get_agent(agent_id)
         if not agent:
             raise HTTPException(status_code=404, detail="Agent not found")
         
-        # Get recent metrics
-        recent_metrics = await metrics_collector.get_recent_metrics(agent_id, hours * 6)  # Assuming 10-minute intervals
-        
-        if not recent_metrics:
-            return {
+        async def compute():
+            # Get recent metrics as column views (no per-sample objects)
+            columns = await metrics_collector.get_recent_columns(
+                agent_id,
+                ["cpu_usage_percent", "memory_usage_percent", "average_response_time_ms"],
+                hours * 6  # Assuming 10-minute intervals
+            )
+            data_points = len(columns["timestamp"]) if columns else 0
+            
+            if not data_points:
+                return {
+                    "agent_id": agent_id,
+                    "trends": {
+                        "cpu_trend": "stable",
+                        "memory_trend": "stable",
+                        "performance_trend": "stable"
+                    },
+                    "data_points": 0
+                }
+            
+            # Calculate trends (simplified)
+            cpu_values = columns["cpu_usage_percent"]
+            memory_values = columns["memory_usage_percent"]
+            response_times = columns["average_response_time_ms"]
+            
+            def calculate_trend(values):
+                if len(values) < 2:
+                    return "stable"
+                
+                first_half = values[:len(values)//2]
+                second_half = values[len(values)//2:]
+                
+                avg_first = sum(first_half) / len(first_half)
+                avg_second = sum(second_half) / len(second_half)
+                
+                change_percent = ((avg_second - avg_first) / avg_first) * 100
+                
+                if change_percent > 10:
+                    return "increasing"
+                elif change_percent < -10:
+                    return "decreasing"
+                else:
+                    return "stable"
+            
+            trends = {
                 "agent_id": agent_id,
                 "trends": {
-                    "cpu_trend": "stable",
-                    "memory_trend": "stable",
-                    "performance_trend": "stable"
+                    "cpu_trend": calculate_trend(cpu_values),
+                    "memory_trend": calculate_trend(memory_values),
+                    "performance_trend": calculate_trend(response_times)
                 },
-                "data_points": 0
+                "data_points": data_points,
+                "time_range_hours": hours
             }
-        
-        # Calculate trends (simplified)
-        cpu_values = [m.resource_metrics.cpu_usage_percent for m in recent_metrics]
-        memory_values = [m.resource_metrics.memory_usage_percent for m in recent_metrics]
-        response_times = [m.performance_metrics.average_response_time_ms for m in recent_metrics]
-        
-        def calculate_trend(values):
-            if len(values) < 2:
-                return "stable"
             
-            first_half = values[:len(values)//2]
-            second_half = values[len(values)//2:]
-            
-            avg_first = sum(first_half) / len(first_half)
-            avg_second = sum(second_half) / len(second_half)
-            
-            change_percent = ((avg_second - avg_first) / avg_first) * 100
-            
-            if change_percent > 10:
-                return "increasing"
-            elif change_percent < -10:
-                return "decreasing"
-            else:
-                return "stable"
-        
-        trends = {
-            "agent_id": agent_id,
-            "trends": {
-                "cpu_trend": calculate_trend(cpu_values),
-                "memory_trend": calculate_trend(memory_values),
-                "performance_trend": calculate_trend(response_times)
-            },
-            "data_points": len(recent_metrics),
-            "time_range_hours": hours
-        }
-        
-        return trends
+            return trends
         
+        return await result_cache.get_or_compute(
+            "agent_trends", {"agent_id": agent_id, "hours": hours}, compute
+        )
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -0,0 +1,151 @@
+"""
+Agent Channels - One persistent WebSocket per agent for heartbeats, metrics, status and config pushes.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Dict
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from .wire_format import MSGPACK, MSGPACK_AVAILABLE, WireFormatError, decode_payload, encode_payload
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# WebSocket close codes used by the channel (4000-4999 are application defined)
+CLOSE_UNKNOWN_AGENT = 4404
+CLOSE_REPLACED = 4409
+CLOSE_DEREGISTERED = 4410
+
+
+class AgentChannel:
+    """Server side of one agent's connection.
+    
+    Messages are objects with a ``type`` field, sent as JSON text frames or
+    msgpack binary frames; replies and pushes use whichever encoding the
+    agent last sent. Sends are serialized so pushes never interleave with
+    replies.
+    """
+    
+    def __init__(self, agent_id: str, websocket: WebSocket):
+        self.agent_id = agent_id
+        self.websocket = websocket
+        self.binary = False
+        self.messages_received = 0
+        self._send_lock = asyncio.Lock()
+    
+    async def receive(self) -> Dict[str, Any]:
+        """Next message from the agent; raises WebSocketDisconnect when it goes away"""
+        frame = await self.websocket.receive()
+        if frame["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(frame.get("code", 1000))
+        
+        if frame.get("bytes") is not None:
+            self.binary = True
+            message = decode_payload(frame["bytes"], MSGPACK)
+        else:
+            self.binary = False
+            message = decode_payload(frame.get("text", "").encode(), None)
+        if not isinstance(message, dict) or "type" not in message:
+            raise WireFormatError("Channel messages must be objects with a 'type'")
+        self.messages_received += 1
+        return message
+    
+    async def send(self, message: Dict[str, Any]):
+        async with self._send_lock:
+            if self.binary and MSGPACK_AVAILABLE:
+                await self.websocket.send_bytes(encode_payload(message, MSGPACK))
+            else:
+                await self.websocket.send_text(json.dumps(message, separators=(",", ":"), default=str))
+    
+    async def close(self, code: int = 1000):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+
+class AgentChannelHub:
+    """Tracks connected agents and the config each one should run with.
+    
+    Config pushed for an agent is remembered, so it is resent whenever that
+    agent reconnects (to this API worker). An agent has at most one channel;
+    a new connection replaces the old one.
+    """
+    
+    def __init__(self):
+        self._channels: Dict[str, AgentChannel] = {}
+        self._configs: Dict[str, Dict[str, Any]] = {}
+    
+    def __len__(self) -> int:
+        return len(self._channels)
+    
+    def is_connected(self, agent_id: str) -> bool:
+        return agent_id in self._channels
+    
+    def default_config(self) -> Dict[str, Any]:
+        return {
+            "metrics_interval": settings.monitoring.default_metrics_interval,
+            "heartbeat_interval": settings.monitoring.default_health_check_interval,
+        }
+    
+    def get_config(self, agent_id: str) -> Dict[str, Any]:
+        """Effective config for an agent: defaults overlaid with anything pushed"""
+        config = self.default_config()
+        config.update(self._configs.get(agent_id, {}))
+        return config
+    
+    async def attach(self, agent_id: str, websocket: WebSocket) -> AgentChannel:
+        channel = AgentChannel(agent_id, websocket)
+        previous = self._channels.get(agent_id)
+        self._channels[agent_id] = channel
+        if previous is not None:
+            await previous.close(CLOSE_REPLACED)
+        logger.debug(f"Agent {agent_id} channel connected ({len(self._channels)} open)")
+        return channel
+    
+    def detach(self, agent_id: str, channel: AgentChannel):
+        if self._channels.get(agent_id) is channel:
+            del self._channels[agent_id]
+        logger.debug(f"Agent {agent_id} channel closed ({len(self._channels)} open)")
+    
+    async def push_config(self, agent_id: str, changes: Dict[str, Any]) -> bool:
+        """Update an agent's config and push it if connected; returns whether it was delivered"""
+        self._configs.setdefault(agent_id, {}).update(changes)
+        return await self.push(agent_id, {"type": "config", **self.get_config(agent_id)})
+    
+    async def push(self, agent_id: str, message: Dict[str, Any]) -> bool:
+        channel = self._channels.get(agent_id)
+        if channel is None:
+            return False
+        try:
+            await channel.send(message)
+            return True
+        except Exception as e:
+            logger.debug(f"Failed to push to agent {agent_id}: {e}")
+            return False
+    
+    async def remove_agent(self, agent_id: str):
+        """Drop config overrides and close the channel of a deregistered agent"""
+        self._configs.pop(agent_id, None)
+        channel = self._channels.pop(agent_id, None)
+        if channel is not None:
+            await channel.close(CLOSE_DEREGISTERED)
+    
+    async def close_all(self):
+        channels = list(self._channels.values())
+        self._channels.clear()
+        for channel in channels:
+            await channel.close(1001)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "connected_agents": len(self._channels),
+            "agents_with_config_overrides": len(self._configs),
+        }
+
+
+# Global hub for this API worker
+agent_channels = AgentChannelHub()
@@ -0,0 +1,207 @@
+"""
+Delta Metrics Encoding - Sends only the fields that changed since the previous sample.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..models import AgentMetrics
+
+# Groups tracked field by field; alerts are small and resent whole when they change.
+# Sketches describe one reporting interval only, so they are sent with every payload.
+DELTA_GROUPS = ("resource_metrics", "performance_metrics", "ai_metrics", "custom_metrics", "health_checks")
+
+_State = Dict[str, Dict[str, Any]]
+
+
+class DeltaGapError(ValueError):
+    """Raised when a delta does not follow the last applied sequence number"""
+    
+    def __init__(self, agent_id: str, expected_seq: Optional[int], received_seq: int):
+        self.agent_id = agent_id
+        self.expected_seq = expected_seq
+        self.received_seq = received_seq
+        super().__init__(
+            f"Delta {received_seq} for agent {agent_id} is out of sequence "
+            f"(expected {'a full snapshot' if expected_seq is None else expected_seq})"
+        )
+
+
+def _check_shape(payload: Dict[str, Any]):
+    """Raise ValueError unless a payload has the types DeltaEncoder produces"""
+    if not isinstance(payload, dict):
+        raise ValueError("Delta payload must be an object")
+    seq = payload.get("seq")
+    if not isinstance(seq, int) or isinstance(seq, bool) or seq < 1:
+        raise ValueError("'seq' must be a positive integer")
+    timestamp = payload.get("timestamp")
+    if not isinstance(timestamp, (int, float)) or isinstance(timestamp, bool):
+        raise ValueError("'timestamp' must be epoch seconds")
+    for key in ("set", "unset"):
+        groups = payload.get(key)
+        if groups is None:
+            continue
+        if not isinstance(groups, dict):
+            raise ValueError(f"'{key}' must map metrics groups to fields")
+        for group, fields in groups.items():
+            if group not in DELTA_GROUPS:
+                raise ValueError(f"Unknown metrics group '{group}'")
+            if key == "set" and not isinstance(fields, dict):
+                raise ValueError(f"'set.{group}' must be an object")
+            if key == "unset" and not (isinstance(fields, list) and all(isinstance(f, str) for f in fields)):
+                raise ValueError(f"'unset.{group}' must be a list of field names")
+    if "alerts" in payload and not isinstance(payload["alerts"], list):
+        raise ValueError("'alerts' must be a list")
+
+
+def _to_datetime(epoch: float) -> datetime:
+    try:
+        return datetime.fromtimestamp(epoch, timezone.utc)
+    except (OverflowError, OSError, ValueError) as e:
+        raise ValueError(f"'timestamp' out of range: {epoch}") from e
+
+
+def _flatten(metrics: AgentMetrics) -> Tuple[_State, List[Dict[str, Any]]]:
+    """Per-group field values of a sample (unset optional fields omitted)"""
+    state: _State = {}
+    for group in DELTA_GROUPS:
+        value = getattr(metrics, group)
+        if value is None:
+            state[group] = {}
+        elif isinstance(value, dict):
+            state[group] = dict(value)
+        else:
+            state[group] = value.model_dump(mode="json", exclude_none=True)
+    return state, list(metrics.alerts)
+
+
+class DeltaEncoder:
+    """Client side: turns successive samples into sequence-numbered deltas.
+    
+    Every payload carries ``seq``; a delta's ``set``/``unset`` maps are
+    relative to the sample sent with ``seq - 1``. A full snapshot is sent
+    first, every ``full_interval`` samples, and after ``reset()`` (call it
+    when the monitor asks for a resync).
+    """
+    
+    def __init__(self, full_interval: int = 60):
+        self.full_interval = max(1, full_interval)
+        self.seq = 0
+        self._state: Optional[_State] = None
+        self._alerts: List[Dict[str, Any]] = []
+        self._since_full = 0
+    
+    def reset(self):
+        """Force the next payload to be a full snapshot"""
+        self._state = None
+    
+    def encode(self, metrics: AgentMetrics) -> Dict[str, Any]:
+        state, alerts = _flatten(metrics)
+        timestamp = metrics.timestamp
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        
+        self.seq += 1
+        payload: Dict[str, Any] = {
+            "agent_id": metrics.agent_id,
+            "seq": self.seq,
+            "timestamp": timestamp.timestamp(),
+        }
+        if metrics.sketches:
+            payload["sketches"] = metrics.sketches
+        
+        if self._state is None or self._since_full >= self.full_interval:
+            payload["full"] = True
+            payload["set"] = {group: fields for group, fields in state.items() if fields}
+            payload["alerts"] = alerts
+            self._since_full = 0
+        else:
+            changed: Dict[str, Dict[str, Any]] = {}
+            removed: Dict[str, List[str]] = {}
+            for group, fields in state.items():
+                previous = self._state[group]
+                group_changes = {k: v for k, v in fields.items() if k not in previous or previous[k] != v}
+                if group_changes:
+                    changed[group] = group_changes
+                group_removed = [k for k in previous if k not in fields]
+                if group_removed:
+                    removed[group] = group_removed
+            if changed:
+                payload["set"] = changed
+            if removed:
+                payload["unset"] = removed
+            if alerts != self._alerts:
+                payload["alerts"] = alerts
+            self._since_full += 1
+        
+        self._state = state
+        self._alerts = alerts
+        return payload
+
+
+class DeltaDecoder:
+    """Server side: rebuilds full samples from deltas using each agent's last state.
+    
+    A delta is only applied on top of the sample with the preceding sequence
+    number; anything else raises DeltaGapError so the caller can ask the
+    agent for a full snapshot. Re-sent deltas (``seq`` already applied)
+    return None and are ignored.
+    """
+    
+    def __init__(self):
+        self._agents: Dict[str, Tuple[int, _State, List[Dict[str, Any]]]] = {}
+    
+    def __len__(self) -> int:
+        return len(self._agents)
+    
+    def expected_seq(self, agent_id: str) -> Optional[int]:
+        entry = self._agents.get(agent_id)
+        return entry[0] + 1 if entry else None
+    
+    def remove_agent(self, agent_id: str):
+        self._agents.pop(agent_id, None)
+    
+    def apply(self, payload: Dict[str, Any]) -> Optional[AgentMetrics]:
+        """Apply one delta or snapshot payload and return the reconstructed sample.
+        
+        Raises ValueError for a malformed payload and DeltaGapError when it
+        doesn't follow the agent's last applied sequence number.
+        """
+        _check_shape(payload)
+        agent_id = payload["agent_id"]
+        seq = payload["seq"]
+        timestamp = _to_datetime(payload["timestamp"])
+        entry = self._agents.get(agent_id)
+        
+        if payload.get("full"):
+            # Snapshots always replace the baseline (the agent may have restarted)
+            state: _State = {group: {} for group in DELTA_GROUPS}
+            alerts = payload.get("alerts", [])
+        else:
+            if entry is None:
+                raise DeltaGapError(agent_id, None, seq)
+            last_seq, previous, alerts = entry
+            if seq <= last_seq:
+                return None
+            if seq != last_seq + 1:
+                raise DeltaGapError(agent_id, last_seq + 1, seq)
+            state = {group: dict(fields) for group, fields in previous.items()}
+            for group, keys in (payload.get("unset") or {}).items():
+                for key in keys:
+                    state[group].pop(key, None)
+            alerts = payload.get("alerts", alerts)
+        
+        for group, fields in (payload.get("set") or {}).items():
+            state[group].update(fields)
+        
+        metrics = AgentMetrics.model_validate({
+            "agent_id": agent_id,
+            "timestamp": timestamp,
+            **{group: fields for group, fields in state.items() if group != "ai_metrics"},
+            "ai_metrics": state["ai_metrics"] or None,
+            "alerts": alerts,
+            "sketches": payload.get("sketches", {}),
+        })
+        # Only advance once the reconstructed sample is valid
+        self._agents[agent_id] = (seq, state, alerts)
+        return metrics
@@ -0,0 +1,102 @@
+"""
+Export Formats - Incremental NDJSON, CSV and Arrow IPC encoders for metrics exports.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List
+
+# Optional pyarrow import
+try:
+    import pyarrow
+    import pyarrow.ipc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pyarrow = None
+    PYARROW_AVAILABLE = False
+
+NDJSON = "application/x-ndjson"
+CSV = "text/csv"
+ARROW = "application/vnd.apache.arrow.stream"
+
+# Export format name -> (media type, file extension)
+EXPORT_FORMATS = {
+    "ndjson": (NDJSON, "ndjson"),
+    "csv": (CSV, "csv"),
+    "arrow": (ARROW, "arrows"),
+}
+
+# Columns of an exported row, in order
+EXPORT_COLUMNS = ("time", "agent_id", "measurement", "field", "value")
+
+
+def supported_export_formats() -> List[str]:
+    """Export formats usable with the installed libraries"""
+    return [name for name in EXPORT_FORMATS if name != "arrow" or PYARROW_AVAILABLE]
+
+
+def _isoformat(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def encode_ndjson(chunks: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        yield "".join(
+            json.dumps({column: _isoformat(row.get(column)) for column in EXPORT_COLUMNS}) + "\n"
+            for row in chunk
+        ).encode()
+
+
+async def encode_csv(chunks: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue().encode()
+    
+    async for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_isoformat(row.get(column)) for column in EXPORT_COLUMNS] for row in chunk)
+        yield buffer.getvalue().encode()
+
+
+async def encode_arrow(chunks: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """Arrow IPC stream: the schema, then one record batch per chunk"""
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is not installed")
+    
+    schema = pyarrow.schema([
+        ("time", pyarrow.timestamp("ms", tz="UTC")),
+        ("agent_id", pyarrow.string()),
+        ("measurement", pyarrow.string()),
+        ("field", pyarrow.string()),
+        ("value", pyarrow.float64()),
+    ])
+    sink = io.BytesIO()
+    writer = pyarrow.ipc.new_stream(sink, schema)
+    
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+    
+    yield drain()
+    async for chunk in chunks:
+        batch = pyarrow.RecordBatch.from_pydict(
+            {column: [row.get(column) for row in chunk] for column in EXPORT_COLUMNS},
+            schema=schema
+        )
+        writer.write_batch(batch)
+        yield drain()
+    writer.close()
+    yield drain()
+
+
+ENCODERS = {
+    "ndjson": encode_ndjson,
+    "csv": encode_csv,
+    "arrow": encode_arrow,
+}
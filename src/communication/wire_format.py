@@ -0,0 +1,321 @@
+"""
+Metrics Wire Formats - JSON, msgpack and a compact binary frame for metrics payloads.
+"""
+
+import functools
+import json
+import struct
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..models import AgentMetrics
+
+# Optional msgpack import
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+BINARY = "application/vnd.agent-monitor.metrics"
+
+# Alternate spellings accepted on input
+_CONTENT_TYPE_ALIASES = {
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+}
+
+# Fixed field schema for the binary frame: (group, field, struct code).
+# IDs are positions in this tuple - only ever append to it.
+BINARY_FIELDS: Tuple[Tuple[str, str, str], ...] = (
+    ("resource_metrics", "cpu_usage_percent", "d"),
+    ("resource_metrics", "memory_usage_bytes", "q"),
+    ("resource_metrics", "memory_usage_percent", "d"),
+    ("resource_metrics", "disk_usage_bytes", "q"),
+    ("resource_metrics", "disk_io_read_bytes", "q"),
+    ("resource_metrics", "disk_io_write_bytes", "q"),
+    ("resource_metrics", "network_io_rx_bytes", "q"),
+    ("resource_metrics", "network_io_tx_bytes", "q"),
+    ("resource_metrics", "gpu_usage_percent", "d"),
+    ("resource_metrics", "gpu_memory_usage_bytes", "q"),
+    ("performance_metrics", "tasks_completed", "q"),
+    ("performance_metrics", "tasks_failed", "q"),
+    ("performance_metrics", "tasks_pending", "q"),
+    ("performance_metrics", "average_response_time_ms", "d"),
+    ("performance_metrics", "throughput_per_second", "d"),
+    ("performance_metrics", "error_rate", "d"),
+    ("performance_metrics", "success_rate", "d"),
+    ("performance_metrics", "uptime_seconds", "q"),
+    ("ai_metrics", "model_inference_time_ms", "d"),
+    ("ai_metrics", "model_accuracy", "d"),
+    ("ai_metrics", "confidence_score", "d"),
+    ("ai_metrics", "tokens_processed", "q"),
+    ("ai_metrics", "tokens_per_second", "d"),
+    ("ai_metrics", "context_length", "q"),
+    ("ai_metrics", "api_calls_made", "q"),
+    ("ai_metrics", "api_call_latency_ms", "d"),
+    ("performance_metrics", "response_time_p50_ms", "d"),
+    ("performance_metrics", "response_time_p90_ms", "d"),
+    ("performance_metrics", "response_time_p99_ms", "d"),
+    ("performance_metrics", "response_time_max_ms", "d"),
+)
+
+_FRAME_MAGIC = b"AMF\x01"
+_FRAME_HEADER = struct.Struct("<4sI")   # magic + version, sample count
+_SAMPLE_HEADER = struct.Struct("<dQ")   # epoch seconds, field presence mask
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+
+# Value layout per presence mask: (struct, [(group, field names, start, end), ...]),
+# one entry per contiguous run of a group. The mask is client-supplied, so
+# only the most recently used layouts are kept.
+@functools.lru_cache(maxsize=256)
+def _layout(mask: int) -> Tuple[struct.Struct, List[Tuple[str, Tuple[str, ...], int, int]]]:
+    if mask >> len(BINARY_FIELDS):
+        raise WireFormatError(f"Unknown field ids in mask {mask:#x}")
+    present = [spec for field_id, spec in enumerate(BINARY_FIELDS) if mask >> field_id & 1]
+    
+    groups = []
+    for index, (group, field, _) in enumerate(present):
+        if groups and groups[-1][0] == group:
+            groups[-1][1].append(field)
+            groups[-1][3] = index + 1
+        else:
+            groups.append([group, [field], index, index + 1])
+    
+    return (
+        struct.Struct("<" + "".join(code for _, _, code in present)),
+        [(group, tuple(fields), start, end) for group, fields, start, end in groups]
+    )
+
+
+class WireFormatError(ValueError):
+    """Raised when a metrics payload cannot be decoded"""
+
+
+class BatchTooLargeError(WireFormatError):
+    """Raised when a payload carries more samples than the caller accepts"""
+    
+    def __init__(self, count: int, limit: int):
+        super().__init__(f"Batch of {count} samples exceeds limit of {limit}")
+        self.count = count
+        self.limit = limit
+
+
+def normalize_content_type(content_type: Optional[str]) -> str:
+    """Media type without parameters (charset etc.); JSON when missing"""
+    if not content_type:
+        return JSON
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return _CONTENT_TYPE_ALIASES.get(media_type, media_type)
+
+
+def supported_content_types() -> List[str]:
+    types = [JSON, BINARY]
+    if MSGPACK_AVAILABLE:
+        types.append(MSGPACK)
+    return types
+
+
+def decompress_body(body: bytes, content_encoding: Optional[str], max_size: int) -> bytes:
+    """Undo a gzip/deflate Content-Encoding, refusing output larger than ``max_size``"""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return body
+    if encoding not in ("gzip", "deflate"):
+        raise WireFormatError(f"Unsupported content encoding: {encoding}")
+    
+    # wbits=47 auto-detects gzip or zlib headers
+    decompressor = zlib.decompressobj(wbits=47)
+    try:
+        data = decompressor.decompress(body, max_size + 1)
+    except zlib.error as e:
+        raise WireFormatError(f"Invalid {encoding} body: {e}") from e
+    if len(data) > max_size or decompressor.unconsumed_tail:
+        raise WireFormatError(f"Decompressed body exceeds {max_size} bytes")
+    return data
+
+
+def encode_metrics(samples: List[AgentMetrics], content_type: str = JSON, batch: bool = False) -> bytes:
+    """Encode samples in the given format.
+    
+    JSON and msgpack carry a single sample object, or ``{"metrics": [...]}``
+    when ``batch`` is set; binary frames always carry a sample count.
+    """
+    content_type = normalize_content_type(content_type)
+    if content_type == BINARY:
+        return encode_binary_frame(samples)
+    
+    if batch:
+        payload: Any = {"metrics": [sample.model_dump(mode="json") for sample in samples]}
+    else:
+        if len(samples) != 1:
+            raise WireFormatError("Non-batch payloads carry exactly one sample")
+        payload = samples[0].model_dump(mode="json")
+    return encode_payload(payload, content_type)
+
+
+def encode_payload(payload: Any, content_type: str = JSON) -> bytes:
+    """Encode a JSON-compatible document as JSON or msgpack"""
+    content_type = normalize_content_type(content_type)
+    if content_type == JSON:
+        return json.dumps(payload, separators=(",", ":")).encode()
+    if content_type == MSGPACK:
+        if not MSGPACK_AVAILABLE:
+            raise WireFormatError("msgpack is not installed")
+        return msgpack.packb(payload, use_bin_type=True)
+    raise WireFormatError(f"Unsupported content type: {content_type}")
+
+
+def decode_payload(body: bytes, content_type: Optional[str]) -> Any:
+    """Decode a JSON or msgpack document"""
+    content_type = normalize_content_type(content_type)
+    try:
+        if content_type == JSON:
+            return json.loads(body)
+        if content_type == MSGPACK:
+            if not MSGPACK_AVAILABLE:
+                raise WireFormatError("msgpack is not installed")
+            return msgpack.unpackb(body, raw=False)
+    except WireFormatError:
+        raise
+    except Exception as e:
+        raise WireFormatError(f"Invalid {content_type} payload: {e}") from e
+    raise WireFormatError(f"Unsupported content type: {content_type}")
+
+
+def decode_metrics(body: bytes, content_type: Optional[str], max_samples: Optional[int] = None) -> List[AgentMetrics]:
+    """Decode and validate a metrics payload in any supported format.
+    
+    Accepts a single sample, a list of samples, or ``{"metrics": [...]}``.
+    Raises WireFormatError for malformed or invalid payloads, and
+    BatchTooLargeError (before validating any sample) for more than
+    ``max_samples`` samples.
+    """
+    content_type = normalize_content_type(content_type)
+    try:
+        if content_type == BINARY:
+            return decode_binary_frame(body, max_samples)
+        
+        payload = decode_payload(body, content_type)
+        if isinstance(payload, dict) and "metrics" in payload and "agent_id" not in payload:
+            payload = payload["metrics"]
+        if isinstance(payload, dict):
+            payload = [payload]
+        if not isinstance(payload, list):
+            raise WireFormatError("Expected a metrics object or list")
+        if max_samples is not None and len(payload) > max_samples:
+            raise BatchTooLargeError(len(payload), max_samples)
+        return [AgentMetrics.model_validate(item) for item in payload]
+    except WireFormatError:
+        raise
+    except Exception as e:
+        raise WireFormatError(f"Invalid {content_type} metrics payload: {e}") from e
+
+
+def encode_binary_frame(samples: List[AgentMetrics]) -> bytes:
+    """Encode samples as a compact frame of field IDs and packed values.
+    
+    Layout (little endian): ``b"AMF" version:u8 count:u32``, then per sample
+    ``id_len:u16 agent_id timestamp:f64 mask:u64 values extras_len:u32
+    extras``. Bit ``i`` of the mask marks field ID ``i`` of BINARY_FIELDS as
+    present; values follow in ID order as f64 or i64. Extras is JSON for
+    custom metrics, health checks, alerts and sketches (empty when there are none).
+    Samples with the same set of fields share one precompiled value layout.
+    """
+    parts = [_FRAME_HEADER.pack(_FRAME_MAGIC, len(samples))]
+    for sample in samples:
+        agent_id = sample.agent_id.encode()
+        timestamp = sample.timestamp
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        
+        mask = 0
+        values = []
+        for field_id, (group_name, field, _) in enumerate(BINARY_FIELDS):
+            group = getattr(sample, group_name)
+            value = getattr(group, field, None) if group is not None else None
+            if value is not None:
+                mask |= 1 << field_id
+                values.append(value)
+        
+        extras: Dict[str, Any] = {}
+        if sample.custom_metrics:
+            extras["c"] = sample.custom_metrics
+        if sample.health_checks:
+            extras["h"] = sample.health_checks
+        if sample.alerts:
+            extras["a"] = sample.alerts
+        if sample.sketches:
+            extras["s"] = sample.sketches
+        extras_bytes = json.dumps(extras, separators=(",", ":"), default=str).encode() if extras else b""
+        
+        parts.append(_U16.pack(len(agent_id)))
+        parts.append(agent_id)
+        parts.append(_SAMPLE_HEADER.pack(timestamp.timestamp(), mask))
+        parts.append(_layout(mask)[0].pack(*values))
+        parts.append(_U32.pack(len(extras_bytes)))
+        parts.append(extras_bytes)
+    return b"".join(parts)
+
+
+def decode_binary_frame(body: bytes, max_samples: Optional[int] = None) -> List[AgentMetrics]:
+    """Decode a frame produced by encode_binary_frame (at most ``max_samples`` samples)"""
+    view = memoryview(body)
+    try:
+        magic, count = _FRAME_HEADER.unpack_from(view, 0)
+    except struct.error as e:
+        raise WireFormatError("Truncated metrics frame") from e
+    if magic != _FRAME_MAGIC:
+        raise WireFormatError("Not a metrics frame (bad magic or version)")
+    if max_samples is not None and count > max_samples:
+        raise BatchTooLargeError(count, max_samples)
+    
+    offset = _FRAME_HEADER.size
+    samples = []
+    try:
+        for _ in range(count):
+            (id_len,) = _U16.unpack_from(view, offset)
+            offset += _U16.size
+            agent_id = bytes(view[offset:offset + id_len]).decode()
+            offset += id_len
+            
+            timestamp, mask = _SAMPLE_HEADER.unpack_from(view, offset)
+            offset += _SAMPLE_HEADER.size
+            
+            value_struct, group_layouts = _layout(mask)
+            values = value_struct.unpack_from(view, offset)
+            offset += value_struct.size
+            
+            groups: Dict[str, Dict[str, Any]] = {"resource_metrics": {}, "performance_metrics": {}}
+            for group_name, fields, start, end in group_layouts:
+                groups.setdefault(group_name, {}).update(zip(fields, values[start:end]))
+            
+            (extras_len,) = _U32.unpack_from(view, offset)
+            offset += _U32.size
+            extras = json.loads(bytes(view[offset:offset + extras_len])) if extras_len else {}
+            offset += extras_len
+            
+            samples.append(AgentMetrics.model_validate({
+                "agent_id": agent_id,
+                "timestamp": datetime.fromtimestamp(timestamp, timezone.utc),
+                **groups,
+                "custom_metrics": extras.get("c", {}),
+                "health_checks": extras.get("h", {}),
+                "alerts": extras.get("a", []),
+                "sketches": extras.get("s", {}),
+            }))
+    except WireFormatError:
+        raise
+    except (struct.error, IndexError) as e:
+        raise WireFormatError("Truncated metrics frame") from e
+    except Exception as e:
+        raise WireFormatError(f"Invalid metrics frame: {e}") from e
+    
+    if offset != len(body):
+        raise WireFormatError("Trailing bytes after metrics frame")
+    return samples
@@ -31,6 +31,15 @@ class DatabaseConfig(BaseModel):
     influxdb_bucket: str = Field(
         default_factory=lambda: os.getenv("INFLUXDB_BUCKET", "metrics")
     )
+    
+    # Embedded time-series store, used when InfluxDB is not available
+    local_tsdb_enabled: bool = Field(
+        default_factory=lambda: os.getenv("LOCAL_TSDB_ENABLED", "true").lower() == "true"
+    )
+    local_tsdb_path: str = Field(
+        default_factory=lambda: os.getenv("LOCAL_TSDB_PATH", "data/tsdb")
+    )
+    local_tsdb_partition_seconds: int = Field(default=3600)
 
 
 class RedisConfig(BaseModel):
@@ -55,6 +64,21 @@ class SecurityConfig(BaseModel):
     access_token_expire_minutes: int = Field(default=30)
 
 
+class RetentionTier(BaseModel):
+    """One storage tier for historical metrics: raw points or per-window means"""
+    name: str  # also the measurement suffix for rollup tiers ("1m" -> resource_metrics_1m)
+    resolution: int = Field(default=0, ge=0)  # seconds per rollup point; 0 for raw points
+    retention_hours: int = Field(..., gt=0)
+
+
+def default_retention_tiers() -> List[RetentionTier]:
+    return [
+        RetentionTier(name="raw", resolution=0, retention_hours=48),
+        RetentionTier(name="1m", resolution=60, retention_hours=30 * 24),
+        RetentionTier(name="1h", resolution=3600, retention_hours=365 * 24),
+    ]
+
+
 class MonitoringConfig(BaseModel):
     """Monitoring system configuration"""
     # Server settings
@@ -66,19 +90,57 @@ class MonitoringConfig(BaseModel):
     default_metrics_interval: int = Field(default=60)  # seconds
     default_health_check_interval: int = Field(default=30)  # seconds
     
+    # Adaptive intervals recommended to agents in metrics/heartbeat responses
+    adaptive_intervals: bool = Field(default=True)
+    min_metrics_interval: int = Field(default=10)  # seconds
+    max_metrics_interval: int = Field(default=300)  # seconds
+    min_heartbeat_interval: int = Field(default=10)  # seconds
+    max_heartbeat_interval: int = Field(default=60)  # seconds; keep below heartbeat_warning_timeout
+    
+    # Heartbeat timeouts applied by the health sweep
+    heartbeat_warning_timeout: int = Field(default=120)  # seconds; fresher heartbeats mark ONLINE
+    heartbeat_error_timeout: int = Field(default=300)  # seconds
+    heartbeat_offline_timeout: int = Field(default=600)  # seconds
+    heartbeat_flush_interval: float = Field(default=5.0)  # seconds between buffered heartbeat writes
+    
+    # Agent info cache (per API worker)
+    agent_cache_size: int = Field(default=10000)  # agents
+    agent_cache_ttl: float = Field(default=30.0)  # seconds
+    
+    # Query result cache for polled dashboard endpoints (per API worker, shared through Redis)
+    result_cache_enabled: bool = Field(default=True)
+    result_cache_size: int = Field(default=1024)  # results
+    result_cache_bucket: int = Field(default=15)  # seconds; live results are recomputed once per bucket
+    result_cache_settled_ttl: int = Field(default=3600)  # seconds results for past ranges are kept
+    
     # Thresholds
     default_cpu_threshold: float = Field(default=80.0)
     default_memory_threshold: float = Field(default=85.0)
     default_error_rate_threshold: float = Field(default=0.05)
     default_response_time_threshold: float = Field(default=5000.0)  # ms
+    alert_rules_refresh_interval: int = Field(default=60)  # seconds between alert rule reloads
+    
+    # Persistent write path (background batching writer)
+    metrics_write_batch_size: int = Field(default=5000)  # points per write
+    metrics_write_flush_interval: float = Field(default=1.0)  # seconds
+    metrics_write_queue_size: int = Field(default=50000)  # samples
+    metrics_write_max_retries: int = Field(default=3)  # retries per failed batch before it is dropped
+    metrics_write_retry_base_delay: float = Field(default=0.5)  # seconds, doubled per retry
+    metrics_write_retry_max_delay: float = Field(default=10.0)  # seconds
     
     # Data retention
-    metrics_retention_days: int = Field(default=30)
+    recent_metrics_capacity: int = Field(default=1000)  # in-memory samples per agent
+    retention_tiers: List[RetentionTier] = Field(default_factory=default_retention_tiers)  # finest first
+    compaction_interval: int = Field(default=300)  # seconds between compactor runs
+    compaction_lag: int = Field(default=120)  # seconds; windows closer to now wait for late points
     logs_retention_days: int = Field(default=7)
     
     # System limits
     max_agents: int = Field(default=1000)
     max_concurrent_connections: int = Field(default=100)
+    max_metrics_batch_size: int = Field(default=10000)
+    max_metrics_body_bytes: int = Field(default=64 * 1024 * 1024)  # after decompression
+    metrics_query_concurrency: int = Field(default=16)  # agents fetched from the time series store at once
 
 
 class LoggingConfig(BaseModel):
@@ -3,28 +3,181 @@ Agent Registry Service - Manages agent registration and discovery with PostgreSQ
 """
 
 import asyncio
+import base64
+import json
 import logging
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Any, AsyncIterator, Set, Tuple
 from uuid import uuid4
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+from sqlalchemy import (
+    select, update, delete, case, cast, func, values, column, bindparam, tuple_, String, DateTime
+)
 from sqlalchemy.exc import IntegrityError
 
 from ..models import AgentInfo, AgentStatus, AgentSummary, RegisterResponse, AgentType, DeploymentType
 from ..database.models import Agent as DBAgent, AgentTag, AgentConfiguration
 from ..database.connection import DatabaseManager
 from ..config import settings
+from ..utils.cache import TTLCache
+from .scheduler import scheduler, TimerWheel
 
 logger = logging.getLogger(__name__)
 
+# Redis pub/sub channel keeping agent caches coherent across API workers
+AGENT_INVALIDATION_CHANNEL = "agent_monitor:agent_invalidations"
+
+
+def encode_cursor(created_at: datetime, agent_id: str) -> str:
+    """Opaque keyset cursor for the (created_at, id) listing order"""
+    raw = json.dumps([created_at.isoformat(), agent_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decode a cursor from encode_cursor; raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, agent_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(agent_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def _filter_agents(query, environment: Optional[str], agent_type: Optional[str], status: Optional[AgentStatus]):
+    """Push listing filters into SQL (served by the idx_agent_* indexes)"""
+    if environment:
+        query = query.where(DBAgent.environment == environment)
+    if agent_type:
+        query = query.where(DBAgent.type == AgentType(getattr(agent_type, "value", agent_type)))
+    if status:
+        query = query.where(DBAgent.status == status)
+    return query
+
+
+def _page_agents(query, after: Optional[str], limit: Optional[int]):
+    """Order by (created_at, id) and continue after a cursor.
+    
+    The key never changes after registration, so agents updated during a
+    paged walk are neither repeated nor skipped.
+    """
+    if after:
+        created_at, agent_id = decode_cursor(after)
+        query = query.where(tuple_(DBAgent.created_at, DBAgent.id) > tuple_(created_at, agent_id))
+    query = query.order_by(DBAgent.created_at, DBAgent.id)
+    if limit:
+        query = query.limit(limit + 1)
+    return query
+
 
 class AgentRegistry:
     """Manages agent registration and discovery with database persistence"""
     
-    def __init__(self, db_manager: DatabaseManager):
+    HEALTH_SWEEP_JOB = "agent-health-sweep"
+    HEARTBEAT_FLUSH_JOB = "agent-heartbeat-flush"
+    
+    def __init__(self, db_manager: DatabaseManager, timer_wheel: Optional[TimerWheel] = None):
         self.db_manager = db_manager
-        self._background_tasks: Dict[str, asyncio.Task] = {}
+        self.scheduler = timer_wheel or scheduler
+        
+        # Write-behind heartbeat buffer: agent_id -> (last heartbeat, last metrics received)
+        self._pending_heartbeats: Dict[str, Tuple[datetime, Optional[datetime]]] = {}
+        self._known_agents: Set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        
+        # Read-through cache for get_agent
+        self._agent_cache = TTLCache(settings.monitoring.agent_cache_size, settings.monitoring.agent_cache_ttl)
+        self._instance_id = str(uuid4())
+        self._invalidation_task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Load known agent IDs and schedule the heartbeat flush and timeout sweep"""
+        try:
+            async with self.db_manager.get_session() as session:
+                result = await session.execute(select(DBAgent.id))
+                self._known_agents = set(result.scalars().all())
+        except Exception as e:
+            logger.error(f"Failed to load agent IDs: {e}")
+        
+        self.scheduler.schedule(
+            self.HEARTBEAT_FLUSH_JOB,
+            settings.monitoring.heartbeat_flush_interval,
+            self.flush_heartbeats
+        )
+        self.scheduler.schedule(
+            self.HEALTH_SWEEP_JOB,
+            settings.monitoring.default_health_check_interval,
+            self.check_agents_health
+        )
+        await self.scheduler.start()
+        
+        if self.db_manager.redis_client:
+            self._invalidation_task = asyncio.create_task(self._listen_for_invalidations())
+    
+    async def stop(self):
+        """Cancel scheduled jobs and write out buffered heartbeats"""
+        self.scheduler.cancel(self.HEALTH_SWEEP_JOB)
+        self.scheduler.cancel(self.HEARTBEAT_FLUSH_JOB)
+        if self._invalidation_task:
+            self._invalidation_task.cancel()
+            self._invalidation_task = None
+        await self.flush_heartbeats()
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get agent cache counters"""
+        return self._agent_cache.get_stats()
+    
+    async def invalidate_agents(self, agent_ids: Optional[List[str]] = None, deregistered: bool = False):
+        """Drop agents from the cache (all when agent_ids is None) here and on peer workers"""
+        self._evict(agent_ids, deregistered)
+        
+        redis_client = self.db_manager.redis_client
+        if redis_client:
+            try:
+                await redis_client.publish(AGENT_INVALIDATION_CHANNEL, json.dumps({
+                    "origin": self._instance_id,
+                    "agent_ids": agent_ids,
+                    "deregistered": deregistered
+                }))
+            except Exception as e:
+                logger.warning(f"Failed to publish agent cache invalidation: {e}")
+    
+    def _evict(self, agent_ids: Optional[List[str]], deregistered: bool = False):
+        if agent_ids is None:
+            self._agent_cache.clear()
+            return
+        for agent_id in agent_ids:
+            self._agent_cache.pop(agent_id)
+            if deregistered:
+                self._known_agents.discard(agent_id)
+                self._pending_heartbeats.pop(agent_id, None)
+    
+    async def _listen_for_invalidations(self):
+        """Apply cache invalidations published by other workers"""
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.db_manager.redis_client.pubsub()
+                await pubsub.subscribe(AGENT_INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    payload = json.loads(message["data"])
+                    if payload.get("origin") == self._instance_id:
+                        continue
+                    self._evict(payload.get("agent_ids"), payload.get("deregistered", False))
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                # Entries still expire by TTL while disconnected
+                logger.warning(f"Agent invalidation listener error: {e}")
+                await asyncio.sleep(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.close()
+                    except Exception:
+                        pass
     
     async def register_agent(self, agent_info: AgentInfo) -> RegisterResponse:
         """Register a new agent instance in database"""
@@ -34,6 +187,7 @@ class AgentRegistry:
                 agent_info.id = str(uuid4())
             
             # Convert AgentInfo to database model
+            now = datetime.now(timezone.utc)
             db_agent = DBAgent(
                 id=agent_info.id,
                 name=agent_info.name,
@@ -45,7 +199,11 @@ class AgentRegistry:
                 port=getattr(agent_info, 'port', None),
                 environment=agent_info.environment,
                 status=AgentStatus.ONLINE,
-                last_heartbeat=datetime.now(timezone.utc),
+                last_heartbeat=now,
+                # Set here rather than by the server default so the listing keyset
+                # compares like with like on every backend
+                created_at=now,
+                updated_at=now,
                 agent_metadata=agent_info.metadata or {}
             )
             
@@ -71,8 +229,8 @@ class AgentRegistry:
                 await session.commit()
                 await session.refresh(db_agent)
             
-            # Start monitoring task for this agent
-            await self._start_agent_monitoring(agent_info.id)
+            self._known_agents.add(agent_info.id)
+            await self.invalidate_agents([agent_info.id])
             
             logger.info(f"Agent registered in database: {agent_info.id} - {agent_info.name}")
             
@@ -86,7 +244,7 @@ class AgentRegistry:
                     "heartbeat": f"/api/v1/agents/{agent_info.id}/heartbeat"
                 }
             )
-            
+        
         except IntegrityError as e:
             logger.error(f"Agent registration failed - duplicate ID: {e}")
             return RegisterResponse(
@@ -115,18 +273,13 @@ class AgentRegistry:
                 
                 if result.rowcount > 0:
                     await session.commit()
-                    
-                    # Stop monitoring task
-                    if agent_id in self._background_tasks:
-                        self._background_tasks[agent_id].cancel()
-                        del self._background_tasks[agent_id]
-                    
+                    await self.invalidate_agents([agent_id], deregistered=True)
                     logger.info(f"Agent deregistered from database: {agent_id}")
                     return True
                 else:
                     logger.warning(f"Agent not found for deregistration: {agent_id}")
                     return False
-            
+        
         except Exception as e:
             logger.error(f"Failed to deregister agent {agent_id}: {e}")
             return False
@@ -158,7 +311,11 @@ class AgentRegistry:
             return []
     
     async def get_agent(self, agent_id: str) -> Optional[AgentInfo]:
-        """Get specific agent by ID from database"""
+        """Get specific agent by ID (cached, read-through to the database)"""
+        cached = self._agent_cache.get(agent_id)
+        if cached is not None:
+            return self._with_pending_heartbeat(cached)
+        
         try:
             async with self.db_manager.get_async_session() as session:
                 result = await session.execute(
@@ -167,15 +324,17 @@ class AgentRegistry:
                 db_agent = result.scalar_one_or_none()
                 
                 if db_agent:
-                    return self._convert_db_agent_to_agent_info(db_agent)
+                    agent_info = self._convert_db_agent_to_agent_info(db_agent, include_pending=False)
+                    self._agent_cache.set(agent_id, agent_info)
+                    return self._with_pending_heartbeat(agent_info)
                 return None
         except Exception as e:
             logger.error(f"Failed to get agent {agent_id}: {e}")
             return None
     
-    def _convert_db_agent_to_agent_info(self, db_agent: DBAgent) -> AgentInfo:
+    def _convert_db_agent_to_agent_info(self, db_agent: DBAgent, include_pending: bool = True) -> AgentInfo:
         """Convert database Agent model to AgentInfo"""
-        return AgentInfo(
+        agent_info = AgentInfo(
             id=db_agent.id,
             name=db_agent.name,
             type=db_agent.type.value,
@@ -190,6 +349,28 @@ class AgentRegistry:
             last_seen=db_agent.last_heartbeat or db_agent.updated_at,
             metadata=db_agent.agent_metadata or {}
         )
+        return self._with_pending_heartbeat(agent_info) if include_pending else agent_info
+    
+    def _with_pending_heartbeat(self, agent_info: AgentInfo) -> AgentInfo:
+        """Overlay a heartbeat that has not been flushed yet"""
+        pending = self._pending_heartbeats.get(agent_info.id)
+        if pending is None:
+            return agent_info
+        return self._apply_heartbeat(agent_info, pending[0])
+    
+    @staticmethod
+    def _apply_heartbeat(agent_info: AgentInfo, heartbeat: datetime) -> AgentInfo:
+        """Copy of agent_info as of a heartbeat (OFFLINE agents come back ONLINE)"""
+        last_seen = agent_info.last_seen
+        if last_seen is not None:
+            last_seen = AgentRegistry._as_utc(last_seen)
+        
+        changes = {}
+        if last_seen is None or heartbeat > last_seen:
+            changes["last_seen"] = heartbeat
+        if getattr(agent_info.status, "value", agent_info.status) == AgentStatus.OFFLINE.value:
+            changes["status"] = AgentStatus.ONLINE
+        return agent_info.model_copy(update=changes) if changes else agent_info
     
     async def get_agent_summary(self, agent_id: str) -> Optional[AgentSummary]:
         """Get agent summary for dashboard from database"""
@@ -210,6 +391,120 @@ class AgentRegistry:
             health_score=health_score
         )
     
+    async def list_agent_summaries(
+        self,
+        environment: Optional[str] = None,
+        agent_type: Optional[str] = None,
+        status: Optional[AgentStatus] = None,
+        limit: Optional[int] = None,
+        after: Optional[str] = None
+    ) -> Tuple[List[AgentSummary], Optional[str]]:
+        """Get summaries for a filtered set of agents with a single query.
+        
+        Results are ordered by (created_at, id) and paginated by keyset: pass
+        the returned cursor as ``after`` to get the next page. The cursor is
+        None on the last page. Raises ValueError for a malformed cursor.
+        """
+        query = select(
+            DBAgent.id, DBAgent.name, DBAgent.type, DBAgent.status,
+            DBAgent.environment, DBAgent.last_heartbeat, DBAgent.updated_at, DBAgent.created_at
+        )
+        query = _page_agents(_filter_agents(query, environment, agent_type, status), after, limit)
+        
+        try:
+            async with self.db_manager.get_session() as session:
+                result = await session.execute(query)
+                rows = result.all()
+        except Exception as e:
+            logger.error(f"Failed to list agent summaries: {e}")
+            return [], None
+        
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+        
+        summaries = []
+        for row in rows:
+            row_status = AgentStatus(getattr(row.status, "value", row.status))
+            last_seen = row.last_heartbeat or row.updated_at
+            pending = self._pending_heartbeats.get(row.id)
+            if pending is not None:
+                last_seen = max(self._as_utc(last_seen), pending[0]) if last_seen else pending[0]
+                if row_status == AgentStatus.OFFLINE:
+                    row_status = AgentStatus.ONLINE
+            
+            summaries.append(AgentSummary(
+                id=row.id,
+                name=row.name,
+                type=getattr(row.type, "value", row.type),
+                status=row_status,
+                last_seen=last_seen,
+                environment=row.environment,
+                health_score=self._health_score(row_status, last_seen)
+            ))
+        return summaries, next_cursor
+    
+    async def list_agents_page(
+        self,
+        environment: Optional[str] = None,
+        agent_type: Optional[str] = None,
+        status: Optional[AgentStatus] = None,
+        limit: int = 1000,
+        after: Optional[str] = None
+    ) -> Tuple[List[AgentInfo], Optional[str]]:
+        """Get one keyset page of full agent records and the cursor for the next page"""
+        query = _page_agents(_filter_agents(select(DBAgent), environment, agent_type, status), after, limit)
+        
+        async with self.db_manager.get_session() as session:
+            result = await session.execute(query)
+            db_agents = result.scalars().all()
+            
+            next_cursor = None
+            if len(db_agents) > limit:
+                db_agents = db_agents[:limit]
+                next_cursor = encode_cursor(db_agents[-1].created_at, db_agents[-1].id)
+            return [self._convert_db_agent_to_agent_info(db_agent) for db_agent in db_agents], next_cursor
+    
+    async def iter_agents(
+        self,
+        environment: Optional[str] = None,
+        agent_type: Optional[str] = None,
+        status: Optional[AgentStatus] = None,
+        batch_size: int = 1000
+    ) -> AsyncIterator[AgentInfo]:
+        """Stream all matching agents page by page, holding one page in memory"""
+        cursor = None
+        while True:
+            agents, cursor = await self.list_agents_page(environment, agent_type, status, batch_size, cursor)
+            for agent in agents:
+                yield agent
+            if cursor is None:
+                break
+    
+    async def get_fleet_counts(self) -> Dict[str, Dict[str, int]]:
+        """Agent counts by status, environment and type from one GROUP BY query"""
+        counts = {"status": {}, "environment": {}, "type": {}}
+        try:
+            async with self.db_manager.get_session() as session:
+                result = await session.execute(
+                    select(DBAgent.status, DBAgent.environment, DBAgent.type, func.count())
+                    .group_by(DBAgent.status, DBAgent.environment, DBAgent.type)
+                )
+                rows = result.all()
+        except Exception as e:
+            logger.error(f"Failed to count agents: {e}")
+            return counts
+        
+        for status, environment, agent_type, count in rows:
+            for dimension, key in (
+                ("status", getattr(status, "value", status)),
+                ("environment", environment),
+                ("type", getattr(agent_type, "value", agent_type))
+            ):
+                counts[dimension][key] = counts[dimension].get(key, 0) + count
+        return counts
+    
     async def update_agent_status(self, agent_id: str, status: AgentStatus):
         """Update agent health status in database"""
         try:
@@ -224,37 +519,152 @@ class AgentRegistry:
                     )
                 )
                 await session.commit()
-                logger.debug(f"Agent {agent_id} status updated to {status} in database")
+            await self.invalidate_agents([agent_id])
+            logger.debug(f"Agent {agent_id} status updated to {status} in database")
         except Exception as e:
             logger.error(f"Failed to update agent status for {agent_id}: {e}")
     
     async def record_heartbeat(self, agent_id: str) -> bool:
-        """Record heartbeat from agent in database"""
+        """Record heartbeat from agent (buffered, written by the next flush)"""
+        if agent_id not in self._known_agents:
+            # Registered by another instance, or unknown
+            if agent_id not in await self.get_existing_agent_ids([agent_id]):
+                return False
+            self._known_agents.add(agent_id)
+        
+        now = datetime.now(timezone.utc)
+        pending = self._pending_heartbeats.get(agent_id)
+        self._pending_heartbeats[agent_id] = (now, pending[1] if pending else None)
+        return True
+    
+    async def get_existing_agent_ids(self, agent_ids: List[str]) -> Set[str]:
+        """Resolve which of the given agent IDs exist, using a single query"""
+        if not agent_ids:
+            return set()
+        
         try:
             async with self.db_manager.get_session() as session:
-                # Check if agent exists and get current status
                 result = await session.execute(
-                    select(DBAgent.status).where(DBAgent.id == agent_id)
+                    select(DBAgent.id).where(DBAgent.id.in_(set(agent_ids)))
                 )
-                current_status = result.scalar_one_or_none()
+                return set(result.scalars().all())
+        except Exception as e:
+            logger.error(f"Failed to resolve agent IDs: {e}")
+            return set()
+    
+    async def get_agent_dimensions(self, agent_ids: List[str]) -> Dict[str, Tuple[str, str]]:
+        """Get (environment, type) for each existing agent ID, using a single query"""
+        if not agent_ids:
+            return {}
+        
+        try:
+            async with self.db_manager.get_session() as session:
+                result = await session.execute(
+                    select(DBAgent.id, DBAgent.environment, DBAgent.type)
+                    .where(DBAgent.id.in_(set(agent_ids)))
+                )
+                return {
+                    row.id: (row.environment, getattr(row.type, "value", row.type))
+                    for row in result.all()
+                }
+        except Exception as e:
+            logger.error(f"Failed to get agent dimensions: {e}")
+            return {}
+    
+    async def record_heartbeats(self, agent_ids: List[str]) -> int:
+        """Record heartbeats (with metrics received) for many known agents (buffered)"""
+        now = datetime.now(timezone.utc)
+        recorded = 0
+        for agent_id in set(agent_ids):
+            self._known_agents.add(agent_id)
+            self._pending_heartbeats[agent_id] = (now, now)
+            recorded += 1
+        return recorded
+    
+    async def flush_heartbeats(self) -> int:
+        """Write all buffered heartbeats with one bulk UPDATE.
+        
+        PostgreSQL gets a single ``UPDATE ... FROM (VALUES ...)``; other
+        dialects (SQLite) run the same parameterized UPDATE as an executemany.
+        Agents found OFFLINE come back ONLINE.
+        """
+        async with self._flush_lock:
+            if not self._pending_heartbeats:
+                return 0
+            pending, self._pending_heartbeats = self._pending_heartbeats, {}
+            
+            try:
+                engine = self.db_manager.async_postgres_engine
+                if engine is None:
+                    # In-memory demo database keeps no heartbeat columns
+                    return len(pending)
                 
-                if current_status is not None:
-                    # Update heartbeat
-                    await session.execute(
-                        update(DBAgent)
-                        .where(DBAgent.id == agent_id)
-                        .values(
-                            last_heartbeat=datetime.now(timezone.utc),
-                            updated_at=datetime.now(timezone.utc),
-                            status=AgentStatus.ONLINE if current_status == AgentStatus.OFFLINE else current_status
+                async with self.db_manager.get_session() as session:
+                    if engine.dialect.name == "postgresql":
+                        rows = values(
+                            column("id", String),
+                            column("heartbeat", DateTime(timezone=True)),
+                            column("metrics_received", DateTime(timezone=True)),
+                            name="pending"
+                        ).data([
+                            (agent_id, heartbeat, metrics_received)
+                            for agent_id, (heartbeat, metrics_received) in pending.items()
+                        ])
+                        await session.execute(
+                            update(DBAgent)
+                            .where(DBAgent.id == rows.c.id)
+                            .values(
+                                last_heartbeat=rows.c.heartbeat,
+                                last_metrics_received=func.coalesce(
+                                    cast(rows.c.metrics_received, DateTime(timezone=True)),
+                                    DBAgent.last_metrics_received
+                                ),
+                                # Heartbeats live in last_heartbeat; keep updated_at (and its onupdate) untouched
+                                updated_at=DBAgent.updated_at,
+                                status=case(
+                                    (DBAgent.status == AgentStatus.OFFLINE, AgentStatus.ONLINE),
+                                    else_=DBAgent.status
+                                )
+                            )
+                        )
+                    else:
+                        table = DBAgent.__table__
+                        await session.execute(
+                            update(table)
+                            .where(table.c.id == bindparam("agent_id"))
+                            .values(
+                                last_heartbeat=bindparam("heartbeat"),
+                                last_metrics_received=func.coalesce(
+                                    bindparam("metrics_received", type_=DateTime(timezone=True)),
+                                    table.c.last_metrics_received
+                                ),
+                                updated_at=table.c.updated_at,
+                                status=case(
+                                    (table.c.status == AgentStatus.OFFLINE, AgentStatus.ONLINE),
+                                    else_=table.c.status
+                                )
+                            ),
+                            [
+                                {"agent_id": agent_id, "heartbeat": heartbeat, "metrics_received": metrics_received}
+                                for agent_id, (heartbeat, metrics_received) in pending.items()
+                            ]
                         )
-                    )
                     await session.commit()
-                    return True
-                return False
-        except Exception as e:
-            logger.error(f"Failed to record heartbeat for {agent_id}: {e}")
-            return False
+                
+                # Keep cached agents current without evicting them
+                for agent_id, (heartbeat, _) in pending.items():
+                    self._agent_cache.replace(
+                        agent_id, lambda agent_info, heartbeat=heartbeat: self._apply_heartbeat(agent_info, heartbeat)
+                    )
+                
+                logger.debug(f"Flushed {len(pending)} buffered heartbeats")
+                return len(pending)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(pending)} heartbeats: {e}")
+                # Keep them for the next flush unless newer heartbeats arrived meanwhile
+                for agent_id, entry in pending.items():
+                    self._pending_heartbeats.setdefault(agent_id, entry)
+                return 0
     
     async def get_agents_by_environment(self, environment: str) -> List[AgentInfo]:
         """Get agents filtered by environment from database"""
@@ -282,27 +692,35 @@ class AgentRegistry:
             logger.error(f"Failed to get agents by type {agent_type}: {e}")
             return []
     
+    @staticmethod
+    def _as_utc(value: datetime) -> datetime:
+        return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+    
     def _calculate_health_score(self, agent: AgentInfo) -> float:
         """Calculate health score for an agent (0.0 - 1.0)"""
+        return self._health_score(agent.status, agent.last_seen)
+    
+    def _health_score(self, status: AgentStatus, last_seen: datetime) -> float:
+        """Health score from status and last seen time (0.0 - 1.0)"""
         # Simple health score calculation
         # This can be enhanced with more sophisticated metrics
         
-        if agent.status == AgentStatus.ONLINE:
+        if status == AgentStatus.ONLINE:
             base_score = 1.0
-        elif agent.status == AgentStatus.MAINTENANCE:
+        elif status == AgentStatus.MAINTENANCE:
             base_score = 0.7
-        elif agent.status == AgentStatus.ERROR:
+        elif status == AgentStatus.ERROR:
             base_score = 0.3
-        elif agent.status == AgentStatus.OFFLINE:
+        elif status == AgentStatus.OFFLINE:
             base_score = 0.0
-        elif agent.status == AgentStatus.UNKNOWN:
+        elif status == AgentStatus.UNKNOWN:
             base_score = 0.5
         else:
             base_score = 0.5
         
         # Adjust based on last seen time
         now_utc = datetime.now(timezone.utc)
-        time_since_last_seen = now_utc - agent.last_seen
+        time_since_last_seen = now_utc - self._as_utc(last_seen)
         if time_since_last_seen > timedelta(minutes=5):
             base_score *= 0.8
         elif time_since_last_seen > timedelta(minutes=2):
@@ -310,66 +728,54 @@ class AgentRegistry:
         
         return max(0.0, min(1.0, base_score))
     
-    async def _start_agent_monitoring(self, agent_id: str):
-        """Start background monitoring task for an agent"""
-        async def monitor_agent():
-            while True:
-                try:
-                    # Check if agent still exists in database
-                    agent = await self.get_agent(agent_id)
-                    if not agent:
-                        break
-                    
-                    await self._check_agent_health(agent_id)
-                    await asyncio.sleep(getattr(settings, 'monitoring', {}).get('default_health_check_interval', 30))
-                except asyncio.CancelledError:
-                    break
-                except Exception as e:
-                    logger.error(f"Error monitoring agent {agent_id}: {e}")
-                    await asyncio.sleep(30)  # Wait before retrying
+    async def check_agents_health(self) -> Dict[str, int]:
+        """Apply heartbeat timeouts to the whole fleet with one UPDATE per status tier.
         
-        task = asyncio.create_task(monitor_agent())
-        self._background_tasks[agent_id] = task
-    
-    async def _check_agent_health(self, agent_id: str):
-        """Check if agent is still responsive using database"""
+        Agents silent past the offline timeout become OFFLINE, those past the
+        error timeout become ERROR, and agents that heartbeated within the
+        warning timeout return to ONLINE. Agents in between keep their status.
+        """
+        # Buffered heartbeats must land first or fresh agents would look stale
+        await self.flush_heartbeats()
+        
+        monitoring = settings.monitoring
+        now = datetime.now(timezone.utc)
+        offline_cutoff = now - timedelta(seconds=monitoring.heartbeat_offline_timeout)
+        error_cutoff = now - timedelta(seconds=monitoring.heartbeat_error_timeout)
+        warning_cutoff = now - timedelta(seconds=monitoring.heartbeat_warning_timeout)
+        
+        tiers = [
+            (AgentStatus.OFFLINE, DBAgent.last_heartbeat < offline_cutoff,
+             DBAgent.status != AgentStatus.OFFLINE),
+            (AgentStatus.ERROR, DBAgent.last_heartbeat.between(offline_cutoff, error_cutoff),
+             DBAgent.status.notin_([AgentStatus.ERROR, AgentStatus.OFFLINE])),
+            (AgentStatus.ONLINE, DBAgent.last_heartbeat >= warning_cutoff,
+             DBAgent.status != AgentStatus.ONLINE),
+        ]
+        
+        changed: Dict[str, List[str]] = {}
         try:
             async with self.db_manager.get_session() as session:
-                result = await session.execute(
-                    select(DBAgent.last_heartbeat, DBAgent.status)
-                    .where(DBAgent.id == agent_id)
-                )
-                row = result.first()
-                
-                if not row or not row.last_heartbeat:
-                    return
-                
-                last_heartbeat, current_status = row
-                time_since_heartbeat = datetime.now(timezone.utc) - last_heartbeat
-                
-                # Define timeouts
-                warning_timeout = timedelta(minutes=2)
-                error_timeout = timedelta(minutes=5)
-                offline_timeout = timedelta(minutes=10)
-                
-                if time_since_heartbeat > offline_timeout:
-                    if current_status != AgentStatus.OFFLINE:
-                        await self.update_agent_status(agent_id, AgentStatus.OFFLINE)
-                        logger.warning(f"Agent {agent_id} marked as OFFLINE")
-                elif time_since_heartbeat > error_timeout:
-                    if current_status not in [AgentStatus.ERROR, AgentStatus.OFFLINE]:
-                        await self.update_agent_status(agent_id, AgentStatus.ERROR)
-                        logger.warning(f"Agent {agent_id} marked as ERROR")
-                elif time_since_heartbeat > warning_timeout:
-                    if current_status == AgentStatus.ONLINE:
-                        await self.update_agent_status(agent_id, AgentStatus.WARNING)
-                        logger.info(f"Agent {agent_id} marked as WARNING")
-                else:
-                    if current_status != AgentStatus.ONLINE:
-                        await self.update_agent_status(agent_id, AgentStatus.ONLINE)
-                        logger.info(f"Agent {agent_id} back ONLINE")
+                for status, heartbeat_condition, status_condition in tiers:
+                    result = await session.execute(
+                        update(DBAgent)
+                        .where(heartbeat_condition, status_condition)
+                        .values(status=status, updated_at=now)
+                        .returning(DBAgent.id)
+                    )
+                    agent_ids = list(result.scalars().all())
+                    if agent_ids:
+                        changed[status.value] = agent_ids
+                await session.commit()
         except Exception as e:
-            logger.error(f"Failed to check agent health for {agent_id}: {e}")
+            logger.error(f"Failed to check agent health: {e}")
+            return {}
+        
+        if changed:
+            await self.invalidate_agents([agent_id for agent_ids in changed.values() for agent_id in agent_ids])
+        for status, agent_ids in changed.items():
+            logger.info(f"Heartbeat sweep marked {len(agent_ids)} agents as {status}")
+        return {status: len(agent_ids) for status, agent_ids in changed.items()}
 
 
 # Global registry instance - will be initialized in main_v2.py with database manager
@@ -0,0 +1,259 @@
+"""
+Streaming Aggregate Engine - Incremental per-agent windowed statistics.
+"""
+
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Any, Iterable, Tuple
+
+from ..models import AgentMetrics
+from ..utils.quantiles import QuantileSketch
+
+# Tumbling window resolutions: name -> (window length in seconds, windows retained)
+WINDOW_RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    "1m": (60, 15),
+    "5m": (300, 12),
+    "1h": (3600, 24),
+}
+
+# Fields tracked per window, as (metrics group attribute, field name)
+WINDOW_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("resource_metrics", "cpu_usage_percent"),
+    ("resource_metrics", "memory_usage_percent"),
+    ("performance_metrics", "average_response_time_ms"),
+    ("performance_metrics", "throughput_per_second"),
+    ("performance_metrics", "error_rate"),
+    ("ai_metrics", "model_inference_time_ms"),
+    ("ai_metrics", "api_call_latency_ms"),
+    ("ai_metrics", "tokens_per_second"),
+)
+
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _epoch(dt: datetime) -> float:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _extract_values(metrics: AgentMetrics) -> Dict[str, float]:
+    """Pull the windowed fields out of a metrics sample"""
+    values = {}
+    for group_name, field in WINDOW_FIELDS:
+        group = getattr(metrics, group_name, None)
+        if group is None:
+            continue
+        value = getattr(group, field, None)
+        if value is not None:
+            values[field] = float(value)
+    return values
+
+
+def _extract_sketches(metrics: AgentMetrics) -> Dict[str, QuantileSketch]:
+    """Decode the sample's client-side sketches, skipping malformed ones"""
+    sketches = {}
+    for field, data in metrics.sketches.items():
+        try:
+            sketch = QuantileSketch.from_dict(data)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            continue
+        if sketch.count:
+            sketches[field] = sketch
+    return sketches
+
+
+def sketch_stats(sketch: QuantileSketch, quantiles: Iterable[float] = DEFAULT_QUANTILES) -> Dict[str, Any]:
+    """Render a sketch as count/sum/min/max/mean plus quantiles"""
+    stats = {
+        "count": sketch.count,
+        "sum": sketch.sum,
+        "min": sketch.min if sketch.count else None,
+        "max": sketch.max if sketch.count else None,
+        "mean": sketch.mean,
+    }
+    stats.update(sketch.quantiles(quantiles))
+    return stats
+
+
+class TumblingWindows:
+    """Fixed-size tumbling windows of per-field sketches at one resolution.
+    
+    Samples stamped more than one window past the wall clock (a skewed agent
+    clock) are rejected; accepting one would expire every retained window
+    and drop all correctly-timed samples until real time caught up.
+    """
+    
+    def __init__(self, seconds: int, retain: int, clock: Callable[[], float] = time.time):
+        self.seconds = seconds
+        self.retain = retain
+        self.windows: Dict[int, Dict[str, QuantileSketch]] = {}
+        self.latest_start: Optional[int] = None
+        self._clock = clock
+    
+    def _window_for(self, timestamp: float) -> Optional[Dict[str, QuantileSketch]]:
+        """The window containing ``timestamp``, or None if it is too old to retain or in the future"""
+        start = int(timestamp // self.seconds) * self.seconds
+        if start > self._clock() + self.seconds:
+            return None
+        
+        if self.latest_start is None or start > self.latest_start:
+            self.latest_start = start
+            oldest = start - (self.retain - 1) * self.seconds
+            for expired in [s for s in self.windows if s < oldest]:
+                del self.windows[expired]
+        elif start < self.latest_start - (self.retain - 1) * self.seconds:
+            # Too late for any retained window
+            return None
+        
+        window = self.windows.get(start)
+        if window is None:
+            window = self.windows[start] = {}
+        return window
+    
+    def add(self, timestamp: float, values: Dict[str, float], sketches: Optional[Dict[str, QuantileSketch]] = None):
+        window = self._window_for(timestamp)
+        if window is None:
+            return
+        
+        for field, value in values.items():
+            sketch = window.get(field)
+            if sketch is None:
+                sketch = window[field] = QuantileSketch()
+            sketch.add(value)
+        
+        # Client-side sketches already summarize many observations; merge them whole
+        for field, incoming in (sketches or {}).items():
+            sketch = window.get(field)
+            if sketch is None:
+                sketch = window[field] = QuantileSketch(incoming.accuracy)
+            sketch.merge(incoming)
+    
+    def merged(self, field: str, since: float) -> QuantileSketch:
+        """Merge this field's windows that overlap [since, now]"""
+        result = None
+        for start, window in self.windows.items():
+            if start + self.seconds > since and field in window:
+                if result is None:
+                    result = QuantileSketch(window[field].accuracy)
+                result.merge(window[field])
+        return result or QuantileSketch()
+    
+    def latest(self) -> Dict[str, QuantileSketch]:
+        if self.latest_start is None:
+            return {}
+        return self.windows.get(self.latest_start, {})
+
+
+class AgentAggregates:
+    """All incremental aggregates for one agent"""
+    
+    def __init__(self):
+        self.windows = {
+            name: TumblingWindows(seconds, retain)
+            for name, (seconds, retain) in WINDOW_RESOLUTIONS.items()
+        }
+        # Lifetime running values (kept for the existing summary contract)
+        self.lifetime = {
+            "count": 0,
+            "avg_cpu_usage": 0.0,
+            "avg_memory_usage": 0.0,
+            "avg_response_time": 0.0,
+            "total_tasks_completed": 0,
+            "total_tasks_failed": 0,
+            "last_updated": datetime.utcnow()
+        }
+    
+    def observe(self, metrics: AgentMetrics):
+        agg = self.lifetime
+        count = agg["count"]
+        agg["avg_cpu_usage"] += (metrics.resource_metrics.cpu_usage_percent - agg["avg_cpu_usage"]) / (count + 1)
+        agg["avg_memory_usage"] += (metrics.resource_metrics.memory_usage_percent - agg["avg_memory_usage"]) / (count + 1)
+        agg["avg_response_time"] += (
+            (metrics.performance_metrics.average_response_time_ms - agg["avg_response_time"]) / (count + 1)
+        )
+        agg["total_tasks_completed"] += metrics.performance_metrics.tasks_completed
+        agg["total_tasks_failed"] += metrics.performance_metrics.tasks_failed
+        agg["count"] = count + 1
+        agg["last_updated"] = datetime.utcnow()
+        
+        timestamp = _epoch(metrics.timestamp)
+        values = _extract_values(metrics)
+        sketches = _extract_sketches(metrics)
+        for windows in self.windows.values():
+            windows.add(timestamp, values, sketches)
+
+
+class AggregateEngine:
+    """Maintains count/sum/min/max/mean and quantile sketches per agent and field.
+    
+    Every ingested sample updates the agent's lifetime running values and the
+    current 1m/5m/1h tumbling windows. Reads merge at most the retained
+    windows of one resolution, so they never rescan raw samples.
+    """
+    
+    def __init__(self):
+        self._agents: Dict[str, AgentAggregates] = {}
+    
+    def observe(self, metrics: AgentMetrics):
+        """Fold one sample into the agent's aggregates"""
+        agent = self._agents.get(metrics.agent_id)
+        if agent is None:
+            agent = self._agents[metrics.agent_id] = AgentAggregates()
+        agent.observe(metrics)
+    
+    def remove_agent(self, agent_id: str):
+        self._agents.pop(agent_id, None)
+    
+    def agent_ids(self) -> List[str]:
+        return list(self._agents)
+    
+    def get_lifetime(self, agent_id: str) -> Dict[str, Any]:
+        agent = self._agents.get(agent_id)
+        return agent.lifetime if agent else {}
+    
+    def get_summary(self, agent_id: str, quantiles: Iterable[float] = DEFAULT_QUANTILES) -> Dict[str, Any]:
+        """Lifetime values plus the latest window of each resolution"""
+        agent = self._agents.get(agent_id)
+        if agent is None:
+            return {}
+        
+        summary = dict(agent.lifetime)
+        summary["windows"] = {
+            name: {
+                "start": datetime.fromtimestamp(windows.latest_start, timezone.utc) if windows.latest_start is not None else None,
+                "fields": {field: sketch_stats(sketch, quantiles) for field, sketch in windows.latest().items()}
+            }
+            for name, windows in agent.windows.items()
+        }
+        return summary
+    
+    def get_field_stats(
+        self,
+        agent_id: str,
+        field: str,
+        duration_seconds: int,
+        quantiles: Iterable[float] = DEFAULT_QUANTILES,
+        now: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Statistics for one field over the trailing duration, e.g. p95 over 15 minutes.
+        
+        Uses the finest resolution whose retained windows cover the duration.
+        """
+        agent = self._agents.get(agent_id)
+        if agent is None:
+            return None
+        
+        name = self.resolution_for(duration_seconds)
+        since = (now if now is not None else time.time()) - duration_seconds
+        stats = sketch_stats(agent.windows[name].merged(field, since), quantiles)
+        stats["resolution"] = name
+        return stats
+    
+    @staticmethod
+    def resolution_for(duration_seconds: int) -> str:
+        """Finest window resolution that retains at least the given duration"""
+        for name, (seconds, retain) in WINDOW_RESOLUTIONS.items():
+            if seconds * retain >= duration_seconds:
+                return name
+        return list(WINDOW_RESOLUTIONS)[-1]
@@ -0,0 +1,455 @@
+"""
+Alert Rule Engine - Evaluates alert rules against ingested metrics.
+"""
+
+import asyncio
+import logging
+import re
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Any, Callable, Tuple, Set
+from uuid import uuid4
+
+from sqlalchemy import select, update
+
+from ..models import AgentMetrics, ResourceMetrics, PerformanceMetrics, AIMetrics
+from ..config import settings
+from ..database.models import (
+    AlertRule, AlertInstance, AlertSeverity, AlertStatus
+)
+
+logger = logging.getLogger(__name__)
+
+# Which metrics group each known field lives in
+FIELD_GROUPS: Dict[str, str] = {
+    **{name: "resource_metrics" for name in ResourceMetrics.model_fields},
+    **{name: "performance_metrics" for name in PerformanceMetrics.model_fields},
+    **{name: "ai_metrics" for name in AIMetrics.model_fields},
+}
+
+# Short names accepted in rule conditions
+FIELD_ALIASES = {
+    "cpu_usage": "cpu_usage_percent",
+    "cpu": "cpu_usage_percent",
+    "memory_usage": "memory_usage_percent",
+    "memory": "memory_usage_percent",
+    "response_time": "average_response_time_ms",
+    "response_time_ms": "average_response_time_ms",
+    "throughput": "throughput_per_second",
+    "inference_time": "model_inference_time_ms",
+}
+
+OPERATORS = (">", ">=", "<", "<=", "==", "!=")
+
+_CONDITION_PATTERN = re.compile(r"^\s*([\w.]+)\s*(>=|<=|==|!=|>|<)\s*(-?[\d.]+)\s*$")
+
+
+@dataclass
+class CompiledRule:
+    """An alert rule reduced to a single threshold predicate plus scope"""
+    rule_id: str
+    name: str
+    metric: str
+    operator: str
+    threshold: float
+    severity: AlertSeverity = AlertSeverity.MEDIUM
+    for_duration: float = 0.0
+    agent_ids: Optional[Set[str]] = None
+    environments: Optional[Set[str]] = None
+    agent_types: Optional[Set[str]] = None
+    persist: bool = True  # built-in rules only log
+    
+    def in_scope(self, agent_id: str, dimensions: Optional[Tuple[str, str]]) -> bool:
+        if self.agent_ids is not None and agent_id not in self.agent_ids:
+            return False
+        if self.environments is not None or self.agent_types is not None:
+            if dimensions is None:
+                return False
+            if self.environments is not None and dimensions[0] not in self.environments:
+                return False
+            if self.agent_types is not None and dimensions[1] not in self.agent_types:
+                return False
+        return True
+
+
+@dataclass
+class _PredicateIndex:
+    """Rules sharing one metric and operator, sorted by threshold"""
+    thresholds: List[float] = field(default_factory=list)
+    rules: List[CompiledRule] = field(default_factory=list)
+    
+    def matching(self, operator: str, value: float) -> List[CompiledRule]:
+        """All rules whose predicate holds for value, found with one bisect"""
+        if operator == ">":
+            return self.rules[:bisect_left(self.thresholds, value)]
+        if operator == ">=":
+            return self.rules[:bisect_right(self.thresholds, value)]
+        if operator == "<":
+            return self.rules[bisect_right(self.thresholds, value):]
+        if operator == "<=":
+            return self.rules[bisect_left(self.thresholds, value):]
+        if operator == "==":
+            return self.rules[bisect_left(self.thresholds, value):bisect_right(self.thresholds, value)]
+        # "!=": everything except the equal range
+        lo, hi = bisect_left(self.thresholds, value), bisect_right(self.thresholds, value)
+        return self.rules[:lo] + self.rules[hi:]
+
+
+def _as_set(value: Any) -> Optional[Set[str]]:
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set)):
+        return {str(v) for v in value}
+    return {str(value)}
+
+
+def compile_rule(rule: AlertRule) -> Optional[CompiledRule]:
+    """Compile an AlertRule row into a threshold predicate.
+    
+    ``condition`` may be a string such as ``"cpu_usage > 85"`` or an object::
+        
+        {"metric": "cpu_usage_percent", "operator": ">", "threshold": 85,
+         "agent_ids": [...], "environment": "production", "agent_type": "LLM_AGENT"}
+    
+    A missing threshold falls back to the rule's ``threshold`` column. Metrics
+    that are not standard fields are looked up in ``custom_metrics``.
+    """
+    condition = rule.condition
+    if isinstance(condition, str):
+        match = _CONDITION_PATTERN.match(condition)
+        if not match:
+            logger.warning(f"Unsupported condition for alert rule {rule.id}: {condition!r}")
+            return None
+        condition = {"metric": match.group(1), "operator": match.group(2), "threshold": float(match.group(3))}
+    
+    if not isinstance(condition, dict):
+        logger.warning(f"Unsupported condition for alert rule {rule.id}: {condition!r}")
+        return None
+    
+    metric = condition.get("metric") or condition.get("field")
+    operator = condition.get("operator", ">")
+    threshold = condition.get("threshold", rule.threshold)
+    if not metric or operator not in OPERATORS or threshold is None:
+        logger.warning(f"Incomplete condition for alert rule {rule.id}: {condition!r}")
+        return None
+    
+    return CompiledRule(
+        rule_id=rule.id,
+        name=rule.name,
+        metric=FIELD_ALIASES.get(metric, metric),
+        operator=operator,
+        threshold=float(threshold),
+        severity=rule.severity or AlertSeverity.MEDIUM,
+        for_duration=float(rule.for_duration or 0),
+        agent_ids=_as_set(condition.get("agent_ids") or condition.get("targets")),
+        environments=_as_set(condition.get("environment") or condition.get("environments")),
+        agent_types=_as_set(condition.get("agent_type") or condition.get("agent_types")),
+    )
+
+
+def default_rules() -> List[CompiledRule]:
+    """Built-in rules from the monitoring settings (log only, no alert rows)"""
+    monitoring = settings.monitoring
+    return [
+        CompiledRule("default-cpu", "High CPU usage", "cpu_usage_percent", ">",
+                     monitoring.default_cpu_threshold, AlertSeverity.HIGH, persist=False),
+        CompiledRule("default-memory", "High memory usage", "memory_usage_percent", ">",
+                     monitoring.default_memory_threshold, AlertSeverity.HIGH, persist=False),
+        CompiledRule("default-error-rate", "High error rate", "error_rate", ">",
+                     monitoring.default_error_rate_threshold, AlertSeverity.HIGH, persist=False),
+        CompiledRule("default-response-time", "High response time", "average_response_time_ms", ">",
+                     monitoring.default_response_time_threshold, AlertSeverity.MEDIUM, persist=False),
+    ]
+
+
+@dataclass
+class AlertEvent:
+    """A state change produced by evaluation"""
+    rule: CompiledRule
+    agent_id: str
+    value: float
+    timestamp: datetime
+    firing: bool  # True when the alert starts firing, False when it resolves
+
+
+class AlertEngine:
+    """Evaluates all alert rules against each ingest batch.
+    
+    Rules are indexed by metric and operator with thresholds kept sorted, so
+    each sample value finds every matching rule with a single bisect instead
+    of testing rules one by one. ``for_duration`` is honored with per
+    (rule, agent) pending state: a rule fires once its condition has held
+    continuously for that long, and resolves on the first sample where it no
+    longer holds. Firing rules loaded from the database create
+    ``AlertInstance`` rows; resolving marks them resolved. Those writes go
+    through one queue in evaluation order, so a resolve never commits before
+    the row it resolves, and alerts still ACTIVE in the database are picked
+    up again on start.
+    """
+    
+    def __init__(self, dimensions_lookup: Optional[Callable[[str], Optional[Tuple[str, str]]]] = None):
+        self.dimensions_lookup = dimensions_lookup or (lambda agent_id: None)
+        self.db_manager = None
+        self._index: Dict[str, Dict[str, _PredicateIndex]] = {}
+        self._rule_count = 0
+        # (rule_id, agent_id) -> first timestamp the condition held
+        self._pending: Dict[Tuple[str, str], float] = {}
+        # (rule_id, agent_id) -> AlertInstance id (or None for log-only rules)
+        self._firing: Dict[Tuple[str, str], Optional[str]] = {}
+        self._active_by_agent: Dict[str, Set[str]] = {}
+        self._rules_by_id: Dict[str, CompiledRule] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._persist_queue: Optional[asyncio.Queue] = None
+        self._persist_task: Optional[asyncio.Task] = None
+        self.set_rules(default_rules())
+    
+    @property
+    def rule_count(self) -> int:
+        return self._rule_count
+    
+    def set_rules(self, rules: List[CompiledRule]):
+        """Replace the active rule set and rebuild the predicate index"""
+        index: Dict[str, Dict[str, _PredicateIndex]] = {}
+        for rule in sorted(rules, key=lambda r: r.threshold):
+            predicate = index.setdefault(rule.metric, {}).setdefault(rule.operator, _PredicateIndex())
+            predicate.thresholds.append(rule.threshold)
+            predicate.rules.append(rule)
+        
+        self._index = index
+        self._rules_by_id = {rule.rule_id: rule for rule in rules}
+        self._rule_count = len(rules)
+        
+        # Drop state for rules that no longer exist
+        for key in [k for k in self._pending if k[0] not in self._rules_by_id]:
+            del self._pending[key]
+        for key in [k for k in self._firing if k[0] not in self._rules_by_id]:
+            del self._firing[key]
+            self._active_by_agent.get(key[1], set()).discard(key[0])
+    
+    async def start(self, db_manager):
+        """Load rules and still-active alerts from the database and keep rules refreshed"""
+        self.db_manager = db_manager
+        await self.load_rules()
+        await self.load_active_alerts()
+        self._persist_queue = asyncio.Queue()
+        self._persist_task = asyncio.create_task(self._persist_loop())
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+    
+    async def stop(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._persist_task:
+            # Sentinel goes behind everything already queued, so pending writes finish first
+            self._persist_queue.put_nowait(None)
+            await asyncio.gather(self._persist_task, return_exceptions=True)
+            self._persist_task = None
+    
+    async def load_rules(self):
+        """Compile enabled AlertRule rows (plus built-in defaults)"""
+        if not self.db_manager:
+            return
+        try:
+            async with self.db_manager.get_session() as session:
+                result = await session.execute(select(AlertRule).where(AlertRule.is_enabled.is_(True)))
+                rows = result.scalars().all()
+            compiled = [rule for rule in (compile_rule(row) for row in rows) if rule]
+            self.set_rules(default_rules() + compiled)
+            logger.debug(f"Loaded {len(compiled)} alert rules")
+        except Exception as e:
+            logger.error(f"Failed to load alert rules: {e}")
+    
+    async def load_active_alerts(self):
+        """Resume firing state from ACTIVE AlertInstance rows, so they resolve (not re-fire) later"""
+        if not self.db_manager:
+            return
+        try:
+            async with self.db_manager.get_session() as session:
+                result = await session.execute(
+                    select(AlertInstance.id, AlertInstance.rule_id, AlertInstance.agent_id, AlertInstance.triggered_at)
+                    .where(AlertInstance.status == AlertStatus.ACTIVE)
+                )
+                rows = result.all()
+        except Exception as e:
+            logger.error(f"Failed to load active alerts: {e}")
+            return
+        
+        resumed = 0
+        for alert_id, rule_id, agent_id, triggered_at in rows:
+            if rule_id not in self._rules_by_id or agent_id is None:
+                continue
+            resumed += 1
+            key = (rule_id, agent_id)
+            if triggered_at.tzinfo is None:
+                triggered_at = triggered_at.replace(tzinfo=timezone.utc)
+            self._pending.setdefault(key, triggered_at.timestamp())
+            self._firing[key] = alert_id
+            self._active_by_agent.setdefault(agent_id, set()).add(rule_id)
+        logger.debug(f"Resumed {resumed} active alerts")
+    
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(settings.monitoring.alert_rules_refresh_interval)
+                await self.load_rules()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error refreshing alert rules: {e}")
+    
+    def remove_agent(self, agent_id: str):
+        """Forget pending and firing state for an agent"""
+        for rule_id in self._active_by_agent.pop(agent_id, set()):
+            self._pending.pop((rule_id, agent_id), None)
+            self._firing.pop((rule_id, agent_id), None)
+    
+    def firing_count(self, agent_id: str) -> int:
+        """Number of rules currently firing for an agent"""
+        return sum(1 for rule_id in self._active_by_agent.get(agent_id, ()) if (rule_id, agent_id) in self._firing)
+    
+    @staticmethod
+    def _value_of(metrics: AgentMetrics, metric: str) -> Optional[float]:
+        group_name = FIELD_GROUPS.get(metric)
+        if group_name is not None:
+            group = getattr(metrics, group_name)
+            value = getattr(group, metric, None) if group is not None else None
+        else:
+            value = metrics.custom_metrics.get(metric)
+        if value is None or isinstance(value, bool):
+            return None if value is None else float(value)
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    
+    def evaluate(self, metrics_batch: List[AgentMetrics]) -> List[AlertEvent]:
+        """Evaluate all rules against a batch; returns firing/resolved transitions"""
+        events: List[AlertEvent] = []
+        index = self._index
+        if not index:
+            return events
+        
+        for metrics in metrics_batch:
+            agent_id = metrics.agent_id
+            timestamp = metrics.timestamp
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            now = timestamp.timestamp()
+            dimensions = None
+            dimensions_loaded = False
+            
+            matched: Set[str] = set()
+            evaluated_metrics: Set[str] = set()
+            for metric, by_operator in index.items():
+                value = self._value_of(metrics, metric)
+                if value is None:
+                    continue
+                evaluated_metrics.add(metric)
+                
+                for operator, predicate in by_operator.items():
+                    for rule in predicate.matching(operator, value):
+                        if rule.agent_ids is not None or rule.environments is not None or rule.agent_types is not None:
+                            if not dimensions_loaded:
+                                dimensions = self.dimensions_lookup(agent_id)
+                                dimensions_loaded = True
+                            if not rule.in_scope(agent_id, dimensions):
+                                continue
+                        
+                        matched.add(rule.rule_id)
+                        key = (rule.rule_id, agent_id)
+                        since = self._pending.setdefault(key, now)
+                        self._active_by_agent.setdefault(agent_id, set()).add(rule.rule_id)
+                        if key not in self._firing and now - since >= rule.for_duration:
+                            self._firing[key] = None
+                            events.append(AlertEvent(rule, agent_id, value, timestamp, firing=True))
+            
+            # Pending/firing rules whose metric was present but no longer match
+            active = self._active_by_agent.get(agent_id)
+            if active:
+                for rule_id in list(active - matched):
+                    rule = self._rules_by_id.get(rule_id)
+                    if rule is None or rule.metric not in evaluated_metrics:
+                        continue
+                    key = (rule_id, agent_id)
+                    self._pending.pop(key, None)
+                    active.discard(rule_id)
+                    if key in self._firing:
+                        events.append(AlertEvent(rule, agent_id, self._value_of(metrics, rule.metric),
+                                                 timestamp, firing=False))
+        
+        if events:
+            self._dispatch(events)
+        return events
+    
+    def _dispatch(self, events: List[AlertEvent]):
+        """Log transitions and persist alert instances without blocking ingest"""
+        for event in events:
+            rule = event.rule
+            if event.firing:
+                logger.warning(
+                    f"Alert '{rule.name}' firing for agent {event.agent_id}: "
+                    f"{rule.metric}={event.value:.2f} {rule.operator} {rule.threshold}"
+                )
+            else:
+                logger.info(f"Alert '{rule.name}' resolved for agent {event.agent_id}")
+        
+        persistent = [event for event in events if event.rule.persist]
+        if persistent and self._persist_task:
+            self._persist_queue.put_nowait(persistent)
+        for event in events:
+            if not event.firing:
+                self._firing.pop((event.rule.rule_id, event.agent_id), None)
+    
+    async def _persist_loop(self):
+        """Write queued events one batch at a time, in the order they were evaluated"""
+        while True:
+            events = await self._persist_queue.get()
+            if events is None:
+                return
+            await self._persist(events)
+    
+    async def _persist(self, events: List[AlertEvent]):
+        """Create AlertInstance rows for firing events and resolve cleared ones"""
+        try:
+            async with self.db_manager.get_session() as session:
+                resolved_ids = []
+                for event in events:
+                    key = (event.rule.rule_id, event.agent_id)
+                    if event.firing:
+                        alert_id = str(uuid4())
+                        rule = event.rule
+                        session.add(AlertInstance(
+                            id=alert_id,
+                            rule_id=rule.rule_id,
+                            agent_id=event.agent_id,
+                            status=AlertStatus.ACTIVE,
+                            severity=rule.severity,
+                            message=f"{rule.name}: {rule.metric} {rule.operator} {rule.threshold} "
+                                    f"(current {event.value:.2f})",
+                            details={
+                                "metric": rule.metric,
+                                "operator": rule.operator,
+                                "threshold": rule.threshold,
+                                "value": event.value
+                            },
+                            triggered_at=event.timestamp
+                        ))
+                        if key in self._firing:
+                            self._firing[key] = alert_id
+                    else:
+                        resolved_ids.append((event.rule.rule_id, event.agent_id))
+                
+                for rule_id, agent_id in resolved_ids:
+                    await session.execute(
+                        update(AlertInstance)
+                        .where(
+                            AlertInstance.rule_id == rule_id,
+                            AlertInstance.agent_id == agent_id,
+                            AlertInstance.status == AlertStatus.ACTIVE
+                        )
+                        .values(status=AlertStatus.RESOLVED, resolved_at=datetime.now(timezone.utc))
+                    )
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Failed to persist {len(events)} alert events: {e}")
@@ -0,0 +1,147 @@
+"""
+Fleet Rollups - Incrementally maintained system-wide metrics summaries.
+"""
+
+from typing import Dict, Any, Optional, Tuple
+
+UNKNOWN_DIMENSION = "unknown"
+
+# Per-agent contribution: points, avg cpu, avg memory, avg response time, tasks completed, tasks failed
+_Contribution = Tuple[int, float, float, float, int, int]
+_ZERO: _Contribution = (0, 0.0, 0.0, 0.0, 0, 0)
+
+
+class Rollup:
+    """Running sums over a set of agents"""
+    
+    __slots__ = ("agents", "points", "cpu_sum", "memory_sum", "response_time_sum",
+                 "tasks_completed", "tasks_failed")
+    
+    def __init__(self):
+        self.agents = 0
+        self.points = 0
+        self.cpu_sum = 0.0
+        self.memory_sum = 0.0
+        self.response_time_sum = 0.0
+        self.tasks_completed = 0
+        self.tasks_failed = 0
+    
+    def apply(self, old: _Contribution, new: _Contribution):
+        """Replace one agent's old contribution with its new one"""
+        self.points += new[0] - old[0]
+        self.cpu_sum += new[1] - old[1]
+        self.memory_sum += new[2] - old[2]
+        self.response_time_sum += new[3] - old[3]
+        self.tasks_completed += new[4] - old[4]
+        self.tasks_failed += new[5] - old[5]
+    
+    def snapshot(self) -> Dict[str, Any]:
+        agents = self.agents
+        return {
+            "total_agents": agents,
+            "total_metrics_points": self.points,
+            "average_cpu_usage": self.cpu_sum / agents if agents else 0.0,
+            "average_memory_usage": self.memory_sum / agents if agents else 0.0,
+            "total_tasks_completed": self.tasks_completed,
+            "total_tasks_failed": self.tasks_failed,
+            "average_response_time": self.response_time_sum / agents if agents else 0.0,
+            "system_error_rate": self.tasks_failed / max(1, self.tasks_completed + self.tasks_failed)
+        }
+
+
+class FleetRollups:
+    """Global, per-environment and per-agent-type rollups updated on ingest.
+    
+    Each agent's latest contribution (its lifetime averages and totals) is
+    remembered, and every update applies only the difference to the rollups
+    the agent belongs to. Reading a summary therefore costs O(number of
+    environments + agent types), independent of fleet size.
+    """
+    
+    def __init__(self):
+        self._global = Rollup()
+        self._by_environment: Dict[str, Rollup] = {}
+        self._by_agent_type: Dict[str, Rollup] = {}
+        self._contributions: Dict[str, _Contribution] = {}
+        self._dimensions: Dict[str, Tuple[str, str]] = {}
+    
+    def _rollups_for(self, agent_id: str):
+        environment, agent_type = self._dimensions.get(agent_id, (UNKNOWN_DIMENSION, UNKNOWN_DIMENSION))
+        by_env = self._by_environment.get(environment)
+        if by_env is None:
+            by_env = self._by_environment[environment] = Rollup()
+        by_type = self._by_agent_type.get(agent_type)
+        if by_type is None:
+            by_type = self._by_agent_type[agent_type] = Rollup()
+        return self._global, by_env, by_type
+    
+    def _detach(self, agent_id: str):
+        contribution = self._contributions.get(agent_id)
+        if contribution is None:
+            return
+        for rollup in self._rollups_for(agent_id):
+            rollup.apply(contribution, _ZERO)
+            rollup.agents -= 1
+    
+    def _attach(self, agent_id: str):
+        contribution = self._contributions.get(agent_id)
+        if contribution is None:
+            return
+        for rollup in self._rollups_for(agent_id):
+            rollup.apply(_ZERO, contribution)
+            rollup.agents += 1
+    
+    def set_dimensions(self, agent_id: str, environment: Optional[str], agent_type: Optional[Any]):
+        """Record which environment and agent type an agent rolls up into"""
+        agent_type = getattr(agent_type, "value", agent_type)
+        dimensions = (environment or UNKNOWN_DIMENSION, agent_type or UNKNOWN_DIMENSION)
+        if self._dimensions.get(agent_id) == dimensions:
+            return
+        
+        self._detach(agent_id)
+        self._dimensions[agent_id] = dimensions
+        self._attach(agent_id)
+    
+    def has_dimensions(self, agent_id: str) -> bool:
+        return agent_id in self._dimensions
+    
+    def get_dimensions(self, agent_id: str) -> Optional[Tuple[str, str]]:
+        """(environment, agent type) for an agent, if known"""
+        return self._dimensions.get(agent_id)
+    
+    def update(self, agent_id: str, lifetime: Dict[str, Any], points: int):
+        """Apply an agent's latest lifetime aggregates and retained point count"""
+        new = (
+            points,
+            lifetime.get("avg_cpu_usage", 0.0),
+            lifetime.get("avg_memory_usage", 0.0),
+            lifetime.get("avg_response_time", 0.0),
+            lifetime.get("total_tasks_completed", 0),
+            lifetime.get("total_tasks_failed", 0),
+        )
+        old = self._contributions.get(agent_id)
+        self._contributions[agent_id] = new
+        
+        for rollup in self._rollups_for(agent_id):
+            if old is None:
+                rollup.apply(_ZERO, new)
+                rollup.agents += 1
+            else:
+                rollup.apply(old, new)
+    
+    def remove_agent(self, agent_id: str):
+        """Drop an agent's contribution from all rollups"""
+        self._detach(agent_id)
+        self._contributions.pop(agent_id, None)
+        self._dimensions.pop(agent_id, None)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Global summary plus per-environment and per-agent-type breakdowns"""
+        summary = self._global.snapshot()
+        summary["by_environment"] = {
+            name: rollup.snapshot() for name, rollup in self._by_environment.items() if rollup.agents
+        }
+        summary["by_agent_type"] = {
+            name: rollup.snapshot() for name, rollup in self._by_agent_type.items() if rollup.agents
+        }
+        return summary
@@ -0,0 +1,123 @@
+"""
+Interval Advisor - Recommends how often each agent should report.
+"""
+
+import math
+from typing import Any, Dict, Optional
+
+from ..communication.agent_channel import agent_channels
+from ..config import settings
+from ..storage.ring_buffer import MetricsRingBuffer
+
+# Fields whose movement drives faster reporting, with the smallest reference
+# value a change is measured against (so 0 -> 0.001 is not a 100x jump)
+CHANGE_FIELDS = {
+    "cpu_usage_percent": 10.0,
+    "memory_usage_percent": 10.0,
+    "error_rate": 0.01,
+    "average_response_time_ms": 50.0,
+}
+
+# Relative change at which the agent keeps its base interval
+STEADY_CHANGE = 0.05
+
+
+class IntervalAdvisor:
+    """Scales an agent's base reporting intervals by three signals.
+    
+    - Ingestion load: once the writer queue is over half full, every agent
+      is slowed down, up to ``max_load_factor`` times at a full queue.
+    - Health: agents in ERROR or with firing alerts report faster.
+    - Rate of change: the latest sample is compared with the mean of the
+      few before it; fast-moving agents report faster and flat ones slower.
+    
+    Heartbeats only follow load and health. Results are clamped to the
+    configured min/max intervals, widened to include the base interval.
+    """
+    
+    def __init__(self, lookback: int = 5, max_load_factor: float = 4.0):
+        self.lookback = lookback
+        self.max_load_factor = max_load_factor
+    
+    def load_factor(self, pressure: float) -> float:
+        if pressure <= 0.5:
+            return 1.0
+        return 1.0 + (self.max_load_factor - 1.0) * min(1.0, (pressure - 0.5) / 0.5)
+    
+    @staticmethod
+    def health_factor(degraded: bool, firing_alerts: int) -> float:
+        if degraded:
+            return 0.25
+        if firing_alerts:
+            return 0.5
+        return 1.0
+    
+    def rate_of_change(self, buffer: Optional[MetricsRingBuffer]) -> Optional[float]:
+        """Largest relative change of the tracked fields, or None without enough history"""
+        if buffer is None or len(buffer) < 2:
+            return None
+        
+        window = self.lookback + 1
+        change = 0.0
+        for name, floor in CHANGE_FIELDS.items():
+            values = [v for v in buffer.column(name, window) if not math.isnan(v)]
+            if len(values) < 2:
+                continue
+            reference = sum(values[:-1]) / (len(values) - 1)
+            change = max(change, abs(values[-1] - reference) / max(abs(reference), floor))
+        return change
+    
+    def change_factor(self, change: Optional[float]) -> float:
+        if change is None:
+            return 1.0
+        if change <= 0:
+            return 2.0
+        return min(2.0, max(0.25, STEADY_CHANGE / change))
+    
+    @staticmethod
+    def _base_interval(base: Dict[str, Any], name: str) -> float:
+        """``base[name]`` as seconds, or the default when it isn't a positive number"""
+        value = base.get(name)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and 0 < value < math.inf:
+            return float(value)
+        return float(agent_channels.default_config()[name])
+    
+    @staticmethod
+    def _clamp(value: float, base: float, low: float, high: float) -> float:
+        # Bounds never override an operator-set base interval
+        return float(min(max(high, base), max(min(low, base), value)))
+    
+    def recommend(
+        self,
+        base: Dict[str, Any],
+        pressure: float,
+        degraded: bool = False,
+        firing_alerts: int = 0,
+        buffer: Optional[MetricsRingBuffer] = None
+    ) -> Dict[str, float]:
+        """Recommended ``metrics_interval`` and ``heartbeat_interval`` in seconds.
+        
+        Base intervals that aren't positive numbers fall back to the defaults.
+        """
+        config = settings.monitoring
+        base_metrics = metrics_interval = self._base_interval(base, "metrics_interval")
+        base_heartbeat = heartbeat_interval = self._base_interval(base, "heartbeat_interval")
+        
+        if config.adaptive_intervals:
+            load = self.load_factor(pressure)
+            health = self.health_factor(degraded, firing_alerts)
+            metrics_interval *= load * health * self.change_factor(self.rate_of_change(buffer))
+            heartbeat_interval *= load * health
+            metrics_interval = self._clamp(
+                metrics_interval, base_metrics,
+                config.min_metrics_interval, config.max_metrics_interval
+            )
+            heartbeat_interval = self._clamp(
+                heartbeat_interval, base_heartbeat,
+                config.min_heartbeat_interval, config.max_heartbeat_interval
+            )
+        
+        return {
+            "metrics_interval": round(metrics_interval, 1),
+            "heartbeat_interval": round(heartbeat_interval, 1),
+        }
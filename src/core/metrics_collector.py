@@ -2,14 +2,24 @@
 Metrics Collection Engine - Collects and processes agent metrics.
 """
 
-import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
-from collections import defaultdict, deque
+from typing import AsyncIterator, Dict, List, Optional, Any
 
-from ..models import AgentMetrics, AgentInfo
+from ..models import AgentMetrics, AgentInfo, MetricsQuery, MetricsSeries
 from ..config import settings
+from ..storage.ring_buffer import MetricsRingBuffer, _to_epoch
+from ..database.influx_client import influx_client
+from ..database.local_tsdb import local_tsdb
+from ..communication.delta import DeltaDecoder
+from .metrics_writer import MetricsWriter
+from .aggregate_engine import AggregateEngine, DEFAULT_QUANTILES
+from .fleet_rollups import FleetRollups
+from .alert_engine import AlertEngine
+from .interval_advisor import IntervalAdvisor
+from .query_engine import MetricsQueryEngine
+from .retention import RetentionCompactor
+from .scheduler import scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -18,10 +28,81 @@ class MetricsCollector:
     """Collects and processes agent metrics"""
     
     def __init__(self):
-        # In-memory storage for recent metrics (for real-time dashboard)
-        self._recent_metrics: Dict[str, deque] = defaultdict(lambda: deque(maxlen=100))
-        self._metric_aggregates: Dict[str, Dict[str, Any]] = defaultdict(dict)
-        self._collection_tasks: Dict[str, asyncio.Task] = {}
+        # In-memory columnar storage for recent metrics (for real-time dashboard)
+        self._recent_metrics: Dict[str, MetricsRingBuffer] = {}
+        self._aggregates = AggregateEngine()
+        self._rollups = FleetRollups()
+        self._alerts = AlertEngine(dimensions_lookup=self._rollups.get_dimensions)
+        # Last reconstructed state per agent for delta-encoded reports
+        self.delta_decoder = DeltaDecoder()
+        self.interval_advisor = IntervalAdvisor()
+        # Agents with scheduled pull collection (timers live on the shared scheduler)
+        self._collection_agents: Dict[str, AgentInfo] = {}
+        self.scheduler = scheduler
+        
+        # Time series backend (InfluxDB or the embedded store), chosen in start()
+        self.timeseries_store = None
+        self.query_engine = MetricsQueryEngine(self._recent_metrics.get, lambda: self.timeseries_store)
+        # Downsampled retention tiers, maintained on the shared scheduler
+        self.compactor = RetentionCompactor(lambda: self.timeseries_store)
+        
+        # Background writer so ingestion never waits on the time series database
+        self._writer = MetricsWriter(
+            sink=influx_client.write_line_protocol,
+            encoder=influx_client.metrics_to_line_protocol,
+            batch_size=settings.monitoring.metrics_write_batch_size,
+            flush_interval=settings.monitoring.metrics_write_flush_interval,
+            queue_size=settings.monitoring.metrics_write_queue_size,
+            max_retries=settings.monitoring.metrics_write_max_retries,
+            retry_base_delay=settings.monitoring.metrics_write_retry_base_delay,
+            retry_max_delay=settings.monitoring.metrics_write_retry_max_delay,
+            name="influxdb"
+        )
+    
+    async def start(self, db_manager=None):
+        """Start background processing (alert rules, persistent storage writer)"""
+        if db_manager:
+            await self._alerts.start(db_manager)
+        
+        if influx_client.is_available:
+            self.timeseries_store = influx_client
+        elif settings.database.local_tsdb_enabled:
+            # No InfluxDB deployed - keep history in the embedded store instead
+            await local_tsdb.initialize()
+            self.timeseries_store = local_tsdb
+            self._writer.sink = local_tsdb.write_records
+            self._writer.encoder = local_tsdb.metrics_to_records
+            self._writer.name = "local_tsdb"
+        else:
+            logger.warning("InfluxDB not available - metrics will not be persisted")
+            return
+        
+        await self._writer.start()
+        self.scheduler.schedule("compaction", settings.monitoring.compaction_interval, self.compactor.run_once)
+    
+    async def shutdown(self):
+        """Stop collection timers and flush pending metrics to persistent storage"""
+        for agent_id in list(self._collection_agents):
+            await self.stop_collection_for_agent(agent_id)
+        self.scheduler.cancel("compaction")
+        await self._writer.stop()
+        await self._alerts.stop()
+        if self.timeseries_store is local_tsdb:
+            await local_tsdb.close()
+    
+    def get_writer_stats(self) -> Dict[str, Any]:
+        """Get persistent storage writer counters"""
+        return self._writer.get_stats()
+    
+    def recommend_intervals(self, agent_id: str, base: Dict[str, Any], degraded: bool = False) -> Dict[str, float]:
+        """Next reporting intervals for an agent given ingestion load, alerts and recent samples"""
+        return self.interval_advisor.recommend(
+            base,
+            self._writer.pressure,
+            degraded=degraded,
+            firing_alerts=self._alerts.firing_count(agent_id),
+            buffer=self._recent_metrics.get(agent_id)
+        )
     
     async def collect_metrics_from_agent(self, agent_id: str, agent_info: AgentInfo) -> Optional[AgentMetrics]:
         """Pull metrics from a specific agent"""
@@ -39,7 +120,7 @@ class MetricsCollector:
             #     return AgentMetrics.parse_obj(metrics_data)
             
             return None
-            
+        
         except Exception as e:
             logger.error(f"Failed to collect metrics from agent {agent_id}: {e}")
             return None
@@ -48,7 +129,7 @@ class MetricsCollector:
         """Receive pushed metrics from agent"""
         try:
             # Store in recent metrics for real-time access
-            self._recent_metrics[metrics.agent_id].append(metrics)
+            self._get_buffer(metrics.agent_id).append(metrics)
             
             # Update aggregates
             await self._update_aggregates(metrics)
@@ -57,181 +138,164 @@ class MetricsCollector:
             await self._store_metrics_persistent(metrics)
             
             # Check for threshold violations
-            await self._check_thresholds(metrics)
+            await self._check_thresholds([metrics])
             
             logger.debug(f"Received metrics from agent {metrics.agent_id}")
-            
+        
         except Exception as e:
             logger.error(f"Failed to process metrics from {metrics.agent_id}: {e}")
     
+    async def receive_metrics_batch(self, metrics_batch: List[AgentMetrics]) -> int:
+        """Receive a batch of pushed metrics, possibly spanning many agents"""
+        # Keep samples in timestamp order per agent so recent windows stay sorted
+        # (epoch seconds, since one batch may mix naive and offset timestamps)
+        ordered = sorted(metrics_batch, key=lambda m: (m.agent_id, _to_epoch(m.timestamp)))
+        
+        processed = 0
+        for metrics in ordered:
+            try:
+                self._get_buffer(metrics.agent_id).append(metrics)
+                await self._update_aggregates(metrics)
+                await self._store_metrics_persistent(metrics)
+                processed += 1
+            except Exception as e:
+                logger.error(f"Failed to process batched metrics from {metrics.agent_id}: {e}")
+        
+        # Evaluate alert rules once over the whole batch
+        await self._check_thresholds(ordered)
+        
+        logger.debug(f"Received metrics batch: {processed}/{len(metrics_batch)} samples processed")
+        return processed
+    
+    def _get_buffer(self, agent_id: str) -> MetricsRingBuffer:
+        """Get or create the recent-metrics ring buffer for an agent"""
+        buffer = self._recent_metrics.get(agent_id)
+        if buffer is None:
+            buffer = MetricsRingBuffer(agent_id, settings.monitoring.recent_metrics_capacity)
+            self._recent_metrics[agent_id] = buffer
+        return buffer
+    
     async def get_recent_metrics(self, agent_id: str, limit: int = 10) -> List[AgentMetrics]:
         """Get recent metrics for an agent"""
         if agent_id not in self._recent_metrics:
             return []
         
-        recent = list(self._recent_metrics[agent_id])
-        return recent[-limit:] if len(recent) > limit else recent
+        return self._recent_metrics[agent_id].materialize(limit)
     
-    async def get_metrics_summary(self, agent_id: str) -> Dict[str, Any]:
-        """Get summarized metrics for an agent"""
-        if agent_id not in self._metric_aggregates:
+    async def get_recent_columns(
+        self,
+        agent_id: str,
+        fields: Optional[List[str]] = None,
+        limit: Optional[int] = None
+    ) -> Dict[str, memoryview]:
+        """Get zero-copy column views of recent metrics, including a 'timestamp' column"""
+        if agent_id not in self._recent_metrics:
             return {}
         
-        return self._metric_aggregates[agent_id]
+        buffer = self._recent_metrics[agent_id]
+        columns = {"timestamp": buffer.timestamps(limit)}
+        columns.update(buffer.columns(fields, limit))
+        return columns
+    
+    async def query_metrics(self, query: MetricsQuery, agent_ids: List[str]) -> List[MetricsSeries]:
+        """Answer a historical query from memory or the time series store (columnar, per agent)"""
+        return await self.query_engine.execute(self.query_engine.plan(query, agent_ids))
+    
+    def stream_metrics(
+        self,
+        query: MetricsQuery,
+        agent_ids: Optional[List[str]] = None,
+        chunk_size: int = 5000
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Stream a historical query's store rows in chunks (for exports)"""
+        return self.query_engine.stream(query, agent_ids, chunk_size)
+    
+    async def get_metrics_summary(self, agent_id: str) -> Dict[str, Any]:
+        """Get summarized metrics for an agent"""
+        return self._aggregates.get_summary(agent_id)
+    
+    async def get_field_window_stats(
+        self,
+        agent_id: str,
+        field: str,
+        duration_seconds: int,
+        quantiles: List[float] = DEFAULT_QUANTILES
+    ) -> Optional[Dict[str, Any]]:
+        """Get windowed statistics (count/sum/min/max/mean/quantiles) for one field"""
+        return self._aggregates.get_field_stats(agent_id, field, duration_seconds, quantiles)
     
     async def get_system_metrics_summary(self) -> Dict[str, Any]:
         """Get system-wide metrics summary"""
-        total_agents = len(self._recent_metrics)
-        total_metrics_points = sum(len(deque_) for deque_ in self._recent_metrics.values())
-        
-        # Calculate system-wide averages
-        system_summary = {
-            "total_agents": total_agents,
-            "total_metrics_points": total_metrics_points,
-            "average_cpu_usage": 0.0,
-            "average_memory_usage": 0.0,
-            "total_tasks_completed": 0,
-            "total_tasks_failed": 0,
-            "average_response_time": 0.0,
-            "system_error_rate": 0.0
-        }
-        
-        if total_agents == 0:
-            return system_summary
-        
-        cpu_sum = memory_sum = tasks_completed_sum = tasks_failed_sum = response_time_sum = 0
-        agent_count = 0
-        
-        for agent_id, aggregates in self._metric_aggregates.items():
-            if aggregates:
-                cpu_sum += aggregates.get("avg_cpu_usage", 0)
-                memory_sum += aggregates.get("avg_memory_usage", 0)
-                tasks_completed_sum += aggregates.get("total_tasks_completed", 0)
-                tasks_failed_sum += aggregates.get("total_tasks_failed", 0)
-                response_time_sum += aggregates.get("avg_response_time", 0)
-                agent_count += 1
-        
-        if agent_count > 0:
-            system_summary.update({
-                "average_cpu_usage": cpu_sum / agent_count,
-                "average_memory_usage": memory_sum / agent_count,
-                "total_tasks_completed": tasks_completed_sum,
-                "total_tasks_failed": tasks_failed_sum,
-                "average_response_time": response_time_sum / agent_count,
-                "system_error_rate": (tasks_failed_sum / max(1, tasks_completed_sum + tasks_failed_sum))
-            })
-        
-        return system_summary
+        return self._rollups.snapshot()
+    
+    def set_agent_dimensions(self, agent_id: str, environment: Optional[str], agent_type: Optional[Any]):
+        """Record the environment and type an agent's metrics roll up into"""
+        self._rollups.set_dimensions(agent_id, environment, agent_type)
+    
+    def has_agent_dimensions(self, agent_id: str) -> bool:
+        """Whether rollup dimensions are known for an agent"""
+        return self._rollups.has_dimensions(agent_id)
+    
+    async def remove_agent(self, agent_id: str):
+        """Forget all in-memory metrics state for a deregistered agent"""
+        await self.stop_collection_for_agent(agent_id)
+        self._recent_metrics.pop(agent_id, None)
+        self._aggregates.remove_agent(agent_id)
+        self._rollups.remove_agent(agent_id)
+        self._alerts.remove_agent(agent_id)
+        self.delta_decoder.remove_agent(agent_id)
     
     async def start_collection_for_agent(self, agent_id: str, agent_info: AgentInfo):
         """Start periodic metrics collection for an agent"""
-        async def collect_periodically():
-            while agent_id in self._collection_tasks:
-                try:
-                    metrics = await self.collect_metrics_from_agent(agent_id, agent_info)
-                    if metrics:
-                        await self.receive_metrics(metrics)
-                    
-                    await asyncio.sleep(settings.monitoring.default_metrics_interval)
-                except asyncio.CancelledError:
-                    break
-                except Exception as e:
-                    logger.error(f"Error in periodic collection for agent {agent_id}: {e}")
-                    await asyncio.sleep(60)  # Wait before retrying
+        self.set_agent_dimensions(agent_id, agent_info.environment, agent_info.type)
+        self._collection_agents[agent_id] = agent_info
         
-        task = asyncio.create_task(collect_periodically())
-        self._collection_tasks[agent_id] = task
+        self.scheduler.schedule(
+            ("collect", agent_id),
+            settings.monitoring.default_metrics_interval,
+            lambda: self._collect_once(agent_id),
+            initial_delay=0
+        )
         logger.info(f"Started metrics collection for agent {agent_id}")
     
     async def stop_collection_for_agent(self, agent_id: str):
         """Stop metrics collection for an agent"""
-        if agent_id in self._collection_tasks:
-            self._collection_tasks[agent_id].cancel()
-            del self._collection_tasks[agent_id]
+        if self._collection_agents.pop(agent_id, None) is not None:
+            self.scheduler.cancel(("collect", agent_id))
             logger.info(f"Stopped metrics collection for agent {agent_id}")
     
-    async def _update_aggregates(self, metrics: AgentMetrics):
-        """Update running aggregates for an agent"""
-        agent_id = metrics.agent_id
+    async def _collect_once(self, agent_id: str):
+        """Scheduled pull of one agent's metrics"""
+        agent_info = self._collection_agents.get(agent_id)
+        if agent_info is None:
+            return
         
-        if agent_id not in self._metric_aggregates:
-            self._metric_aggregates[agent_id] = {
-                "count": 0,
-                "avg_cpu_usage": 0.0,
-                "avg_memory_usage": 0.0,
-                "avg_response_time": 0.0,
-                "total_tasks_completed": 0,
-                "total_tasks_failed": 0,
-                "last_updated": datetime.utcnow()
-            }
-        
-        agg = self._metric_aggregates[agent_id]
-        count = agg["count"]
-        
-        # Update running averages
-        agg["avg_cpu_usage"] = (
-            (agg["avg_cpu_usage"] * count + metrics.resource_metrics.cpu_usage_percent) / (count + 1)
-        )
-        agg["avg_memory_usage"] = (
-            (agg["avg_memory_usage"] * count + metrics.resource_metrics.memory_usage_percent) / (count + 1)
-        )
-        agg["avg_response_time"] = (
-            (agg["avg_response_time"] * count + metrics.performance_metrics.average_response_time_ms) / (count + 1)
+        metrics = await self.collect_metrics_from_agent(agent_id, agent_info)
+        if metrics:
+            await self.receive_metrics(metrics)
+    
+    async def _update_aggregates(self, metrics: AgentMetrics):
+        """Update running and windowed aggregates for an agent"""
+        self._aggregates.observe(metrics)
+        self._rollups.update(
+            metrics.agent_id,
+            self._aggregates.get_lifetime(metrics.agent_id),
+            len(self._recent_metrics[metrics.agent_id])
         )
-        
-        # Update totals
-        agg["total_tasks_completed"] += metrics.performance_metrics.tasks_completed
-        agg["total_tasks_failed"] += metrics.performance_metrics.tasks_failed
-        
-        agg["count"] = count + 1
-        agg["last_updated"] = datetime.utcnow()
     
     async def _store_metrics_persistent(self, metrics: AgentMetrics):
-        """Store metrics in persistent time series database"""
+        """Queue metrics for the background time series writer"""
         try:
-            # TODO: Implement InfluxDB storage
-            # This would write the metrics to InfluxDB for historical analysis
-            
-            # Example InfluxDB write:
-            # point = Point("agent_metrics") \
-            #     .tag("agent_id", metrics.agent_id) \
-            #     .field("cpu_usage", metrics.resource_metrics.cpu_usage_percent) \
-            #     .field("memory_usage", metrics.resource_metrics.memory_usage_percent) \
-            #     .time(metrics.timestamp)
-            # await self.influx_client.write_api().write(bucket="metrics", record=point)
-            
-            pass
-            
+            self._writer.submit(metrics)
         except Exception as e:
             logger.error(f"Failed to store metrics in persistent storage: {e}")
     
-    async def _check_thresholds(self, metrics: AgentMetrics):
-        """Check if any metrics exceed defined thresholds"""
+    async def _check_thresholds(self, metrics_batch: List[AgentMetrics]):
+        """Evaluate alert rules (and the default thresholds) against ingested metrics"""
         try:
-            alerts = []
-            
-            # CPU threshold check
-            if metrics.resource_metrics.cpu_usage_percent > settings.monitoring.default_cpu_threshold:
-                alerts.append(f"High CPU usage: {metrics.resource_metrics.cpu_usage_percent:.1f}%")
-            
-            # Memory threshold check
-            if metrics.resource_metrics.memory_usage_percent > settings.monitoring.default_memory_threshold:
-                alerts.append(f"High memory usage: {metrics.resource_metrics.memory_usage_percent:.1f}%")
-            
-            # Error rate threshold check
-            if metrics.performance_metrics.error_rate > settings.monitoring.default_error_rate_threshold:
-                alerts.append(f"High error rate: {metrics.performance_metrics.error_rate:.2%}")
-            
-            # Response time threshold check
-            if metrics.performance_metrics.average_response_time_ms > settings.monitoring.default_response_time_threshold:
-                alerts.append(f"High response time: {metrics.performance_metrics.average_response_time_ms:.1f}ms")
-            
-            if alerts:
-                logger.warning(f"Threshold violations for agent {metrics.agent_id}: {', '.join(alerts)}")
-                # TODO: Send alerts to alerting system
-            
+            self._alerts.evaluate(metrics_batch)
         except Exception as e:
-            logger.error(f"Failed to check thresholds for {metrics.agent_id}: {e}")
+            logger.error(f"Failed to check thresholds for {len(metrics_batch)} samples: {e}")
 
 
 # Global metrics collector instance
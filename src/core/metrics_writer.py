@@ -0,0 +1,182 @@
+"""
+Background batching writer for persistent metrics storage.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Any
+
+from ..models import AgentMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsWriter:
+    """Coalesces metrics samples into batches and writes them off the ingest path.
+    
+    Samples are handed over through a bounded asyncio queue, so ``submit`` never
+    waits on the storage backend. A single background task drains the queue,
+    encodes samples into backend records (e.g. line protocol) and flushes a
+    batch when either ``batch_size`` records are pending or ``flush_interval`` seconds have passed
+    since the first pending sample. When the queue is full new samples are
+    dropped and counted. A failed write is retried up to ``max_retries`` times
+    with capped exponential backoff before the batch is given up; the queue
+    keeps absorbing samples meanwhile.
+    """
+    
+    def __init__(
+        self,
+        sink: Callable[[List[Any]], Awaitable[bool]],
+        encoder: Callable[[AgentMetrics], List[Any]],
+        batch_size: int = 5000,
+        flush_interval: float = 1.0,
+        queue_size: int = 50000,
+        max_retries: int = 3,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 10.0,
+        name: str = "metrics"
+    ):
+        self.sink = sink
+        self.encoder = encoder
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.name = name
+        
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "submitted": 0,
+            "dropped": 0,
+            "written_points": 0,
+            "written_batches": 0,
+            "write_errors": 0,
+            "write_retries": 0,
+            "failed_points": 0
+        }
+    
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+    
+    @property
+    def pressure(self) -> float:
+        """Queue fill ratio (0.0 - 1.0), usable as a backpressure signal"""
+        if not self._queue:
+            return 0.0
+        return self._queue.qsize() / self.queue_size
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get writer counters"""
+        return {
+            **self._stats,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "pressure": self.pressure
+        }
+    
+    async def start(self):
+        """Start the background writer task"""
+        if self.is_running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Started {self.name} writer (batch_size={self.batch_size}, flush_interval={self.flush_interval}s)")
+    
+    async def stop(self, timeout: float = 10.0):
+        """Flush pending samples and stop the background writer task"""
+        if not self.is_running:
+            return
+        
+        # Sentinel goes behind everything already queued, so the task drains first
+        await self._queue.put(None)
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.name} writer did not flush within {timeout}s; "
+                           f"{self._queue.qsize()} samples discarded")
+            self._task.cancel()
+        self._task = None
+        logger.info(f"Stopped {self.name} writer")
+    
+    def submit(self, metrics: AgentMetrics) -> bool:
+        """Queue a sample for writing without waiting; returns False if dropped"""
+        if not self.is_running:
+            return False
+        
+        try:
+            self._queue.put_nowait(metrics)
+            self._stats["submitted"] += 1
+            return True
+        except asyncio.QueueFull:
+            self._stats["dropped"] += 1
+            # Log the first drop and then every 1000th to avoid flooding logs
+            if self._stats["dropped"] % 1000 == 1:
+                logger.warning(f"{self.name} writer queue full; {self._stats['dropped']} samples dropped so far")
+            return False
+    
+    async def _run(self):
+        """Drain the queue, coalescing samples into size/time bounded batches"""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            
+            lines = self._encode(item)
+            deadline = loop.time() + self.flush_interval
+            stopping = False
+            
+            while len(lines) < self.batch_size:
+                # Take whatever is already queued without a timer per sample;
+                # only wait (up to the deadline) once the queue runs dry
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                lines.extend(self._encode(item))
+            
+            await self._flush(lines)
+            if stopping:
+                return
+    
+    def _encode(self, metrics: AgentMetrics) -> List[Any]:
+        try:
+            return self.encoder(metrics)
+        except Exception as e:
+            logger.error(f"Failed to encode metrics from {metrics.agent_id}: {e}")
+            return []
+    
+    async def _flush(self, lines: List[Any]):
+        if not lines:
+            return
+        
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._stats["write_retries"] += 1
+                await asyncio.sleep(min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempt - 1)))
+            
+            try:
+                if await self.sink(lines):
+                    self._stats["written_points"] += len(lines)
+                    self._stats["written_batches"] += 1
+                    return
+                self._stats["write_errors"] += 1
+            except Exception as e:
+                self._stats["write_errors"] += 1
+                logger.error(f"Failed to write {len(lines)} points from {self.name} writer: {e}")
+        
+        self._stats["failed_points"] += len(lines)
+        logger.error(f"Giving up on {len(lines)} points from {self.name} writer after {self.max_retries} retries")
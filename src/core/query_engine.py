@@ -0,0 +1,277 @@
+"""
+Metrics Query Engine - Plans and runs historical metrics queries.
+"""
+
+import asyncio
+import bisect
+import logging
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+from ..config import RetentionTier, settings
+from ..database.influx_client import TimeSeriesQuery
+from ..database.local_tsdb import AGGREGATIONS, MEASUREMENTS, parse_window
+from ..models import MetricsQuery, MetricsSeries
+from ..storage.ring_buffer import MetricsRingBuffer, NUMERIC_FIELDS
+from .alert_engine import FIELD_ALIASES, FIELD_GROUPS
+from .retention import select_tier, tier_measurement
+
+logger = logging.getLogger(__name__)
+
+# Returned when a query names no metrics
+DEFAULT_QUERY_FIELDS = (
+    "cpu_usage_percent",
+    "memory_usage_percent",
+    "tasks_completed",
+    "average_response_time_ms",
+)
+
+# Aggregation names accepted besides the Flux ones
+AGGREGATION_ALIASES = {"avg": "mean", "average": "mean"}
+
+MEMORY = "memory"
+STORE = "store"
+
+
+def _epoch(dt: datetime) -> float:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _from_epoch(epoch: float) -> datetime:
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None)
+
+
+@dataclass
+class QueryPlan:
+    """How one agent's part of a query is answered"""
+    agent_id: str
+    source: str  # MEMORY or STORE
+    fields: List[str]
+    start: float
+    stop: float
+    aggregation: Optional[str] = None
+    window: Optional[str] = None
+    tier: Optional[RetentionTier] = None  # store tier for STORE plans
+
+
+class MetricsQueryEngine:
+    """Answers metrics queries from the ring buffers or the time series store.
+    
+    An agent is served from its in-memory ring buffer when the buffer
+    reaches back to the query's start (or there is no store to ask);
+    otherwise the store is queried with ``aggregateWindow`` pushed down,
+    one request per agent and measurement, many agents at a time, against
+    the coarsest retention tier that still covers the range and divides
+    the interval.
+    Results are columnar: one timestamp array per agent plus one value
+    array per metric, with None where a metric has no value.
+    """
+    
+    def __init__(
+        self,
+        buffers: Callable[[str], Optional[MetricsRingBuffer]],
+        store: Callable[[], Any],
+        concurrency: Optional[int] = None
+    ):
+        self.buffers = buffers
+        self.store = store
+        self.concurrency = concurrency or settings.monitoring.metrics_query_concurrency
+    
+    @staticmethod
+    def resolve_fields(metric_names: Optional[Sequence[str]]) -> List[str]:
+        fields = [FIELD_ALIASES.get(name, name) for name in (metric_names or DEFAULT_QUERY_FIELDS)]
+        return list(dict.fromkeys(fields))
+    
+    @staticmethod
+    def resolve_aggregation(aggregation: Optional[str], interval: Optional[str]) -> Optional[str]:
+        """Validate the aggregation (``mean`` when only an interval is given)"""
+        if interval:
+            parse_window(interval)
+        if not aggregation:
+            return "mean" if interval else None
+        aggregation = AGGREGATION_ALIASES.get(aggregation.lower(), aggregation.lower())
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unsupported aggregation: {aggregation}")
+        return aggregation
+    
+    def plan(self, query: MetricsQuery, agent_ids: Sequence[str]) -> List[QueryPlan]:
+        """Pick a source per agent; raises ValueError for invalid aggregation/interval"""
+        fields = self.resolve_fields(query.metric_names)
+        aggregation = self.resolve_aggregation(query.aggregation, query.interval)
+        start, stop = _epoch(query.start_time), _epoch(query.end_time)
+        has_store = self.store() is not None
+        tier = None
+        if has_store:
+            window = parse_window(query.interval) if query.interval else None
+            tier = select_tier(settings.monitoring.retention_tiers, start, window, stop=stop, aggregation=aggregation)
+        
+        plans = []
+        for agent_id in dict.fromkeys(agent_ids):
+            buffer = self.buffers(agent_id)
+            oldest = buffer.oldest_timestamp() if buffer is not None else None
+            if not has_store or (oldest is not None and oldest <= start):
+                plans.append(QueryPlan(agent_id, MEMORY, fields, start, stop, aggregation, query.interval))
+            else:
+                plans.append(QueryPlan(agent_id, STORE, fields, start, stop, aggregation, query.interval, tier))
+        return plans
+    
+    async def execute(self, plans: List[QueryPlan]) -> List[MetricsSeries]:
+        """Run a plan; store-backed agents are fetched concurrently"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def run(plan: QueryPlan) -> MetricsSeries:
+            if plan.source == MEMORY:
+                return self._from_memory(plan)
+            async with semaphore:
+                return await self._from_store(plan)
+        
+        return list(await asyncio.gather(*(run(plan) for plan in plans)))
+    
+    def stream(
+        self,
+        query: MetricsQuery,
+        agent_ids: Optional[Sequence[str]] = None,
+        chunk_size: int = 5000
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Stream a query's store rows (time, agent_id, measurement, field, value) in chunks.
+        
+        Meant for exports: rows come straight from the store, agent by agent
+        and measurement by measurement, without building a result in memory.
+        No metric names means every field of every measurement. Rows read
+        from a rollup tier name its measurement (e.g. ``resource_metrics_1m``).
+        The query is validated here, before anything is streamed; raises
+        ValueError for a bad aggregation/interval and RuntimeError without a store.
+        """
+        store = self.store()
+        if store is None:
+            raise RuntimeError("No time series store configured")
+        
+        aggregation = self.resolve_aggregation(query.aggregation, query.interval)
+        start, stop = _epoch(query.start_time), _epoch(query.end_time)
+        window = parse_window(query.interval) if query.interval else None
+        tier = select_tier(settings.monitoring.retention_tiers, start, window, stop=stop, aggregation=aggregation)
+        
+        by_measurement: Dict[str, Optional[List[str]]] = {}
+        if query.metric_names:
+            for field in self.resolve_fields(query.metric_names):
+                by_measurement.setdefault(FIELD_GROUPS.get(field, "custom_metrics"), []).append(field)
+        else:
+            by_measurement = dict.fromkeys(MEASUREMENTS)
+        
+        queries = [
+            TimeSeriesQuery(
+                measurement=tier_measurement(measurement, tier),
+                start_time=query.start_time,
+                end_time=query.end_time,
+                agent_id=agent_id,
+                fields=fields,
+                aggregation=aggregation,
+                window=query.interval
+            )
+            for agent_id in (list(dict.fromkeys(agent_ids)) if agent_ids else [None])
+            for measurement, fields in by_measurement.items()
+        ]
+        return self._stream_queries(store, queries, chunk_size)
+    
+    @staticmethod
+    async def _stream_queries(store, queries: List[TimeSeriesQuery], chunk_size: int):
+        for series_query in queries:
+            async for chunk in store.stream_agent_metrics(series_query, chunk_size):
+                yield chunk
+    
+    def _from_memory(self, plan: QueryPlan) -> MetricsSeries:
+        buffer = self.buffers(plan.agent_id)
+        if buffer is None or not len(buffer):
+            return MetricsSeries(agent_id=plan.agent_id, source=MEMORY, timestamps=[], values={})
+        
+        # Samples are kept in time order, so the window is one contiguous slice
+        timestamps = buffer.timestamps()
+        lo = bisect.bisect_left(timestamps, plan.start)
+        hi = bisect.bisect_left(timestamps, plan.stop)
+        times = timestamps[lo:hi].tolist()
+        
+        columns = {}
+        for field in plan.fields:
+            if field in NUMERIC_FIELDS:
+                column = buffer.column(field)[lo:hi].tolist()
+            else:
+                column = buffer.custom_column(field)[lo:hi]
+            if any(not math.isnan(value) for value in column):
+                columns[field] = column
+        
+        if plan.aggregation:
+            times, columns = self._aggregate(times, columns, plan)
+        
+        return MetricsSeries(
+            agent_id=plan.agent_id,
+            source=MEMORY,
+            timestamps=[_from_epoch(t) for t in times],
+            values={
+                field: [None if math.isnan(value) else value for value in column]
+                for field, column in columns.items()
+            }
+        )
+    
+    @staticmethod
+    def _aggregate(times: List[float], columns: Dict[str, List[float]], plan: QueryPlan):
+        """Bucket like Flux ``aggregateWindow`` (windows labeled by their stop time, no empty windows)"""
+        aggregate = AGGREGATIONS[plan.aggregation]
+        window = parse_window(plan.window) if plan.window else None
+        
+        buckets: Dict[float, List[int]] = {}
+        for index, timestamp in enumerate(times):
+            label = (timestamp // window + 1) * window if window else plan.stop
+            buckets.setdefault(label, []).append(index)
+        
+        labels = sorted(buckets)
+        aggregated = {}
+        for field, column in columns.items():
+            values = []
+            for label in labels:
+                present = [column[i] for i in buckets[label] if not math.isnan(column[i])]
+                values.append(float(aggregate(present)) if present else math.nan)
+            aggregated[field] = values
+        return labels, aggregated
+    
+    async def _from_store(self, plan: QueryPlan) -> MetricsSeries:
+        store = self.store()
+        by_measurement: Dict[str, List[str]] = defaultdict(list)
+        for field in plan.fields:
+            by_measurement[FIELD_GROUPS.get(field, "custom_metrics")].append(field)
+        
+        start, stop = _from_epoch(plan.start), _from_epoch(plan.stop)
+        results = await asyncio.gather(*(
+            store.query_agent_metrics(TimeSeriesQuery(
+                measurement=tier_measurement(measurement, plan.tier),
+                start_time=start,
+                end_time=stop,
+                agent_id=plan.agent_id,
+                fields=fields,
+                aggregation=plan.aggregation,
+                window=plan.window
+            ))
+            for measurement, fields in by_measurement.items()
+        ))
+        
+        points: Dict[float, Dict[str, float]] = defaultdict(dict)
+        for rows in results:
+            for row in rows:
+                # Aggregates without a window carry no time of their own
+                timestamp = _epoch(row["time"]) if row.get("time") else plan.stop
+                if row.get("value") is not None:
+                    points[timestamp][row["field"]] = float(row["value"])
+        
+        times = sorted(points)
+        fields = [field for field in plan.fields if any(field in point for point in points.values())]
+        return MetricsSeries(
+            agent_id=plan.agent_id,
+            source=STORE,
+            tier=plan.tier.name,
+            timestamps=[_from_epoch(t) for t in times],
+            values={field: [points[t].get(field) for t in times] for field in fields}
+        )
@@ -0,0 +1,158 @@
+"""
+Query Result Cache - Time-bucketed, coalescing cache for polled query endpoints.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from pydantic_core import to_jsonable_python
+
+from ..config import settings
+from ..database.connection import DatabaseManager, db_manager
+from ..utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _normalize(value: Any) -> Any:
+    """Canonical form of a query parameter (list order and duplicates don't matter)"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    if isinstance(value, (list, tuple, set)):
+        return sorted({json.dumps(_normalize(item), sort_keys=True) for item in value})
+    return value
+
+
+class QueryResultCache:
+    """Caches query results by normalized query and aligned time bucket.
+    
+    A query that runs up to "now" is live: its key carries the current
+    ``bucket``-second slot (aligned to the epoch, so every worker agrees),
+    identical polls within the slot share one result and the next slot
+    recomputes it. A query whose range ended more than ``settle`` seconds
+    ago rarely changes and is kept for ``settled_ttl`` seconds (spool
+    replays can still backfill it). Results are held in a per-worker LRU
+    and, once ``initialize`` has connected the application's database
+    manager, shared between workers through Redis. Concurrent misses for
+    one key wait on a single computation.
+    Cached results are JSON-compatible (pydantic models become dicts).
+    """
+    
+    def __init__(
+        self,
+        redis: Callable[[], Any],
+        maxsize: Optional[int] = None,
+        bucket: Optional[float] = None,
+        settle: Optional[float] = None,
+        settled_ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.time
+    ):
+        config = settings.monitoring
+        self.redis = redis
+        self.bucket = bucket or config.result_cache_bucket
+        self.settle = config.compaction_lag if settle is None else settle
+        self.settled_ttl = settled_ttl or config.result_cache_settled_ttl
+        self._clock = clock
+        self._local = TTLCache(maxsize or config.result_cache_size, self.bucket, clock=clock)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._stats = {"computed": 0, "coalesced": 0, "shared_hits": 0, "errors": 0}
+    
+    def initialize(self, manager: Optional[DatabaseManager] = None):
+        """Share results through the given database manager's Redis connection"""
+        manager = manager or db_manager
+        self.redis = lambda: manager.redis_client
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._local.get_stats(), **self._stats, "inflight": len(self._inflight)}
+    
+    def clear(self):
+        self._local.clear()
+    
+    def key(self, name: str, params: Dict[str, Any], stop: Optional[datetime] = None) -> Tuple[str, float]:
+        """Cache key and time to live for a query (``stop`` is its end, None for live queries)"""
+        now = self._clock()
+        normalized = {k: _normalize(v) for k, v in params.items() if v is not None}
+        if stop is not None and _normalize(stop) <= now - self.settle:
+            slot, ttl = "settled", self.settled_ttl
+        else:
+            index = int(now // self.bucket)
+            slot, ttl = str(index), (index + 1) * self.bucket - now
+        digest = hashlib.sha1(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+        return f"agent_monitor:results:{name}:{digest}:{slot}", ttl
+    
+    async def get_or_compute(
+        self,
+        name: str,
+        params: Dict[str, Any],
+        compute: Callable[[], Awaitable[Any]],
+        stop: Optional[datetime] = None
+    ) -> Any:
+        """Cached result of ``compute()`` for this query; errors are not cached"""
+        if not settings.monitoring.result_cache_enabled:
+            return to_jsonable_python(await compute())
+        
+        key, ttl = self.key(name, params, stop)
+        value = self._local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, ttl, compute))
+            self._inflight[key] = task
+        else:
+            self._stats["coalesced"] += 1
+        # Shielded so one caller going away doesn't cancel the others' result
+        return await asyncio.shield(task)
+    
+    async def _load(self, key: str, ttl: float, compute: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await self._shared_get(key)
+            if value is _MISSING:
+                self._stats["computed"] += 1
+                value = to_jsonable_python(await compute())
+                await self._shared_set(key, value, ttl)
+            else:
+                self._stats["shared_hits"] += 1
+            self._local.set(key, value, ttl)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+    
+    async def _shared_get(self, key: str) -> Any:
+        redis_client = self.redis()
+        if redis_client is None:
+            return _MISSING
+        try:
+            raw = await redis_client.get(key)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.debug(f"Result cache read failed: {e}")
+            return _MISSING
+        return _MISSING if raw is None else json.loads(raw)
+    
+    async def _shared_set(self, key: str, value: Any, ttl: float):
+        redis_client = self.redis()
+        if redis_client is None:
+            return
+        try:
+            await redis_client.set(key, json.dumps(value), px=max(1, int(ttl * 1000)))
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.debug(f"Result cache write failed: {e}")
+
+
+# Global result cache instance
+result_cache = QueryResultCache(lambda: db_manager.redis_client)
@@ -0,0 +1,166 @@
+"""
+Retention Tiers - Downsampling compactor and tier selection for historical metrics.
+"""
+
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from ..config import RetentionTier, settings
+from ..database.local_tsdb import MEASUREMENTS
+
+logger = logging.getLogger(__name__)
+
+# Expiring points is a delete per measurement and tier; once an hour is plenty
+EXPIRY_INTERVAL = 3600
+
+
+def tier_measurement(measurement: str, tier: RetentionTier) -> str:
+    """Measurement a tier stores its points in (raw points keep the original name)"""
+    return measurement if not tier.resolution else f"{measurement}_{tier.name}"
+
+
+def rollup_delay(tier: RetentionTier) -> float:
+    """How far behind now a rollup tier can be before the compactor catches up"""
+    return tier.resolution + settings.monitoring.compaction_lag + settings.monitoring.compaction_interval
+
+
+def select_tier(
+    tiers: Sequence[RetentionTier],
+    start: float,
+    window: Optional[int] = None,
+    now: Optional[float] = None,
+    stop: Optional[float] = None,
+    aggregation: Optional[str] = None
+) -> RetentionTier:
+    """Coarsest tier that still holds ``start`` and whose resolution divides ``window``.
+    
+    Without a window the finest tier holding ``start`` is used. While raw
+    points still cover the range, rollups that may not have caught up with
+    ``stop`` yet are skipped. When no tier reaches back far enough, the
+    longest-retained one is the best effort.
+    
+    Rollups hold per-window means, so only ``mean`` (or no aggregation) can
+    be answered from them; any other aggregation always reads raw points,
+    even if that leaves the older part of the range empty.
+    """
+    now = time.time() if now is None else now
+    if aggregation not in (None, "mean"):
+        raw = [tier for tier in tiers if not tier.resolution]
+        if raw:
+            return raw[0]
+    covering = [tier for tier in tiers if start >= now - tier.retention_hours * 3600]
+    if not covering:
+        return max(tiers, key=lambda tier: tier.retention_hours)
+    
+    if window:
+        raw_covers = any(not tier.resolution for tier in covering)
+        usable = [
+            tier for tier in covering
+            if not tier.resolution or (
+                window % tier.resolution == 0
+                and (not raw_covers or stop is None or stop <= now - rollup_delay(tier))
+            )
+        ]
+        if usable:
+            return max(usable, key=lambda tier: tier.resolution)
+    return min(covering, key=lambda tier: tier.resolution)
+
+
+class RetentionCompactor:
+    """Builds each rollup tier from the one before it and expires old points.
+    
+    Every run rolls up only the complete windows since the tier's watermark
+    (found from the newest rollup point after a restart), at most
+    ``max_windows`` per tier so a long backlog is worked off over several
+    runs. Windows younger than ``lag`` seconds, or not yet complete in the
+    source tier, are left for later. Rollups hold per-window means.
+    
+    Windows are not recomputed once rolled up: points arriving more than
+    ``lag`` seconds late (e.g. replayed from an agent's spool) are kept in
+    the raw tier but never reach the rollups.
+    """
+    
+    def __init__(
+        self,
+        store: Callable[[], Any],
+        tiers: Optional[List[RetentionTier]] = None,
+        measurements: Sequence[str] = MEASUREMENTS,
+        lag: Optional[float] = None,
+        max_windows: int = 1440
+    ):
+        self.store = store
+        self.tiers = sorted(tiers or settings.monitoring.retention_tiers, key=lambda tier: tier.resolution)
+        self.measurements = measurements
+        self.lag = settings.monitoring.compaction_lag if lag is None else lag
+        self.max_windows = max_windows
+        self._watermarks: Dict[tuple, float] = {}
+        self._expired_at = 0.0
+        self._stats = {"runs": 0, "points_written": 0, "errors": 0}
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "tiers": [tier.name for tier in self.tiers]}
+    
+    async def run_once(self, now: Optional[float] = None):
+        """Roll up newly completed windows and apply every tier's retention"""
+        store = self.store()
+        if store is None:
+            return
+        now = time.time() if now is None else now
+        self._stats["runs"] += 1
+        
+        for source, target in zip(self.tiers, self.tiers[1:]):
+            for measurement in self.measurements:
+                try:
+                    await self._compact(store, measurement, source, target, now)
+                except Exception as e:
+                    self._stats["errors"] += 1
+                    logger.error(f"Failed to roll up {measurement} into the {target.name} tier: {e}")
+        
+        if now - self._expired_at < EXPIRY_INTERVAL:
+            return
+        self._expired_at = now
+        for tier in self.tiers:
+            cutoff = datetime.fromtimestamp(now - tier.retention_hours * 3600, timezone.utc)
+            for measurement in self.measurements:
+                try:
+                    await store.drop_before(tier_measurement(measurement, tier), cutoff)
+                except Exception as e:
+                    self._stats["errors"] += 1
+                    logger.error(f"Failed to expire {tier.name} {measurement}: {e}")
+    
+    async def _compact(self, store, measurement: str, source: RetentionTier, target: RetentionTier, now: float):
+        resolution = target.resolution
+        stop = (now - self.lag) // resolution * resolution
+        key = (measurement, target.name)
+        start = self._watermarks.get(key)
+        if start is None:
+            newest = await store.last_point_time(tier_measurement(measurement, target))
+            if newest is not None:
+                start = (newest.timestamp() // resolution + 1) * resolution
+            else:
+                start = (now - source.retention_hours * 3600) // resolution * resolution
+            self._watermarks[key] = start
+        
+        if source.resolution:
+            # Never roll up past what the source tier has itself compacted
+            source_mark = self._watermarks.get((measurement, source.name))
+            if source_mark is None:
+                return
+            stop = min(stop, source_mark // resolution * resolution)
+        stop = min(stop, start + self.max_windows * resolution)
+        if stop <= start:
+            return
+        
+        written = await store.downsample(
+            tier_measurement(measurement, source),
+            tier_measurement(measurement, target),
+            resolution,
+            datetime.fromtimestamp(start, timezone.utc),
+            datetime.fromtimestamp(stop, timezone.utc)
+        )
+        self._watermarks[key] = stop
+        self._stats["points_written"] += written
+        if written:
+            logger.debug(f"Rolled up {written} {measurement} points into the {target.name} tier")
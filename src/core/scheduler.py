@@ -0,0 +1,159 @@
+"""
+Timer Wheel Scheduler - Runs periodic jobs for many agents from a single task.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Any, Callable, Awaitable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class _Timer:
+    """A scheduled job; repeats every ``interval`` seconds when periodic"""
+    
+    __slots__ = ("key", "callback", "interval", "repeat", "due", "cancelled")
+    
+    def __init__(self, key: Hashable, callback: Callable[[], Awaitable[Any]], interval: float, repeat: bool):
+        self.key = key
+        self.callback = callback
+        self.interval = interval
+        self.repeat = repeat
+        self.due = 0
+        self.cancelled = False
+
+
+class TimerWheel:
+    """Hashed timer wheel driving all periodic work from one asyncio task.
+    
+    Timers are placed in ``slots`` buckets of ``tick`` seconds by their due
+    tick, so scheduling and cancelling are O(1) and each tick only looks at
+    one bucket, however many timers exist. Due callbacks run as short-lived
+    tasks; a timer whose previous run is still in progress is skipped for
+    that tick rather than piling up. If the loop falls behind, the ticks it
+    missed are processed on the next wake-up.
+    """
+    
+    def __init__(self, tick: float = 1.0, slots: int = 512, name: str = "scheduler"):
+        self.tick = tick
+        self.slots = slots
+        self.name = name
+        self._wheel: List[Dict[Hashable, _Timer]] = [{} for _ in range(slots)]
+        self._timers: Dict[Hashable, _Timer] = {}
+        self._running_jobs: Dict[Hashable, asyncio.Task] = {}
+        self._current_tick = 0
+        self._origin = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+    
+    def __len__(self) -> int:
+        return len(self._timers)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._timers
+    
+    def _ticks_for(self, seconds: float) -> int:
+        return max(1, int(round(seconds / self.tick)))
+    
+    def _place(self, timer: _Timer, delay: float):
+        timer.due = self._current_tick + self._ticks_for(delay)
+        self._wheel[timer.due % self.slots][timer.key] = timer
+    
+    def schedule(
+        self,
+        key: Hashable,
+        interval: float,
+        callback: Callable[[], Awaitable[Any]],
+        repeat: bool = True,
+        initial_delay: Optional[float] = None
+    ):
+        """Schedule ``callback`` under ``key``, replacing any existing timer for that key"""
+        self.cancel(key)
+        timer = _Timer(key, callback, interval, repeat)
+        self._timers[key] = timer
+        self._place(timer, interval if initial_delay is None else initial_delay)
+    
+    def cancel(self, key: Hashable) -> bool:
+        """Cancel a timer; a run already in progress is allowed to finish"""
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        timer.cancelled = True
+        self._wheel[timer.due % self.slots].pop(key, None)
+        return True
+    
+    async def start(self):
+        if self.is_running:
+            return
+        self._origin = time.monotonic() - self._current_tick * self.tick
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Started {self.name} timer wheel (tick={self.tick}s)")
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        jobs = list(self._running_jobs.values())
+        for job in jobs:
+            job.cancel()
+        if jobs:
+            await asyncio.gather(*jobs, return_exceptions=True)
+        self._running_jobs.clear()
+    
+    async def _run(self):
+        while True:
+            try:
+                target = int((time.monotonic() - self._origin) / self.tick)
+                while self._current_tick < target:
+                    self._current_tick += 1
+                    self._advance()
+                
+                next_tick_at = self._origin + (self._current_tick + 1) * self.tick
+                await asyncio.sleep(max(0.0, next_tick_at - time.monotonic()))
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in {self.name} timer wheel: {e}")
+    
+    def _advance(self):
+        """Fire the timers due on the current tick"""
+        slot = self._wheel[self._current_tick % self.slots]
+        if not slot:
+            return
+        
+        due = [timer for timer in slot.values() if timer.due <= self._current_tick]
+        for timer in due:
+            del slot[timer.key]
+            if timer.repeat:
+                self._place(timer, timer.interval)
+            else:
+                self._timers.pop(timer.key, None)
+            
+            if timer.key in self._running_jobs:
+                logger.debug(f"Skipping {timer.key}: previous run still in progress")
+                continue
+            job = asyncio.create_task(self._run_job(timer))
+            self._running_jobs[timer.key] = job
+    
+    async def _run_job(self, timer: _Timer):
+        try:
+            await timer.callback()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Scheduled job {timer.key} failed: {e}")
+        finally:
+            self._running_jobs.pop(timer.key, None)
+
+
+# Global scheduler shared by the registry and the metrics collector
+scheduler = TimerWheel()
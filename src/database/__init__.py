@@ -12,6 +12,7 @@ from .models import (
     AgentStatus, AgentType, DeploymentType, UserRole, AlertSeverity, AlertStatus
 )
 from .influx_client import influx_client, TimeSeriesQuery
+from .local_tsdb import local_tsdb, LocalTimeSeriesStore
 
 __all__ = [
     # Connection management
@@ -27,5 +28,5 @@ __all__ = [
     "AgentStatus", "AgentType", "DeploymentType", "UserRole", "AlertSeverity", "AlertStatus",
     
     # Time-series
-    "influx_client", "TimeSeriesQuery"
+    "influx_client", "TimeSeriesQuery", "local_tsdb", "LocalTimeSeriesStore"
 ]
\ No newline at end of file
@@ -3,30 +3,80 @@ InfluxDB client for storing and retrieving time-series metrics data.
 """
 
 import logging
+import math
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Sequence, Union, AsyncIterator
 from dataclasses import dataclass
 
 from influxdb_client import Point
-from influxdb_client.client.write_api import ASYNCHRONOUS
 from influxdb_client.domain.write_precision import WritePrecision
 
-from src.database.connection import db_manager
+from src.config import settings
+from src.database.connection import db_manager, DatabaseManager
 from src.models import AgentMetrics
 
 logger = logging.getLogger(__name__)
 
 
+def _escape_key(value: str) -> str:
+    """Escape a line protocol tag key/value or field key"""
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+def _flux_string(value: str) -> str:
+    """Quote a value as a Flux string literal"""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"').replace("${", "\\${") + '"'
+
+
+def _any_of(column: str, values: Sequence[str]) -> str:
+    """Flux predicate matching any of the values (kept as ``or`` so it is pushed down to storage)"""
+    return " or ".join(f"r[{_flux_string(column)}] == {_flux_string(value)}" for value in values)
+
+
+# Result columns that are neither tags nor fields
+_META_COLUMNS = frozenset({"result", "table", "_start", "_stop", "_time"})
+
+
 @dataclass
 class TimeSeriesQuery:
-    """Query parameters for time-series data"""
-    measurement: str
+    """Query parameters for time-series data.
+    
+    ``measurement`` and ``agent_id`` take a single value or a set. With
+    ``group_by``, series are regrouped on those columns (per field) before
+    aggregating, e.g. ``[]`` aggregates each field across all agents. A
+    ``rollup`` aggregates each series first and then combines the results
+    per group (e.g. last value per agent, summed over the fleet).
+    ``pivot`` returns one wide row per time and series with a column per
+    field.
+    """
+    measurement: Union[str, Sequence[str]]
     start_time: datetime
     end_time: Optional[datetime] = None
-    agent_id: Optional[str] = None
+    agent_id: Optional[Union[str, Sequence[str]]] = None
     fields: Optional[List[str]] = None
     aggregation: Optional[str] = None  # mean, max, min, sum, count
     window: Optional[str] = None  # 1m, 5m, 1h, etc.
+    group_by: Optional[List[str]] = None  # tag columns, e.g. ["agent_id"]; [] for the whole set
+    rollup: Optional[str] = None  # aggregation applied across group_by after the per-series one
+    pivot: bool = False
+    
+    @property
+    def measurements(self) -> List[str]:
+        return [self.measurement] if isinstance(self.measurement, str) else list(self.measurement)
+    
+    @property
+    def agent_ids(self) -> Optional[List[str]]:
+        if self.agent_id is None:
+            return None
+        return [self.agent_id] if isinstance(self.agent_id, str) else list(self.agent_id)
+
+
+@dataclass
+class WideRow:
+    """One (usually pivoted) result row: its time, identifying tags and a value per field"""
+    time: Optional[datetime]
+    tags: Dict[str, Any]
+    values: Dict[str, Any]
 
 
 class InfluxDBClient:
@@ -39,18 +89,24 @@ class InfluxDBClient:
         self.bucket = None
         self.org = None
     
-    async def initialize(self):
+    async def initialize(self, manager: Optional[DatabaseManager] = None):
         """Initialize InfluxDB client"""
-        self.client = await db_manager.get_influx()
+        self.client = await (manager or db_manager).get_influx()
         if self.client:
-            self.write_api = self.client.write_api(write_options=ASYNCHRONOUS)
+            # The async client's write API is already non-blocking
+            self.write_api = self.client.write_api()
             self.query_api = self.client.query_api()
-            self.bucket = db_manager.influx_client.bucket if hasattr(db_manager, 'influx_client') else "metrics"
-            self.org = db_manager.influx_client.org if hasattr(db_manager, 'influx_client') else "monitor"
+            self.bucket = settings.database.influxdb_bucket
+            self.org = settings.database.influxdb_org
             logger.info("InfluxDB client initialized")
         else:
             logger.warning("InfluxDB not available")
     
+    @property
+    def is_available(self) -> bool:
+        """Whether the client is connected and can accept writes"""
+        return self.client is not None and self.write_api is not None
+    
     async def write_agent_metrics(self, metrics: AgentMetrics) -> bool:
         """Write agent metrics to InfluxDB"""
         if not self.client or not self.write_api:
@@ -66,11 +122,63 @@ class InfluxDBClient:
                 write_precision=WritePrecision.S
             )
             return True
-            
+        
         except Exception as e:
             logger.error(f"Failed to write metrics to InfluxDB: {e}")
             return False
     
+    async def write_line_protocol(self, lines: List[str]) -> bool:
+        """Write a pre-encoded batch of line protocol records in one request"""
+        if not self.is_available:
+            return False
+        
+        try:
+            await self.write_api.write(
+                bucket=self.bucket,
+                org=self.org,
+                record="\n".join(lines),
+                write_precision=WritePrecision.MS
+            )
+            return True
+        
+        except Exception as e:
+            logger.error(f"Failed to write {len(lines)} points to InfluxDB: {e}")
+            return False
+    
+    def metrics_to_line_protocol(self, metrics: AgentMetrics) -> List[str]:
+        """Encode AgentMetrics as line protocol records (millisecond precision)"""
+        timestamp = metrics.timestamp
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        suffix = f" {int(timestamp.timestamp() * 1000)}"
+        prefix = f",agent_id={_escape_key(metrics.agent_id)} "
+        
+        lines = []
+        groups = [
+            ("resource_metrics", metrics.resource_metrics.model_dump() if metrics.resource_metrics else None),
+            ("performance_metrics", metrics.performance_metrics.model_dump() if metrics.performance_metrics else None),
+            ("ai_metrics", metrics.ai_metrics.model_dump() if metrics.ai_metrics else None),
+            ("custom_metrics", metrics.custom_metrics),
+        ]
+        for measurement, values in groups:
+            if not values:
+                continue
+            fields = []
+            for field, value in values.items():
+                if value is None:
+                    continue
+                try:
+                    number = float(value)
+                except (ValueError, TypeError):
+                    # Skip non-numeric custom metrics
+                    continue
+                if math.isfinite(number):
+                    fields.append(f"{_escape_key(field)}={number!r}")
+            if fields:
+                lines.append(measurement + prefix + ",".join(fields) + suffix)
+        
+        return lines
+    
     def _convert_metrics_to_points(self, metrics: AgentMetrics) -> List[Point]:
         """Convert AgentMetrics to InfluxDB Points"""
         points = []
@@ -147,28 +255,51 @@ class InfluxDBClient:
             flux_query = self._build_flux_query(query)
             tables = await self.query_api.query(flux_query, org=self.org)
             
-            results = []
-            for table in tables:
-                for record in table.records:
-                    results.append({
-                        "time": record.get_time(),
-                        "agent_id": record.values.get("agent_id"),
-                        "measurement": record.get_measurement(),
-                        "field": record.get_field(),
-                        "value": record.get_value()
-                    })
-            
-            return results
-            
+            return [self._record_to_row(record) for table in tables for record in table.records]
+        
         except Exception as e:
             logger.error(f"Failed to query InfluxDB: {e}")
             return []
     
+    async def stream_agent_metrics(
+        self,
+        query: TimeSeriesQuery,
+        chunk_size: int = 5000
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Query time-series metrics data, yielding rows in chunks of ``chunk_size``.
+        
+        Records are parsed from the HTTP response as they arrive, so memory
+        stays bounded by one chunk however large the result is.
+        """
+        if not self.client or not self.query_api:
+            logger.warning("InfluxDB not available for querying")
+            return
+        
+        records = await self.query_api.query_stream(self._build_flux_query(query), org=self.org)
+        chunk = []
+        async for record in records:
+            chunk.append(self._record_to_row(record))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    
+    @staticmethod
+    def _record_to_row(record) -> Dict[str, Any]:
+        return {
+            "time": record.get_time(),
+            "agent_id": record.values.get("agent_id"),
+            "measurement": record.get_measurement(),
+            "field": record.get_field(),
+            "value": record.get_value()
+        }
+    
     def _build_flux_query(self, query: TimeSeriesQuery) -> str:
         """Build Flux query from TimeSeriesQuery parameters"""
         # Base query
         flux_parts = [
-            f'from(bucket: "{self.bucket}")',
+            f'from(bucket: {_flux_string(self.bucket)})',
             f'|> range(start: {self._format_time(query.start_time)}'
         ]
         
@@ -176,29 +307,103 @@ class InfluxDBClient:
             flux_parts[-1] += f', stop: {self._format_time(query.end_time)}'
         flux_parts[-1] += ')'
         
-        # Filter by measurement
-        flux_parts.append(f'|> filter(fn: (r) => r["_measurement"] == "{query.measurement}")')
+        # Filter by measurement(s)
+        flux_parts.append(f'|> filter(fn: (r) => {_any_of("_measurement", query.measurements)})')
         
-        # Filter by agent_id
-        if query.agent_id:
-            flux_parts.append(f'|> filter(fn: (r) => r["agent_id"] == "{query.agent_id}")')
+        # Filter by agent_id(s)
+        if query.agent_ids:
+            flux_parts.append(f'|> filter(fn: (r) => {_any_of("agent_id", query.agent_ids)})')
         
         # Filter by fields
         if query.fields:
-            field_filter = " or ".join([f'r["_field"] == "{field}"' for field in query.fields])
-            flux_parts.append(f'|> filter(fn: (r) => {field_filter})')
+            flux_parts.append(f'|> filter(fn: (r) => {_any_of("_field", query.fields)})')
+        
+        # _start/_stop are constant within the range, so keeping them in the
+        # group key costs nothing and keeps them (and a time) on aggregates
+        group = None
+        if query.group_by is not None:
+            columns = ["_start", "_stop", *query.group_by, "_field"]
+            group = f'|> group(columns: [{", ".join(_flux_string(c) for c in columns)}])'
         
         # Aggregation
-        if query.aggregation and query.window:
-            flux_parts.append(f'|> aggregateWindow(every: {query.window}, fn: {query.aggregation}, createEmpty: false)')
-        elif query.aggregation:
-            flux_parts.append(f'|> {query.aggregation}()')
+        if query.aggregation and query.rollup:
+            if query.window:
+                # Label first-stage windows by their start so the second stage
+                # puts each one back into the same window
+                flux_parts.append(
+                    f'|> aggregateWindow(every: {query.window}, fn: {query.aggregation}, '
+                    f'timeSrc: "_start", createEmpty: false)'
+                )
+            else:
+                flux_parts.append(f'|> {query.aggregation}()')
+            if group:
+                flux_parts.append(group)
+            if query.window:
+                flux_parts.append(f'|> aggregateWindow(every: {query.window}, fn: {query.rollup}, createEmpty: false)')
+            else:
+                flux_parts.append(f'|> {query.rollup}()')
+        else:
+            if group:
+                flux_parts.append(group)
+            if query.aggregation and query.window:
+                flux_parts.append(f'|> aggregateWindow(every: {query.window}, fn: {query.aggregation}, createEmpty: false)')
+            elif query.aggregation:
+                flux_parts.append(f'|> {query.aggregation}()')
+        
+        if query.pivot:
+            if query.aggregation and not query.window:
+                # Plain aggregates drop _time; label them with the end of the range
+                flux_parts.append('|> duplicate(column: "_stop", as: "_time")')
+            flux_parts.append('|> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")')
         
         # Sort by time
         flux_parts.append('|> sort(columns: ["_time"])')
         
         return '\n  '.join(flux_parts)
     
+    def _build_flux_script(self, queries: Dict[str, TimeSeriesQuery]) -> str:
+        """Combine several queries into one script, each yielding a named result"""
+        return "\n\n".join(
+            f"{self._build_flux_query(query)}\n  |> yield(name: {_flux_string(name)})"
+            for name, query in queries.items()
+        )
+    
+    async def query_wide(self, queries: Dict[str, TimeSeriesQuery]) -> Dict[str, List[WideRow]]:
+        """Run several queries in one round trip; returns rows per query name"""
+        if not self.client or not self.query_api:
+            logger.warning("InfluxDB not available for querying")
+            return {}
+        
+        try:
+            tables = await self.query_api.query(self._build_flux_script(queries), org=self.org)
+        except Exception as e:
+            logger.error(f"Failed to query InfluxDB: {e}")
+            return {}
+        
+        results: Dict[str, List[WideRow]] = {name: [] for name in queries}
+        for table in tables:
+            for record in table.records:
+                results.setdefault(record.values.get("result"), []).append(self._to_wide_row(record.values))
+        return results
+    
+    @staticmethod
+    def _to_wide_row(values: Dict[str, Any]) -> WideRow:
+        """Split a result record into tags (strings) and field values"""
+        row = WideRow(time=values.get("_time"), tags={}, values={})
+        for column, value in values.items():
+            if column in _META_COLUMNS:
+                continue
+            if column == "_field":
+                # Not pivoted: one field per record
+                row.values[value] = values.get("_value")
+            elif column == "_value":
+                continue
+            elif isinstance(value, str):
+                row.tags[column.lstrip("_")] = value
+            else:
+                row.values[column] = value
+        return row
+    
     def _format_time(self, dt: datetime) -> str:
         """Format datetime for Flux query"""
         if dt.tzinfo is None:
@@ -214,29 +419,24 @@ class InfluxDBClient:
         end_time = datetime.now(timezone.utc)
         start_time = end_time - timedelta(hours=hours)
         
+        measurements = ["resource_metrics", "performance_metrics", "ai_metrics"]
         summary = {
             "agent_id": agent_id,
             "time_period": f"{hours}h",
-            "resource_metrics": {},
-            "performance_metrics": {},
-            "ai_metrics": {}
+            **{measurement: {} for measurement in measurements}
         }
         
-        # Query each metric type
-        for measurement in ["resource_metrics", "performance_metrics", "ai_metrics"]:
-            query = TimeSeriesQuery(
-                measurement=measurement,
-                start_time=start_time,
-                end_time=end_time,
-                agent_id=agent_id,
-                aggregation="mean"
-            )
-            
-            results = await self.query_agent_metrics(query)
-            for result in results:
-                field_name = result["field"]
-                value = result["value"]
-                summary[measurement][field_name] = value
+        # One pivoted row of means per measurement
+        results = await self.query_wide({"summary": TimeSeriesQuery(
+            measurement=measurements,
+            start_time=start_time,
+            end_time=end_time,
+            agent_id=agent_id,
+            aggregation="mean",
+            pivot=True
+        )})
+        for row in results.get("summary", []):
+            summary.setdefault(row.tags.get("measurement"), {}).update(row.values)
         
         return summary
     
@@ -255,32 +455,109 @@ class InfluxDBClient:
             "error_rate": 0
         }
         
-        # Count unique agents
-        agent_query = TimeSeriesQuery(
-            measurement="resource_metrics",
-            start_time=start_time,
-            end_time=end_time,
-            fields=["cpu_usage_percent"]
-        )
+        # Everything is aggregated by InfluxDB in a single script
+        results = await self.query_wide({
+            # Fleet-wide means, one wide row
+            "fleet": TimeSeriesQuery(
+                measurement=["resource_metrics", "performance_metrics"],
+                start_time=start_time,
+                end_time=end_time,
+                fields=["cpu_usage_percent", "memory_usage_percent", "average_response_time_ms", "error_rate"],
+                aggregation="mean",
+                group_by=[],
+                pivot=True
+            ),
+            # tasks_completed is a running count: latest value per agent, summed
+            "tasks": TimeSeriesQuery(
+                measurement="performance_metrics",
+                start_time=start_time,
+                end_time=end_time,
+                fields=["tasks_completed"],
+                aggregation="last",
+                group_by=[],
+                rollup="sum",
+                pivot=True
+            ),
+            # One series per agent, so counting per-agent values counts agents
+            "agents": TimeSeriesQuery(
+                measurement="resource_metrics",
+                start_time=start_time,
+                end_time=end_time,
+                fields=["cpu_usage_percent"],
+                aggregation="last",
+                group_by=[],
+                rollup="count",
+                pivot=True
+            ),
+        })
+        
+        def first_value(name: str, field: str):
+            rows = results.get(name)
+            return rows[0].values.get(field) if rows else None
         
-        results = await self.query_agent_metrics(agent_query)
-        unique_agents = set()
-        cpu_values = []
+        overview["total_agents"] = int(first_value("agents", "cpu_usage_percent") or 0)
+        overview["total_tasks_completed"] = int(first_value("tasks", "tasks_completed") or 0)
+        for key, field in (
+            ("avg_cpu_usage", "cpu_usage_percent"),
+            ("avg_memory_usage", "memory_usage_percent"),
+            ("avg_response_time", "average_response_time_ms"),
+            ("error_rate", "error_rate"),
+        ):
+            value = first_value("fleet", field)
+            if value is not None:
+                overview[key] = value
+        
+        return overview
+    
+    async def downsample(self, source: str, target: str, resolution: int, start: datetime, stop: datetime) -> int:
+        """Write per-window means of ``source`` over [start, stop) to ``target`` inside InfluxDB.
         
-        for result in results:
-            if result["agent_id"]:
-                unique_agents.add(result["agent_id"])
-            if result["value"] is not None:
-                cpu_values.append(result["value"])
+        Returns the number of points written. Rollup points are labeled with
+        the start of their window.
+        """
+        if not self.client or not self.query_api:
+            return 0
         
-        overview["total_agents"] = len(unique_agents)
-        if cpu_values:
-            overview["avg_cpu_usage"] = sum(cpu_values) / len(cpu_values)
+        flux = '\n  '.join([
+            f'from(bucket: {_flux_string(self.bucket)})',
+            f'|> range(start: {self._format_time(start)}, stop: {self._format_time(stop)})',
+            f'|> filter(fn: (r) => r["_measurement"] == {_flux_string(source)})',
+            f'|> aggregateWindow(every: {resolution}s, fn: mean, timeSrc: "_start", createEmpty: false)',
+            f'|> set(key: "_measurement", value: {_flux_string(target)})',
+            f'|> to(bucket: {_flux_string(self.bucket)}, org: {_flux_string(self.org)})',
+            # Only report how much was written, not the points themselves
+            '|> count()',
+        ])
+        tables = await self.query_api.query(flux, org=self.org)
+        return int(sum(record.get_value() or 0 for table in tables for record in table.records))
+    
+    async def last_point_time(self, measurement: str) -> Optional[datetime]:
+        """Time of the newest point in a measurement, or None if it is empty"""
+        if not self.client or not self.query_api:
+            return None
         
-        # Similar queries for other metrics...
-        # (Simplified for demo)
+        flux = '\n  '.join([
+            f'from(bucket: {_flux_string(self.bucket)})',
+            '|> range(start: 0)',
+            f'|> filter(fn: (r) => r["_measurement"] == {_flux_string(measurement)})',
+            '|> keep(columns: ["_time"])',
+            '|> group()',
+            '|> max(column: "_time")',
+        ])
+        tables = await self.query_api.query(flux, org=self.org)
+        times = [record.get_time() for table in tables for record in table.records]
+        return max(times) if times else None
+    
+    async def drop_before(self, measurement: str, cutoff: datetime):
+        """Delete a measurement's points older than ``cutoff``"""
+        if not self.client:
+            return
         
-        return overview
+        delete_api = self.client.delete_api()
+        await delete_api.delete(
+            "1970-01-01T00:00:00Z", self._format_time(cutoff),
+            f'_measurement="{measurement}"', bucket=self.bucket, org=self.org
+        )
     
     async def cleanup_old_data(self, days: int = 90):
         """Delete data older than specified days"""
@@ -299,7 +576,7 @@ class InfluxDBClient:
             await delete_api.delete(start, stop, '_measurement="custom_metrics"', bucket=self.bucket, org=self.org)
             
             logger.info(f"Cleaned up data older than {days} days")
-            
+        
         except Exception as e:
             logger.error(f"Failed to cleanup old data: {e}")
 
@@ -0,0 +1,547 @@
+"""
+Embedded file-backed time-series store used when InfluxDB is not deployed.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from collections import defaultdict
+from dataclasses import replace
+from datetime import datetime, timezone, timedelta
+from typing import List, Dict, Any, Optional, Tuple, Iterator, AsyncIterator, Callable
+
+from src.config import settings
+from src.database.influx_client import TimeSeriesQuery, WideRow
+from src.models import AgentMetrics
+
+logger = logging.getLogger(__name__)
+
+# One fixed-size record per point: timestamp (epoch s), agent index, field index, value
+RECORD = struct.Struct("<dIId")
+
+MEASUREMENTS = ("resource_metrics", "performance_metrics", "ai_metrics", "custom_metrics")
+
+_WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+AGGREGATIONS = {
+    "mean": lambda values: sum(values) / len(values),
+    "max": max,
+    "min": min,
+    "sum": sum,
+    "count": len,
+    "last": lambda values: values[-1],
+    "first": lambda values: values[0],
+}
+
+# A point ready to be stored: (measurement, agent_id, field, epoch seconds, value)
+LocalRecord = Tuple[str, str, str, float, float]
+
+
+def parse_window(window: str) -> int:
+    """Parse a Flux-style duration (30s, 5m, 1h, 1d) into seconds"""
+    match = re.fullmatch(r"(\d+)([smhdw])", window.strip())
+    if not match:
+        raise ValueError(f"Unsupported window: {window}")
+    return int(match.group(1)) * _WINDOW_UNITS[match.group(2)]
+
+
+def _epoch(dt: datetime) -> float:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class _NameDictionary:
+    """Append-only string <-> integer dictionary persisted as JSON lines"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self._add(json.loads(line))
+        self._file = open(path, "a", encoding="utf-8")
+    
+    def _add(self, name: str) -> int:
+        self.ids[name] = len(self.names)
+        self.names.append(name)
+        return self.ids[name]
+    
+    def get_or_add(self, name: str) -> int:
+        idx = self.ids.get(name)
+        if idx is None:
+            idx = self._add(name)
+            self._file.write(json.dumps(name) + "\n")
+            self._file.flush()
+        return idx
+    
+    def close(self):
+        self._file.close()
+
+
+class LocalTimeSeriesStore:
+    """Embedded time-series store with the same query surface as InfluxDBClient.
+    
+    Points are appended to fixed-size binary segment files, one directory per
+    measurement and one segment per time partition
+    (``<root>/<measurement>/<partition start>.seg``). The partition start times
+    form the time index: queries only open the segments overlapping the
+    requested range and read them through ``mmap``. Agent IDs and field names
+    are dictionary-encoded so every point is a 24 byte record. Retention drops
+    whole partitions. Queries over several measurements or agents, group_by,
+    rollup and pivot (``query_wide``) behave like their Flux counterparts.
+    """
+    
+    def __init__(self, path: Optional[str] = None, partition_seconds: Optional[int] = None):
+        self.path = path or settings.database.local_tsdb_path
+        self.partition_seconds = partition_seconds or settings.database.local_tsdb_partition_seconds
+        self._lock = threading.Lock()
+        self._agents: Optional[_NameDictionary] = None
+        self._fields: Optional[_NameDictionary] = None
+        self._partitions: Dict[str, List[int]] = {}
+        self._open_segments: Dict[Tuple[str, int], Any] = {}
+    
+    @property
+    def is_available(self) -> bool:
+        """Whether the store is open for reads and writes"""
+        return self._agents is not None
+    
+    async def initialize(self):
+        """Open (or create) the store on disk"""
+        await asyncio.to_thread(self._open)
+        logger.info(f"Local time-series store initialized at {self.path}")
+    
+    def _open(self):
+        with self._lock:
+            if self._agents is not None:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            self._agents = _NameDictionary(os.path.join(self.path, "agents.dict"))
+            self._fields = _NameDictionary(os.path.join(self.path, "fields.dict"))
+            for measurement in MEASUREMENTS:
+                os.makedirs(os.path.join(self.path, measurement), exist_ok=True)
+            # Raw measurements plus any rollup tiers written by the compactor
+            for measurement in os.listdir(self.path):
+                directory = os.path.join(self.path, measurement)
+                if not os.path.isdir(directory):
+                    continue
+                self._partitions[measurement] = sorted(
+                    int(name[:-4]) for name in os.listdir(directory) if name.endswith(".seg")
+                )
+    
+    async def close(self):
+        """Close open segment files"""
+        with self._lock:
+            for f in self._open_segments.values():
+                f.close()
+            self._open_segments.clear()
+            if self._agents:
+                self._agents.close()
+                self._fields.close()
+            self._agents = self._fields = None
+    
+    def metrics_to_records(self, metrics: AgentMetrics) -> List[LocalRecord]:
+        """Flatten AgentMetrics into storable points"""
+        timestamp = _epoch(metrics.timestamp)
+        agent_id = metrics.agent_id
+        groups = [
+            ("resource_metrics", metrics.resource_metrics.model_dump() if metrics.resource_metrics else None),
+            ("performance_metrics", metrics.performance_metrics.model_dump() if metrics.performance_metrics else None),
+            ("ai_metrics", metrics.ai_metrics.model_dump() if metrics.ai_metrics else None),
+            ("custom_metrics", metrics.custom_metrics),
+        ]
+        
+        records = []
+        for measurement, values in groups:
+            if not values:
+                continue
+            for field, value in values.items():
+                if value is None:
+                    continue
+                try:
+                    number = float(value)
+                except (ValueError, TypeError):
+                    # Skip non-numeric custom metrics
+                    continue
+                if math.isfinite(number):
+                    records.append((measurement, agent_id, field, timestamp, number))
+        return records
+    
+    async def write_records(self, records: List[LocalRecord]) -> bool:
+        """Append a batch of points"""
+        if not self.is_available:
+            return False
+        
+        try:
+            await asyncio.to_thread(self._append, records)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to write {len(records)} points to local store: {e}")
+            return False
+    
+    async def write_agent_metrics(self, metrics: AgentMetrics) -> bool:
+        """Write agent metrics to the local store"""
+        return await self.write_records(self.metrics_to_records(metrics))
+    
+    def _append(self, records: List[LocalRecord]):
+        buffers: Dict[Tuple[str, int], bytearray] = defaultdict(bytearray)
+        pack = RECORD.pack
+        partition_seconds = self.partition_seconds
+        
+        with self._lock:
+            agent_ids = self._agents.get_or_add
+            field_ids = self._fields.get_or_add
+            for measurement, agent_id, field, timestamp, value in records:
+                partition = int(timestamp // partition_seconds) * partition_seconds
+                buffers[(measurement, partition)] += pack(timestamp, agent_ids(agent_id), field_ids(field), value)
+            
+            for key, data in buffers.items():
+                self._segment_file(*key).write(data)
+            for key in buffers:
+                self._open_segments[key].flush()
+    
+    def _segment_path(self, measurement: str, partition: int) -> str:
+        return os.path.join(self.path, measurement, f"{partition}.seg")
+    
+    def _segment_file(self, measurement: str, partition: int):
+        key = (measurement, partition)
+        f = self._open_segments.get(key)
+        if f is None:
+            if measurement not in self._partitions:
+                os.makedirs(os.path.join(self.path, measurement), exist_ok=True)
+                self._partitions[measurement] = []
+            partitions = self._partitions[measurement]
+            if partition not in partitions:
+                partitions.append(partition)
+                partitions.sort()
+            
+            # Keep only the most recent partitions open for appends
+            if len(self._open_segments) >= 32:
+                oldest = min(self._open_segments, key=lambda k: k[1])
+                self._open_segments.pop(oldest).close()
+            
+            f = open(self._segment_path(measurement, partition), "ab")
+            # Cut a record torn by a crash mid-append, so new records stay aligned
+            torn = f.tell() % RECORD.size
+            if torn:
+                f.truncate(f.tell() - torn)
+            self._open_segments[key] = f
+        return f
+    
+    async def query_agent_metrics(self, query: TimeSeriesQuery) -> List[Dict[str, Any]]:
+        """Query time-series metrics data"""
+        if not self.is_available:
+            logger.warning("Local time-series store not available for querying")
+            return []
+        
+        try:
+            return await asyncio.to_thread(self._query, query)
+        except Exception as e:
+            logger.error(f"Failed to query local time-series store: {e}")
+            return []
+    
+    async def stream_agent_metrics(
+        self,
+        query: TimeSeriesQuery,
+        chunk_size: int = 5000
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Query time-series metrics data, yielding rows in chunks of ``chunk_size``.
+        
+        Raw queries hold at most one partition's matches in memory at a time;
+        aggregated results are small and are computed in one go.
+        """
+        if not self.is_available:
+            logger.warning("Local time-series store not available for querying")
+            return
+        
+        if query.aggregation:
+            rows = await asyncio.to_thread(self._query, query)
+            for i in range(0, len(rows), chunk_size):
+                yield rows[i:i + chunk_size]
+            return
+        
+        for measurement in query.measurements:
+            records = self._scan(replace(query, measurement=measurement))
+            row = self._row_factory(measurement)
+            while True:
+                chunk = await asyncio.to_thread(
+                    lambda: [row(*record) for record in itertools.islice(records, chunk_size)]
+                )
+                if not chunk:
+                    break
+                yield chunk
+    
+    def _scan(self, query: TimeSeriesQuery) -> Iterator[Tuple[float, int, int, float]]:
+        """Yield matching raw records (timestamp, agent idx, field idx, value) in time order.
+        
+        Reads a single measurement; callers split multi-measurement queries.
+        """
+        measurements = query.measurements
+        if len(measurements) != 1:
+            raise ValueError(f"Scans read one measurement at a time, got {measurements}")
+        measurement = measurements[0]
+        start = _epoch(query.start_time)
+        stop = _epoch(query.end_time) if query.end_time else float("inf")
+        
+        with self._lock:
+            partitions = list(self._partitions.get(measurement, []))
+            agent_idx = None
+            if query.agent_ids:
+                agent_idx = {self._agents.ids[a] for a in query.agent_ids if a in self._agents.ids}
+            field_idx = None
+            if query.fields:
+                field_idx = {self._fields.ids[f] for f in query.fields if f in self._fields.ids}
+        
+        if (query.agent_ids and not agent_idx) or (query.fields and not field_idx):
+            return
+        
+        for partition in partitions:
+            if partition + self.partition_seconds <= start or partition >= stop:
+                continue
+            path = self._segment_path(measurement, partition)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            size -= size % RECORD.size  # ignore a partially written trailing record
+            if size == 0:
+                continue
+            
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)[:size]
+                try:
+                    records = [
+                        record for record in RECORD.iter_unpack(view)
+                        if start <= record[0] < stop
+                        and (agent_idx is None or record[1] in agent_idx)
+                        and (field_idx is None or record[2] in field_idx)
+                    ]
+                finally:
+                    view.release()
+            records.sort(key=lambda record: record[0])
+            yield from records
+    
+    def _row_factory(self, measurement: str) -> Callable[[float, int, int, float], Dict[str, Any]]:
+        """Build result rows (same shape as InfluxDBClient) from raw records"""
+        agent_names = self._agents.names
+        field_names = self._fields.names
+        
+        def row(timestamp, agent, field, value):
+            return {
+                "time": datetime.fromtimestamp(timestamp, timezone.utc),
+                "agent_id": agent_names[agent],
+                "measurement": measurement,
+                "field": field_names[field],
+                "value": value
+            }
+        return row
+    
+    def _query(self, query: TimeSeriesQuery) -> List[Dict[str, Any]]:
+        measurements = query.measurements
+        if not query.aggregation:
+            results = []
+            for measurement in measurements:
+                row = self._row_factory(measurement)
+                results.extend(row(*record) for record in self._scan(replace(query, measurement=measurement)))
+            if len(measurements) > 1:
+                results.sort(key=lambda r: r["time"])
+            return results
+        
+        aggregate = AGGREGATIONS.get(query.aggregation)
+        rollup = AGGREGATIONS.get(query.rollup) if query.rollup else None
+        if aggregate is None or (query.rollup and rollup is None):
+            raise ValueError(f"Unsupported aggregation: {query.rollup if aggregate else query.aggregation}")
+        
+        # Series key columns; group_by keeps only the listed ones (plus the field)
+        group_by = query.group_by
+        keep_measurement = group_by is None or "measurement" in group_by or "_measurement" in group_by
+        keep_agent = group_by is None or "agent_id" in group_by
+        
+        window = parse_window(query.window) if query.window else None
+        series: Dict[Tuple[str, int, int, float], List[float]] = defaultdict(list)
+        for measurement in measurements:
+            for timestamp, agent, field, value in self._scan(replace(query, measurement=measurement)):
+                # Like aggregateWindow, label each window by its stop time
+                bucket = (timestamp // window + 1) * window if window else 0.0
+                series[(measurement, agent, field, bucket)].append(value)
+        
+        groups: Dict[Tuple[Optional[str], Optional[int], int, float], List[float]] = defaultdict(list)
+        for (measurement, agent, field, bucket), values in series.items():
+            key = (measurement if keep_measurement else None, agent if keep_agent else None, field, bucket)
+            if rollup:
+                # Aggregate each series first, then combine the results per group
+                groups[key].append(aggregate(values))
+            else:
+                groups[key].extend(values)
+        
+        combine = rollup or aggregate
+        agent_names = self._agents.names
+        field_names = self._fields.names
+        stop = _epoch(query.end_time) if query.end_time else datetime.now(timezone.utc).timestamp()
+        results = [
+            {
+                "time": datetime.fromtimestamp(bucket if window else stop, timezone.utc),
+                "agent_id": agent_names[agent] if agent is not None else None,
+                "measurement": measurement,
+                "field": field_names[field],
+                "value": combine(values)
+            }
+            for (measurement, agent, field, bucket), values in groups.items()
+        ]
+        results.sort(key=lambda r: r["time"])
+        return results
+    
+    async def query_wide(self, queries: Dict[str, TimeSeriesQuery]) -> Dict[str, List[WideRow]]:
+        """Run several queries; returns rows per query name (pivoted where asked)"""
+        if not self.is_available:
+            logger.warning("Local time-series store not available for querying")
+            return {}
+        
+        try:
+            return await asyncio.to_thread(
+                lambda: {name: self._wide_rows(query) for name, query in queries.items()}
+            )
+        except Exception as e:
+            logger.error(f"Failed to query local time-series store: {e}")
+            return {}
+    
+    def _wide_rows(self, query: TimeSeriesQuery) -> List[WideRow]:
+        rows = []
+        by_series: Dict[Tuple[datetime, Optional[str], Optional[str]], WideRow] = {}
+        for result in self._query(query):
+            tags = {k: result[k] for k in ("measurement", "agent_id") if result[k] is not None}
+            if not query.pivot:
+                rows.append(WideRow(time=result["time"], tags=tags, values={result["field"]: result["value"]}))
+                continue
+            key = (result["time"], result["measurement"], result["agent_id"])
+            row = by_series.get(key)
+            if row is None:
+                row = by_series[key] = WideRow(time=result["time"], tags=tags, values={})
+                rows.append(row)
+            row.values[result["field"]] = result["value"]
+        return rows
+    
+    async def get_agent_metrics_summary(self, agent_id: str, hours: int = 24) -> Dict[str, Any]:
+        """Get summary metrics for an agent over the specified time period"""
+        end_time = datetime.now(timezone.utc)
+        start_time = end_time - timedelta(hours=hours)
+        
+        summary = {
+            "agent_id": agent_id,
+            "time_period": f"{hours}h",
+            "resource_metrics": {},
+            "performance_metrics": {},
+            "ai_metrics": {}
+        }
+        
+        for measurement in ["resource_metrics", "performance_metrics", "ai_metrics"]:
+            query = TimeSeriesQuery(
+                measurement=measurement,
+                start_time=start_time,
+                end_time=end_time,
+                agent_id=agent_id,
+                aggregation="mean"
+            )
+            for result in await self.query_agent_metrics(query):
+                summary[measurement][result["field"]] = result["value"]
+        
+        return summary
+    
+    async def downsample(self, source: str, target: str, resolution: int, start: datetime, stop: datetime) -> int:
+        """Write per-window means of ``source`` over [start, stop) to ``target``; returns points written"""
+        if not self.is_available:
+            return 0
+        return await asyncio.to_thread(self._downsample, source, target, resolution, start, stop)
+    
+    def _downsample(self, source: str, target: str, resolution: int, start: datetime, stop: datetime) -> int:
+        sums: Dict[Tuple[int, int, float], List[float]] = {}
+        for timestamp, agent, field, value in self._scan(TimeSeriesQuery(source, start, stop)):
+            # Rollup points are labeled with the start of their window
+            key = (agent, field, timestamp // resolution * resolution)
+            total = sums.get(key)
+            if total is None:
+                sums[key] = [value, 1]
+            else:
+                total[0] += value
+                total[1] += 1
+        
+        agent_names = self._agents.names
+        field_names = self._fields.names
+        records = [
+            (target, agent_names[agent], field_names[field], window, total / count)
+            for (agent, field, window), (total, count) in sums.items()
+        ]
+        if records:
+            self._append(records)
+        return len(records)
+    
+    async def last_point_time(self, measurement: str) -> Optional[datetime]:
+        """Time of the newest point in a measurement, or None if it is empty"""
+        if not self.is_available:
+            return None
+        return await asyncio.to_thread(self._last_point_time, measurement)
+    
+    def _last_point_time(self, measurement: str) -> Optional[datetime]:
+        with self._lock:
+            partitions = list(self._partitions.get(measurement, []))
+        
+        for partition in reversed(partitions):
+            newest = None
+            query = TimeSeriesQuery(measurement, datetime.fromtimestamp(partition, timezone.utc))
+            for timestamp, _, _, _ in self._scan(query):
+                newest = timestamp
+            if newest is not None:
+                return datetime.fromtimestamp(newest, timezone.utc)
+        return None
+    
+    async def drop_before(self, measurement: str, cutoff: datetime) -> int:
+        """Drop a measurement's partitions that end before ``cutoff``; returns segments removed"""
+        if not self.is_available:
+            return 0
+        return await asyncio.to_thread(self._drop_partitions_before, _epoch(cutoff), [measurement])
+    
+    async def cleanup_old_data(self, days: int = 90):
+        """Delete data older than specified days"""
+        if not self.is_available:
+            logger.warning("Local time-series store not available for cleanup")
+            return
+        
+        try:
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).timestamp()
+            removed = await asyncio.to_thread(self._drop_partitions_before, cutoff)
+            logger.info(f"Cleaned up {removed} local segments older than {days} days")
+        except Exception as e:
+            logger.error(f"Failed to cleanup old data: {e}")
+    
+    def _drop_partitions_before(self, cutoff: float, measurements: Optional[List[str]] = None) -> int:
+        removed = 0
+        with self._lock:
+            for measurement in measurements or list(self._partitions):
+                partitions = self._partitions.get(measurement, [])
+                expired = [p for p in partitions if p + self.partition_seconds <= cutoff]
+                for partition in expired:
+                    f = self._open_segments.pop((measurement, partition), None)
+                    if f:
+                        f.close()
+                    try:
+                        os.remove(self._segment_path(measurement, partition))
+                    except FileNotFoundError:
+                        pass
+                    partitions.remove(partition)
+                    removed += 1
+        return removed
+
+
+# Global local time-series store instance
+local_tsdb = LocalTimeSeriesStore()
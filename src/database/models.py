@@ -108,6 +108,7 @@ class Agent(Base):
         Index('idx_agent_environment', 'environment'),
         Index('idx_agent_host', 'host'),
         Index('idx_agent_last_heartbeat', 'last_heartbeat'),
+        Index('idx_agent_created_at_id', 'created_at', 'id'),  # keyset listing order
     )
 
 
@@ -5,7 +5,7 @@ Core data models for the Agent Monitor Framework.
 from datetime import datetime
 from enum import Enum
 from typing import Dict, List, Optional, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from uuid import UUID, uuid4
 
 
@@ -104,6 +104,12 @@ class PerformanceMetrics(BaseModel):
     error_rate: float = Field(default=0.0, ge=0.0, le=1.0)
     success_rate: float = Field(default=1.0, ge=0.0, le=1.0)
     uptime_seconds: int = Field(default=0, ge=0)
+    
+    # Response time distribution over the reporting interval
+    response_time_p50_ms: Optional[float] = Field(None, ge=0.0)
+    response_time_p90_ms: Optional[float] = Field(None, ge=0.0)
+    response_time_p99_ms: Optional[float] = Field(None, ge=0.0)
+    response_time_max_ms: Optional[float] = Field(None, ge=0.0)
 
 
 class AIMetrics(BaseModel):
@@ -134,6 +140,44 @@ class AgentMetrics(BaseModel):
     # Health indicators
     health_checks: Dict[str, bool] = Field(default_factory=dict)
     alerts: List[str] = Field(default_factory=list)
+    
+    # Mergeable quantile sketches (QuantileSketch.to_dict) covering the reporting interval
+    sketches: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
+
+
+class AgentConfigUpdate(BaseModel):
+    """Config changes pushed to an agent; omitted fields keep their current value"""
+    model_config = ConfigDict(extra="forbid")
+    
+    metrics_interval: Optional[float] = Field(
+        None, gt=0, strict=True, allow_inf_nan=False, description="Seconds between metrics reports"
+    )
+    heartbeat_interval: Optional[float] = Field(
+        None, gt=0, strict=True, allow_inf_nan=False, description="Seconds between heartbeats"
+    )
+    
+    @field_validator("metrics_interval", "heartbeat_interval", mode="before")
+    @classmethod
+    def _not_null(cls, value):
+        # Omit a field to leave it unchanged; null is not a valid interval
+        if value is None:
+            raise ValueError("interval must be a positive number")
+        return value
+
+
+class MetricsBatch(BaseModel):
+    """Batch of metrics samples, possibly spanning many agents"""
+    metrics: List[AgentMetrics] = Field(..., description="Metrics samples to ingest")
+
+
+class MetricsBatchResponse(BaseModel):
+    """Response after batch metrics ingestion"""
+    status: str
+    accepted: int
+    rejected: int
+    agents: int = Field(..., description="Number of distinct agents accepted")
+    unknown_agents: List[str] = Field(default_factory=list)
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
 
 
 class HealthCheck(BaseModel):
@@ -194,10 +238,19 @@ class MetricsQuery(BaseModel):
     interval: Optional[str] = Field(None, description="Time interval for aggregation")
 
 
+class MetricsSeries(BaseModel):
+    """Columnar query result for one agent: shared timestamps plus one array per metric"""
+    agent_id: str
+    source: str = Field(..., description="Where the data came from: 'memory' or 'store'")
+    tier: Optional[str] = Field(None, description="Retention tier read from the store ('raw', '1m', '1h')")
+    timestamps: List[datetime] = Field(default_factory=list)
+    values: Dict[str, List[Optional[float]]] = Field(default_factory=dict)
+
+
 class MetricsResponse(BaseModel):
     """Response for metrics queries"""
     query: MetricsQuery
     total_points: int
     agents: List[str]
     time_range: Dict[str, datetime]
-    data: List[Dict[str, Any]]
\ No newline at end of file
+    data: List[MetricsSeries]
\ No newline at end of file
@@ -0,0 +1,238 @@
+"""
+Columnar ring buffer for recent agent metrics.
+"""
+
+import math
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Iterable, Any
+
+from ..models import AgentMetrics, ResourceMetrics, PerformanceMetrics, AIMetrics
+
+
+# Numeric columns per metrics group, in model field order
+RESOURCE_FIELDS = tuple(ResourceMetrics.model_fields)
+PERFORMANCE_FIELDS = tuple(PerformanceMetrics.model_fields)
+AI_FIELDS = tuple(AIMetrics.model_fields)
+NUMERIC_FIELDS = RESOURCE_FIELDS + PERFORMANCE_FIELDS + AI_FIELDS
+
+_INT_FIELDS = frozenset(
+    name
+    for model in (ResourceMetrics, PerformanceMetrics, AIMetrics)
+    for name, field in model.model_fields.items()
+    if int in (field.annotation, *getattr(field.annotation, "__args__", ()))
+)
+
+_NAN = float("nan")
+
+# Slots allocated for a new buffer; columns double from here up to capacity
+_INITIAL_SLOTS = 16
+
+
+def _to_epoch(timestamp: datetime) -> float:
+    """Convert a (naive UTC or aware) datetime to epoch seconds"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def _from_epoch(epoch: float) -> datetime:
+    """Convert epoch seconds back to a naive UTC datetime"""
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None)
+
+
+class MetricsRingBuffer:
+    """Fixed-capacity, per-agent columnar store of recent metrics samples.
+    
+    Every numeric field of ResourceMetrics, PerformanceMetrics and AIMetrics
+    gets its own ``array('d')`` column, plus a timestamp column. Columns start
+    small and double as samples arrive, so idle agents stay cheap. Missing
+    optional values are stored as NaN. Fully grown columns carry a small
+    slack region past the capacity; when writes reach the end, the live
+    window is compacted back to the front. The most recent samples are therefore always
+    contiguous and can be returned as zero-copy ``memoryview`` slices, valid
+    until the next append. Samples are kept in timestamp order: a late one
+    (e.g. replayed from an agent's spool) is inserted in place, or dropped if
+    it is older than everything a full buffer retains.
+    
+    Non-numeric payload (custom metrics, health checks, alerts) is kept in a
+    side list so full ``AgentMetrics`` objects can be materialized on request.
+    Consecutive identical payloads share one object. Quantile sketches are
+    not kept: they are merged into the aggregate windows on ingest and
+    differ on every report, so materialized samples carry none.
+    """
+    
+    def __init__(self, agent_id: str, capacity: int = 1000):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        
+        self.agent_id = agent_id
+        self.capacity = capacity
+        self._size = capacity + max(1, capacity // 4)
+        self._end = 0  # one past the most recent sample
+        self._count = 0
+        
+        slots = min(self._size, _INITIAL_SLOTS)
+        self._timestamps = array("d", bytes(8 * slots))
+        self._columns: Dict[str, array] = {
+            name: array("d", bytes(8 * slots)) for name in NUMERIC_FIELDS
+        }
+        self._extras: List[Optional[tuple]] = [None] * slots
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def append(self, metrics: AgentMetrics):
+        """Append one sample, dropping the oldest when full"""
+        timestamp = _to_epoch(metrics.timestamp)
+        if self._count and timestamp < self._timestamps[self._end - 1]:
+            self._insert(metrics, timestamp)
+            return
+        
+        self._reserve()
+        self._write(metrics, timestamp, self._end)
+        self._end += 1
+        self._count = min(self._count + 1, self.capacity)
+    
+    def _insert(self, metrics: AgentMetrics, timestamp: float):
+        """Insert a sample older than the latest one at its place in time order"""
+        if self._count == self.capacity and timestamp < self._timestamps[self._end - self._count]:
+            return  # Older than everything retained; it would be evicted right away
+        self._reserve()
+        start = self._end - self._count
+        index = bisect_right(memoryview(self._timestamps)[start:self._end], timestamp) + start
+        
+        # Shift the newer samples up one slot
+        end = self._end
+        self._timestamps[index + 1:end + 1] = self._timestamps[index:end]
+        for column in self._columns.values():
+            column[index + 1:end + 1] = column[index:end]
+        self._extras[index + 1:end + 1] = self._extras[index:end]
+        
+        self._write(metrics, timestamp, index)
+        self._end = end + 1
+        self._count = min(self._count + 1, self.capacity)
+    
+    def _write(self, metrics: AgentMetrics, timestamp: float, index: int):
+        """Store one sample's values in slot ``index``"""
+        self._timestamps[index] = timestamp
+        self._write_group(metrics.resource_metrics, RESOURCE_FIELDS, index)
+        self._write_group(metrics.performance_metrics, PERFORMANCE_FIELDS, index)
+        self._write_group(metrics.ai_metrics, AI_FIELDS, index)
+        
+        extras = None
+        if metrics.custom_metrics or metrics.health_checks or metrics.alerts:
+            extras = (metrics.custom_metrics, metrics.health_checks, metrics.alerts)
+            previous = self._extras[index - 1] if index > self._end - self._count else None
+            if previous == extras:
+                extras = previous
+        self._extras[index] = extras
+    
+    def _reserve(self):
+        """Make room for one more slot past the most recent sample"""
+        if self._end == self._size:
+            self._compact()
+        elif self._end == len(self._timestamps):
+            self._grow()
+    
+    def _grow(self):
+        """Double the columns (up to capacity plus slack)"""
+        extra = min(self._size, 2 * len(self._timestamps)) - len(self._timestamps)
+        zeros = bytes(8 * extra)
+        self._timestamps.frombytes(zeros)
+        for column in self._columns.values():
+            column.frombytes(zeros)
+        self._extras.extend([None] * extra)
+    
+    def _compact(self):
+        """Move the retained window (minus the slot about to be evicted) to the front"""
+        keep = self.capacity - 1
+        start = self._end - keep
+        self._timestamps[0:keep] = self._timestamps[start:self._end]
+        for column in self._columns.values():
+            column[0:keep] = column[start:self._end]
+        self._extras[0:keep] = self._extras[start:self._end]
+        self._end = keep
+        self._count = min(self._count, keep)
+    
+    def _write_group(self, group: Any, fields: Iterable[str], index: int):
+        """Write one metrics sub-model into its columns"""
+        for name in fields:
+            value = getattr(group, name, None) if group is not None else None
+            self._columns[name][index] = _NAN if value is None else float(value)
+    
+    def _window_size(self, limit: Optional[int]) -> int:
+        if limit is None:
+            return self._count
+        return max(0, min(limit, self._count))
+    
+    def timestamps(self, limit: Optional[int] = None) -> memoryview:
+        """Zero-copy view of the most recent timestamps (epoch seconds), oldest first"""
+        return memoryview(self._timestamps)[self._end - self._window_size(limit):self._end]
+    
+    def column(self, name: str, limit: Optional[int] = None) -> memoryview:
+        """Zero-copy view of the most recent values for a field, oldest first"""
+        if name not in self._columns:
+            raise KeyError(f"Unknown metrics field: {name}")
+        return memoryview(self._columns[name])[self._end - self._window_size(limit):self._end]
+    
+    def columns(self, names: Optional[Iterable[str]] = None, limit: Optional[int] = None) -> Dict[str, memoryview]:
+        """Zero-copy views for several fields over the same window"""
+        return {name: self.column(name, limit) for name in (names or NUMERIC_FIELDS)}
+    
+    def custom_column(self, name: str, limit: Optional[int] = None) -> List[float]:
+        """Recent values of a numeric custom metric, oldest first (NaN where missing)"""
+        start = self._end - self._window_size(limit)
+        values = []
+        for extras in self._extras[start:self._end]:
+            value = extras[0].get(name) if extras else None
+            try:
+                values.append(_NAN if value is None else float(value))
+            except (TypeError, ValueError):
+                values.append(_NAN)
+        return values
+    
+    def oldest_timestamp(self) -> Optional[float]:
+        """Epoch seconds of the oldest retained sample, or None if empty"""
+        if not self._count:
+            return None
+        return self._timestamps[self._end - self._count]
+    
+    def latest_value(self, name: str) -> Optional[float]:
+        """Most recent value of a field, or None if empty/missing"""
+        if not self._count:
+            return None
+        value = self._columns[name][self._end - 1]
+        return None if math.isnan(value) else value
+    
+    def materialize(self, limit: Optional[int] = None) -> List[AgentMetrics]:
+        """Rebuild AgentMetrics objects for the most recent samples, oldest first"""
+        start = self._end - self._window_size(limit)
+        return [self._materialize_index(index) for index in range(start, self._end)]
+    
+    def _materialize_index(self, index: int) -> AgentMetrics:
+        def group_values(fields):
+            values = {}
+            for name in fields:
+                value = self._columns[name][index]
+                if math.isnan(value):
+                    continue
+                values[name] = int(value) if name in _INT_FIELDS else value
+            return values
+        
+        ai_values = group_values(AI_FIELDS)
+        extras = self._extras[index]
+        custom_metrics, health_checks, alerts = extras if extras else ({}, {}, [])
+        
+        return AgentMetrics.model_construct(
+            agent_id=self.agent_id,
+            timestamp=_from_epoch(self._timestamps[index]),
+            resource_metrics=ResourceMetrics.model_construct(**group_values(RESOURCE_FIELDS)),
+            performance_metrics=PerformanceMetrics.model_construct(**group_values(PERFORMANCE_FIELDS)),
+            ai_metrics=AIMetrics.model_construct(**ai_values) if ai_values else None,
+            custom_metrics=dict(custom_metrics),
+            health_checks=dict(health_checks),
+            alerts=list(alerts),
+            sketches={}
+        )
@@ -0,0 +1,180 @@
+"""
+Mergeable streaming quantile sketch.
+"""
+
+import math
+import sys
+from typing import Dict, Any, Optional, Iterable
+
+
+class QuantileSketch:
+    """Constant-memory quantile sketch with relative-error guarantees.
+    
+    Values are counted in logarithmically sized buckets (the DDSketch scheme):
+    bucket ``i`` covers ``(gamma**(i-1), gamma**i]`` with
+    ``gamma = (1 + accuracy) / (1 - accuracy)``, so any reported quantile is
+    within ``accuracy`` relative error of the true value. Recording is O(1),
+    and two sketches with the same accuracy merge by adding bucket counts.
+    When more than ``max_buckets`` buckets are in use the lowest ones are
+    collapsed, which only affects accuracy of the smallest values.
+    
+    Only non-negative values are supported (latencies, utilizations, sizes).
+    """
+    
+    def __init__(self, accuracy: float = 0.01, max_buckets: int = 2048):
+        if not 0.0 < accuracy < 1.0:
+            raise ValueError("accuracy must be between 0 and 1")
+        
+        self.accuracy = accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1.0 + accuracy) / (1.0 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        # Bucket keys reachable from positive finite floats
+        self._min_key = self._key(math.ulp(0.0))
+        self._max_key = self._key(sys.float_info.max)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+    
+    def add(self, value: float, count: int = 1):
+        """Record a value (optionally ``count`` times)"""
+        if value < 0 or math.isnan(value):
+            return
+        
+        self.count += count
+        self.sum += value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        
+        if value <= 0.0:
+            self.zero_count += count
+            return
+        
+        key = self._key(value)
+        self.buckets[key] = self.buckets.get(key, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+    
+    def _key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+    
+    def _bucket_value(self, key: int) -> float:
+        """Midpoint of a bucket in relative terms"""
+        # gamma**key itself overflows for the topmost bucket
+        return self._gamma ** (key - 1) * (2.0 * self._gamma / (self._gamma + 1.0))
+    
+    def _collapse(self):
+        """Fold the lowest buckets together to stay within max_buckets"""
+        keys = sorted(self.buckets)
+        excess = len(keys) - self.max_buckets
+        target = keys[excess]
+        for key in keys[:excess]:
+            self.buckets[target] += self.buckets.pop(key)
+    
+    def merge(self, other: "QuantileSketch"):
+        """Merge another sketch into this one.
+        
+        A sketch with a different accuracy is re-bucketed at this sketch's
+        accuracy, which adds the two relative errors for its values.
+        """
+        if not other.count:
+            return
+        
+        if other.accuracy == self.accuracy:
+            for key, count in other.buckets.items():
+                self.buckets[key] = self.buckets.get(key, 0) + count
+        else:
+            for key, count in other.buckets.items():
+                value = min(max(other._bucket_value(key), other.min, math.ulp(0.0)), other.max)
+                key = self._key(value)
+                self.buckets[key] = self.buckets.get(key, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the q-quantile (0.0 - 1.0); None if empty"""
+        if not self.count:
+            return None
+        if q <= 0.0:
+            return self.min
+        if q >= 1.0:
+            return self.max
+        
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return min(max(self._bucket_value(key), self.min), self.max)
+        return self.max
+    
+    def quantiles(self, qs: Iterable[float]) -> Dict[str, Optional[float]]:
+        """Estimate several quantiles, keyed like 'p50', 'p95', 'p99'"""
+        return {f"p{q * 100:g}": self.quantile(q) for q in qs}
+    
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+    
+    def copy(self) -> "QuantileSketch":
+        sketch = QuantileSketch(self.accuracy, self.max_buckets)
+        sketch.merge(self)
+        return sketch
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize for transport (JSON compatible)"""
+        return {
+            "accuracy": self.accuracy,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "zero_count": self.zero_count,
+            "buckets": {str(key): count for key, count in self.buckets.items()}
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        """Rebuild a sketch serialized with to_dict.
+        
+        Raises ValueError for a payload to_dict could not have produced:
+        bucket keys outside the range of finite values, negative counts,
+        or a count that doesn't match the buckets.
+        """
+        try:
+            sketch = cls(accuracy=float(data.get("accuracy", 0.01)))
+            sketch.count = int(data.get("count", 0))
+            sketch.sum = float(data.get("sum", 0.0))
+            sketch.zero_count = int(data.get("zero_count", 0))
+            if sketch.count:
+                sketch.min = float(data["min"])
+                sketch.max = float(data["max"])
+            sketch.buckets = {int(key): int(count) for key, count in data.get("buckets", {}).items()}
+        except (TypeError, KeyError, AttributeError) as e:
+            raise ValueError(f"Malformed sketch: {e}") from e
+        
+        if sketch.count < 0 or sketch.zero_count < 0 or any(count < 0 for count in sketch.buckets.values()):
+            raise ValueError("Sketch counts must not be negative")
+        if sketch.count != sketch.zero_count + sum(sketch.buckets.values()):
+            raise ValueError("Sketch count does not match its buckets")
+        if any(not sketch._min_key <= key <= sketch._max_key for key in sketch.buckets):
+            raise ValueError("Sketch bucket key out of range")
+        if sketch.count and not (0.0 <= sketch.min <= sketch.max < math.inf and math.isfinite(sketch.sum)):
+            raise ValueError("Sketch min/max/sum out of range")
+        
+        if len(sketch.buckets) > sketch.max_buckets:
+            sketch._collapse()
+        return sketch
@@ -0,0 +1,61 @@
+"""
+Shared fixtures: a SQLite-backed DatabaseManager, an API client and agent factories.
+"""
+
+import httpx
+import pytest_asyncio
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.api import agents as agents_api
+from src.core.agent_registry import AgentRegistry
+from src.core.scheduler import TimerWheel
+from src.database.connection import DatabaseManager
+from src.database.models import Base
+from src.models import AgentInfo, AgentType, DeploymentType
+
+
+@pytest_asyncio.fixture
+async def db_manager(tmp_path):
+    """DatabaseManager on a temporary SQLite file (no Redis, no InfluxDB)"""
+    manager = DatabaseManager()
+    manager.async_postgres_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'agents.db'}")
+    manager.async_session_factory = async_sessionmaker(
+        bind=manager.async_postgres_engine,
+        class_=AsyncSession,
+        autocommit=False,
+        autoflush=False,
+        expire_on_commit=False
+    )
+    async with manager.async_postgres_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield manager
+    await manager.async_postgres_engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def api_client(db_manager):
+    """HTTP client for the agents API backed by a registry on ``db_manager``"""
+    app = FastAPI()
+    app.include_router(agents_api.router, prefix="/api/v1/agents")
+    registry = AgentRegistry(db_manager, TimerWheel())
+    previous = agents_api.agent_registry
+    agents_api.set_agent_registry(registry)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        client.registry = registry
+        yield client
+    agents_api.set_agent_registry(previous)
+
+
+def make_agent(name: str = "agent", environment: str = "prod", **overrides) -> AgentInfo:
+    fields = {
+        "name": name,
+        "type": AgentType.CUSTOM,
+        "version": "1.0.0",
+        "deployment_type": DeploymentType.LOCAL,
+        "host": "localhost",
+        "environment": environment,
+    }
+    fields.update(overrides)
+    return AgentInfo(**fields)
@@ -0,0 +1,268 @@
+"""
+Tests for the agent registry against a temporary SQLite database.
+"""
+
+import asyncio
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, select, update
+
+from src.core.agent_registry import AgentRegistry
+from src.core.scheduler import TimerWheel
+from src.database.models import Agent as DBAgent
+from src.models import AgentStatus
+
+from .conftest import make_agent
+
+
+@pytest.fixture
+def registry(db_manager):
+    return AgentRegistry(db_manager, TimerWheel())
+
+
+async def _register(registry, count: int):
+    ids = []
+    for i in range(count):
+        response = await registry.register_agent(make_agent(f"agent-{i:02d}"))
+        ids.append(response.agent_id)
+    return ids
+
+
+@pytest.mark.asyncio
+async def test_paged_listing_is_stable_while_agents_heartbeat(registry):
+    ids = await _register(registry, 10)
+    
+    seen = []
+    page, cursor = await registry.list_agent_summaries(limit=3)
+    seen += [summary.id for summary in page]
+    while cursor:
+        # Agents already listed report in between pages
+        await registry.record_heartbeats(seen)
+        await registry.flush_heartbeats()
+        page, cursor = await registry.list_agent_summaries(limit=3, after=cursor)
+        seen += [summary.id for summary in page]
+    
+    assert sorted(seen) == sorted(ids)
+    assert len(seen) == len(set(seen))
+
+
+@pytest.mark.asyncio
+async def test_export_walk_visits_every_agent_once(registry):
+    ids = await _register(registry, 7)
+    
+    seen = []
+    async for agent in registry.iter_agents(batch_size=2):
+        seen.append(agent.id)
+        await registry.record_heartbeats([agent.id])
+        await registry.flush_heartbeats()
+    
+    assert sorted(seen) == sorted(ids)
+    assert len(seen) == len(set(seen))
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_flush_leaves_updated_at_alone(registry, db_manager):
+    [agent_id] = await _register(registry, 1)
+    async with db_manager.get_session() as session:
+        before = (await session.execute(select(DBAgent.updated_at).where(DBAgent.id == agent_id))).scalar_one()
+    
+    await registry.record_heartbeats([agent_id])
+    assert await registry.flush_heartbeats() == 1
+    
+    async with db_manager.get_session() as session:
+        row = (await session.execute(
+            select(DBAgent.updated_at, DBAgent.last_heartbeat).where(DBAgent.id == agent_id)
+        )).one()
+    assert row.updated_at == before
+    assert row.last_heartbeat is not None
+
+
+async def _db_agent(db_manager, agent_id: str):
+    async with db_manager.get_session() as session:
+        return (await session.execute(select(DBAgent).where(DBAgent.id == agent_id))).scalar_one()
+
+
+async def _db_status(db_manager, agent_id: str) -> str:
+    return (await _db_agent(db_manager, agent_id)).status.value
+
+
+@pytest.mark.asyncio
+async def test_heartbeats_are_buffered_until_flushed(registry, db_manager):
+    [agent_id] = await _register(registry, 1)
+    await registry.update_agent_status(agent_id, AgentStatus.OFFLINE)
+    
+    assert await registry.record_heartbeat(agent_id)
+    assert not await registry.record_heartbeat("no-such-agent")
+    
+    # Not written yet, but reads already see the agent back ONLINE
+    assert await _db_status(db_manager, agent_id) == AgentStatus.OFFLINE
+    assert (await registry.get_agent(agent_id)).status == AgentStatus.ONLINE
+    [summary], _ = await registry.list_agent_summaries()
+    assert summary.status == AgentStatus.ONLINE
+    
+    assert await registry.flush_heartbeats() == 1
+    assert await registry.flush_heartbeats() == 0
+    assert await _db_status(db_manager, agent_id) == AgentStatus.ONLINE
+
+
+@pytest.mark.asyncio
+async def test_metrics_heartbeats_record_metrics_received(registry, db_manager):
+    [agent_id] = await _register(registry, 1)
+    await registry.record_heartbeats([agent_id, agent_id])
+    # A plain heartbeat afterwards keeps the metrics timestamp
+    await registry.record_heartbeat(agent_id)
+    await registry.flush_heartbeats()
+    
+    db_agent = await _db_agent(db_manager, agent_id)
+    assert db_agent.last_metrics_received is not None
+    assert db_agent.last_heartbeat >= db_agent.last_metrics_received
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_heartbeats_for_the_next_one(registry, db_manager, monkeypatch):
+    [agent_id] = await _register(registry, 1)
+    await registry.record_heartbeat(agent_id)
+    
+    def unavailable():
+        raise ConnectionError("database down")
+    
+    with monkeypatch.context() as patch:
+        patch.setattr(db_manager, "get_session", unavailable)
+        assert await registry.flush_heartbeats() == 0
+    
+    assert await registry.flush_heartbeats() == 1
+
+
+@pytest.mark.asyncio
+async def test_agent_lookups_are_cached_until_invalidated(registry, db_manager):
+    [agent_id] = await _register(registry, 1)
+    await registry.get_agent(agent_id)
+    
+    # Changed behind the registry's back: the cached copy is still served
+    async with db_manager.get_session() as session:
+        await session.execute(update(DBAgent).where(DBAgent.id == agent_id).values(name="renamed"))
+        await session.commit()
+    assert (await registry.get_agent(agent_id)).name == "agent-00"
+    assert registry.get_cache_stats()["hits"] == 1
+    
+    await registry.update_agent_status(agent_id, AgentStatus.MAINTENANCE)
+    agent = await registry.get_agent(agent_id)
+    assert (agent.name, agent.status) == ("renamed", AgentStatus.MAINTENANCE)
+    
+    assert await registry.deregister_agent(agent_id)
+    assert await registry.get_agent(agent_id) is None
+
+
+@pytest.mark.asyncio
+async def test_flush_refreshes_cached_agents_in_place(registry):
+    [agent_id] = await _register(registry, 1)
+    before = (await registry.get_agent(agent_id)).last_seen
+    
+    await registry.record_heartbeat(agent_id)
+    await registry.flush_heartbeats()
+    
+    assert AgentRegistry._as_utc((await registry.get_agent(agent_id)).last_seen) > AgentRegistry._as_utc(before)
+    assert registry.get_cache_stats()["misses"] == 1
+
+
+class FakePubSubBus:
+    """In-process stand-in for Redis publish/subscribe"""
+    
+    def __init__(self):
+        self.subscribers = []
+    
+    async def publish(self, channel, data):
+        for queue in self.subscribers:
+            queue.put_nowait({"type": "message", "data": data})
+        return len(self.subscribers)
+    
+    def pubsub(self):
+        return FakePubSub(self)
+
+
+class FakePubSub:
+    def __init__(self, bus: FakePubSubBus):
+        self.bus = bus
+        self.queue = asyncio.Queue()
+    
+    async def subscribe(self, channel):
+        self.bus.subscribers.append(self.queue)
+        self.queue.put_nowait({"type": "subscribe", "data": 1})
+    
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+    
+    async def close(self):
+        self.bus.subscribers.remove(self.queue)
+
+
+@pytest.mark.asyncio
+async def test_invalidations_reach_peer_workers(db_manager):
+    db_manager.redis_client = FakePubSubBus()
+    workers = [AgentRegistry(db_manager, TimerWheel()) for _ in range(2)]
+    for worker in workers:
+        await worker.start()
+    try:
+        writer, reader = workers
+        [agent_id] = await _register(writer, 1)
+        await asyncio.sleep(0)
+        await reader.get_agent(agent_id)
+        
+        await writer.update_agent_status(agent_id, AgentStatus.ERROR)
+        await asyncio.sleep(0)
+        assert (await reader.get_agent(agent_id)).status == AgentStatus.ERROR
+        
+        await reader.record_heartbeat(agent_id)
+        await writer.deregister_agent(agent_id)
+        await asyncio.sleep(0)
+        assert await reader.get_agent(agent_id) is None
+        assert agent_id not in reader._known_agents
+        assert await reader.flush_heartbeats() == 0
+    finally:
+        for worker in workers:
+            await worker.stop()
+            await worker.scheduler.stop()
+
+
+@contextmanager
+def _count_statements(db_manager):
+    statements = []
+    engine = db_manager.async_postgres_engine.sync_engine
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.mark.asyncio
+async def test_summaries_and_fleet_counts_use_one_query(registry, db_manager):
+    for i in range(6):
+        await registry.register_agent(make_agent(f"agent-{i}", environment="prod" if i % 2 else "dev"))
+    [dev_agent, *_] = [summary.id for summary in (await registry.list_agent_summaries(environment="dev"))[0]]
+    await registry.update_agent_status(dev_agent, AgentStatus.OFFLINE)
+    
+    with _count_statements(db_manager) as statements:
+        summaries, cursor = await registry.list_agent_summaries()
+    assert len(statements) == 1
+    assert len(summaries) == 6
+    assert cursor is None
+    
+    with _count_statements(db_manager) as statements:
+        offline, _ = await registry.list_agent_summaries(environment="dev", status=AgentStatus.OFFLINE)
+    assert len(statements) == 1
+    assert [summary.id for summary in offline] == [dev_agent]
+    assert offline[0].health_score == 0.0
+    
+    with _count_statements(db_manager) as statements:
+        counts = await registry.get_fleet_counts()
+    assert len(statements) == 1
+    assert counts["environment"] == {"dev": 3, "prod": 3}
+    assert counts["status"] == {"ONLINE": 5, "OFFLINE": 1}
+    assert counts["type"] == {"CUSTOM": 6}
@@ -0,0 +1,47 @@
+"""
+Tests for the agents API endpoints.
+"""
+
+import pytest
+
+from src.communication.agent_channel import agent_channels
+
+from .conftest import make_agent
+
+
+async def _register(api_client) -> str:
+    return (await api_client.registry.register_agent(make_agent())).agent_id
+
+
+@pytest.mark.asyncio
+async def test_config_push_updates_intervals(api_client):
+    agent_id = await _register(api_client)
+    response = await api_client.put(f"/api/v1/agents/{agent_id}/channel/config", json={"metrics_interval": 15})
+    
+    assert response.status_code == 200
+    assert response.json()["config"]["metrics_interval"] == 15
+    assert agent_channels.get_config(agent_id)["heartbeat_interval"] == agent_channels.default_config()["heartbeat_interval"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("changes", [
+    {"metrics_interval": "fast"},
+    {"metrics_interval": None},
+    {"metrics_interval": 0},
+    {"heartbeat_interval": -5},
+    {"heartbeat_interval": True},
+    {"metrics_intervl": 15},
+    [15],
+])
+async def test_config_push_rejects_invalid_intervals(api_client, changes):
+    agent_id = await _register(api_client)
+    response = await api_client.put(f"/api/v1/agents/{agent_id}/channel/config", json=changes)
+    
+    assert response.status_code == 422
+    assert agent_channels.get_config(agent_id) == agent_channels.default_config()
+
+
+@pytest.mark.asyncio
+async def test_config_push_to_unknown_agent(api_client):
+    response = await api_client.put("/api/v1/agents/missing/channel/config", json={"metrics_interval": 15})
+    assert response.status_code == 404
@@ -0,0 +1,76 @@
+"""
+Tests for the streaming aggregate engine's tumbling windows.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from src.core.aggregate_engine import AggregateEngine, TumblingWindows
+from src.models import AgentMetrics, PerformanceMetrics, ResourceMetrics
+from src.utils.quantiles import QuantileSketch
+
+
+def _sample(timestamp: datetime, cpu: float = 50.0) -> AgentMetrics:
+    return AgentMetrics(
+        agent_id="agent-1",
+        timestamp=timestamp,
+        resource_metrics=ResourceMetrics(
+            cpu_usage_percent=cpu,
+            memory_usage_bytes=1,
+            memory_usage_percent=10.0,
+            disk_usage_bytes=1
+        ),
+        performance_metrics=PerformanceMetrics()
+    )
+
+
+def test_future_sample_does_not_expire_windows():
+    now = 1_700_000_000.0
+    windows = TumblingWindows(60, 15, clock=lambda: now)
+    for i in range(10):
+        windows.add(now - i, {"cpu_usage_percent": 50.0})
+    
+    windows.add(now + 2 * 86400, {"cpu_usage_percent": 99.0})
+    for i in range(10):
+        windows.add(now - i, {"cpu_usage_percent": 50.0})
+    
+    assert windows.merged("cpu_usage_percent", now - 60).count == 20
+    assert windows.latest_start <= now
+
+
+def test_sample_within_one_window_of_clock_is_accepted():
+    now = 1_700_000_000.0
+    windows = TumblingWindows(60, 15, clock=lambda: now)
+    windows.add(now + 30, {"cpu_usage_percent": 50.0})
+    
+    assert windows.merged("cpu_usage_percent", now).count == 1
+
+
+def test_skewed_agent_clock_keeps_field_stats():
+    engine = AggregateEngine()
+    now = datetime.now(timezone.utc)
+    for _ in range(10):
+        engine.observe(_sample(now))
+    engine.observe(_sample(now + timedelta(days=2), cpu=99.0))
+    for _ in range(10):
+        engine.observe(_sample(now))
+    
+    stats = engine.get_field_stats("agent-1", "cpu_usage_percent", 60)
+    assert stats["count"] == 20
+    assert stats["max"] == 50.0
+
+
+def test_client_sketch_with_other_accuracy_is_merged_not_replacing_window():
+    now = 1_700_000_000.0
+    windows = TumblingWindows(60, 15, clock=lambda: now)
+    fine, coarse = QuantileSketch(0.01), QuantileSketch(0.05)
+    for value in range(1, 101):
+        fine.add(float(value))
+        coarse.add(float(value) + 100)
+    
+    windows.add(now, {}, {"response_time_ms": fine})
+    windows.add(now, {}, {"response_time_ms": coarse})
+    
+    merged = windows.merged("response_time_ms", now)
+    assert merged.count == 200
+    assert merged.min == 1.0 and merged.max == 200.0
+    assert abs(merged.quantile(0.75) - 150.0) / 150.0 <= 0.06
@@ -0,0 +1,84 @@
+"""
+Tests for alert evaluation and alert instance persistence.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from src.core.alert_engine import AlertEngine
+from src.database.models import AlertInstance, AlertRule, AlertSeverity, AlertStatus
+from src.models import AgentMetrics, PerformanceMetrics, ResourceMetrics
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _sample(seconds: int, cpu: float) -> AgentMetrics:
+    return AgentMetrics(
+        agent_id="agent-1",
+        timestamp=START + timedelta(seconds=seconds),
+        resource_metrics=ResourceMetrics(
+            cpu_usage_percent=cpu,
+            memory_usage_bytes=1,
+            memory_usage_percent=10.0,
+            disk_usage_bytes=1
+        ),
+        performance_metrics=PerformanceMetrics()
+    )
+
+
+async def _add_rule(db_manager):
+    async with db_manager.get_session() as session:
+        session.add(AlertRule(
+            id="rule-1", name="CPU over 90", condition="cpu > 90",
+            severity=AlertSeverity.HIGH, for_duration=0, is_enabled=True
+        ))
+        await session.commit()
+
+
+async def _instances(db_manager):
+    async with db_manager.get_session() as session:
+        result = await session.execute(select(AlertInstance).order_by(AlertInstance.triggered_at))
+        return [(row.status, row.triggered_at.replace(tzinfo=timezone.utc)) for row in result.scalars()]
+
+
+def _events(engine, *samples):
+    return [(event.rule.rule_id, event.firing) for event in engine.evaluate(list(samples))
+            if event.rule.rule_id == "rule-1"]
+
+
+@pytest.mark.asyncio
+async def test_transitions_persist_in_evaluation_order(db_manager):
+    await _add_rule(db_manager)
+    engine = AlertEngine()
+    await engine.start(db_manager)
+    
+    # Fire, resolve and fire again without yielding to the writer in between
+    assert _events(engine, _sample(0, 95.0)) == [("rule-1", True)]
+    assert _events(engine, _sample(10, 50.0)) == [("rule-1", False)]
+    assert _events(engine, _sample(20, 95.0)) == [("rule-1", True)]
+    await engine.stop()
+    
+    assert await _instances(db_manager) == [
+        (AlertStatus.RESOLVED, START),
+        (AlertStatus.ACTIVE, START + timedelta(seconds=20)),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_active_alerts_resume_on_start(db_manager):
+    await _add_rule(db_manager)
+    engine = AlertEngine()
+    await engine.start(db_manager)
+    _events(engine, _sample(0, 95.0))
+    await engine.stop()
+    
+    restarted = AlertEngine()
+    await restarted.start(db_manager)
+    assert restarted.firing_count("agent-1") == 1
+    assert _events(restarted, _sample(30, 97.0)) == []
+    assert _events(restarted, _sample(40, 50.0)) == [("rule-1", False)]
+    await restarted.stop()
+    
+    assert await _instances(db_manager) == [(AlertStatus.RESOLVED, START)]
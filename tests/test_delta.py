@@ -0,0 +1,116 @@
+"""
+Tests for delta-encoded metrics reports.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.communication.delta import DeltaDecoder, DeltaEncoder, DeltaGapError
+from src.models import AgentMetrics, AIMetrics, PerformanceMetrics, ResourceMetrics
+
+from .conftest import make_agent
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _sample(i: int, agent_id: str = "agent-1") -> AgentMetrics:
+    return AgentMetrics(
+        agent_id=agent_id,
+        timestamp=START + timedelta(seconds=60 * i),
+        resource_metrics=ResourceMetrics(
+            cpu_usage_percent=10.0 + i % 3,
+            memory_usage_bytes=1024,
+            memory_usage_percent=5.0,
+            disk_usage_bytes=2048,
+            gpu_usage_percent=50.0 if i % 2 else None
+        ),
+        performance_metrics=PerformanceMetrics(tasks_completed=i),
+        ai_metrics=AIMetrics(tokens_processed=i) if i % 4 == 0 else None,
+        custom_metrics={"step": i} if i % 5 else {},
+        alerts=["hot"] if i % 3 == 0 else []
+    )
+
+
+def test_round_trip_through_deltas_and_snapshots():
+    encoder, decoder = DeltaEncoder(full_interval=4), DeltaDecoder()
+    for i in range(12):
+        sample = _sample(i)
+        payload = encoder.encode(sample)
+        assert payload.get("full", False) == (i % 5 == 0)
+        assert decoder.apply(payload) == sample
+
+
+def test_gap_and_missing_baseline_require_snapshot():
+    encoder, decoder = DeltaEncoder(), DeltaDecoder()
+    first, second, third = (encoder.encode(_sample(i)) for i in range(3))
+    
+    with pytest.raises(DeltaGapError) as missing:
+        decoder.apply(second)
+    assert missing.value.expected_seq is None
+    
+    decoder.apply(first)
+    with pytest.raises(DeltaGapError) as gap:
+        decoder.apply(third)
+    assert gap.value.expected_seq == 2
+
+
+def test_resent_delta_is_ignored():
+    encoder, decoder = DeltaEncoder(), DeltaDecoder()
+    first, second = encoder.encode(_sample(0)), encoder.encode(_sample(1))
+    decoder.apply(first)
+    assert decoder.apply(second) == _sample(1)
+    assert decoder.apply(second) is None
+    assert decoder.apply(first) == _sample(0)  # Snapshots always rebase
+
+
+@pytest.mark.parametrize("change", [
+    {"unset": ["resource_metrics"]},
+    {"unset": {"resource_metrics": "gpu_usage_percent"}},
+    {"unset": {"nope": ["x"]}},
+    {"set": {"resource_metrics": [1, 2]}},
+    {"set": "cpu"},
+    {"timestamp": 1e20},
+    {"timestamp": float("nan")},
+    {"timestamp": "now"},
+    {"seq": "2"},
+    {"seq": 0},
+    {"alerts": "hot"},
+])
+def test_malformed_delta_raises_value_error_and_keeps_state(change):
+    encoder, decoder = DeltaEncoder(), DeltaDecoder()
+    decoder.apply(encoder.encode(_sample(0)))
+    payload = {**encoder.encode(_sample(1)), **change}
+    
+    with pytest.raises(ValueError) as error:
+        decoder.apply(payload)
+    assert not isinstance(error.value, DeltaGapError)
+    assert decoder.expected_seq("agent-1") == 2
+
+
+async def _post(api_client, agent_id, payload):
+    return await api_client.post(f"/api/v1/agents/{agent_id}/metrics:delta", json=payload)
+
+
+@pytest.mark.asyncio
+async def test_delta_endpoint(api_client):
+    agent_id = (await api_client.registry.register_agent(make_agent())).agent_id
+    encoder = DeltaEncoder()
+    payloads = [encoder.encode(_sample(i, agent_id)) for i in range(4)]
+    
+    response = await _post(api_client, agent_id, payloads[1])
+    assert response.status_code == 409
+    assert response.json()["status"] == "snapshot_required"
+    
+    assert (await _post(api_client, agent_id, payloads[0])).json()["status"] == "success"
+    assert (await _post(api_client, agent_id, payloads[1])).json()["status"] == "success"
+    assert (await _post(api_client, agent_id, payloads[1])).json()["status"] == "duplicate"
+    
+    response = await _post(api_client, agent_id, payloads[3])
+    assert response.status_code == 409
+    assert response.json()["expected_seq"] == 3
+    
+    for change in ({"unset": ["resource_metrics"]}, {"timestamp": 1e20}):
+        response = await _post(api_client, agent_id, {**payloads[2], **change})
+        assert response.status_code == 422
+    assert (await _post(api_client, agent_id, payloads[2])).json()["status"] == "success"
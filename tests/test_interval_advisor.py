@@ -0,0 +1,74 @@
+"""
+Tests for the adaptive reporting interval advisor.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.core.interval_advisor import IntervalAdvisor
+from src.models import AgentMetrics, PerformanceMetrics, ResourceMetrics
+from src.storage.ring_buffer import MetricsRingBuffer
+
+BASE = {"metrics_interval": 60, "heartbeat_interval": 30}
+
+
+def _buffer(*cpu_values: float) -> MetricsRingBuffer:
+    buffer = MetricsRingBuffer("agent-1", capacity=16)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i, cpu in enumerate(cpu_values):
+        buffer.append(AgentMetrics(
+            agent_id="agent-1",
+            timestamp=start + timedelta(seconds=60 * i),
+            resource_metrics=ResourceMetrics(
+                cpu_usage_percent=cpu,
+                memory_usage_bytes=1,
+                memory_usage_percent=10.0,
+                disk_usage_bytes=1
+            ),
+            performance_metrics=PerformanceMetrics()
+        ))
+    return buffer
+
+
+@pytest.mark.parametrize("pressure, factor", [(0.0, 1.0), (0.5, 1.0), (0.75, 2.5), (1.0, 4.0), (2.0, 4.0)])
+def test_load_factor_slows_down_past_half_full(pressure, factor):
+    assert IntervalAdvisor().load_factor(pressure) == factor
+
+
+def test_health_factor():
+    assert IntervalAdvisor.health_factor(False, 0) == 1.0
+    assert IntervalAdvisor.health_factor(False, 2) == 0.5
+    assert IntervalAdvisor.health_factor(True, 2) == 0.25
+
+
+@pytest.mark.parametrize("change, factor", [(None, 1.0), (0.0, 2.0), (0.05, 1.0), (0.1, 0.5), (5.0, 0.25)])
+def test_change_factor(change, factor):
+    assert IntervalAdvisor().change_factor(change) == factor
+
+
+def test_rate_of_change_needs_history():
+    advisor = IntervalAdvisor()
+    assert advisor.rate_of_change(None) is None
+    assert advisor.rate_of_change(_buffer(50.0)) is None
+    assert advisor.rate_of_change(_buffer(50.0, 50.0, 50.0)) == 0.0
+    assert advisor.rate_of_change(_buffer(40.0, 40.0, 60.0)) == pytest.approx(0.5)
+
+
+def test_recommend_combines_factors_within_bounds():
+    advisor = IntervalAdvisor()
+    assert advisor.recommend(BASE, 0.0, buffer=_buffer(50.0, 50.0, 50.0)) == {
+        "metrics_interval": 120.0, "heartbeat_interval": 30.0
+    }
+    assert advisor.recommend(BASE, 0.0, degraded=True, buffer=_buffer(40.0, 40.0, 60.0)) == {
+        "metrics_interval": 10.0, "heartbeat_interval": 10.0
+    }
+    assert advisor.recommend(BASE, 1.0) == {"metrics_interval": 240.0, "heartbeat_interval": 60.0}
+
+
+@pytest.mark.parametrize("value", [0, -5, None, "fast", True, float("nan"), float("inf")])
+def test_recommend_falls_back_to_default_base(value):
+    advisor = IntervalAdvisor()
+    result = advisor.recommend({"metrics_interval": value, "heartbeat_interval": value}, 0.0)
+    assert result == {"metrics_interval": 60.0, "heartbeat_interval": 30.0}
+    assert advisor.recommend({}, 0.0) == result
@@ -0,0 +1,162 @@
+"""
+Tests for the embedded mmap-backed time-series store.
+"""
+
+import os
+from datetime import datetime, timezone
+
+import pytest
+import pytest_asyncio
+
+from src.database.influx_client import TimeSeriesQuery
+from src.database.local_tsdb import RECORD, LocalTimeSeriesStore
+from src.models import AgentMetrics, PerformanceMetrics, ResourceMetrics
+
+DAY = 86400
+START = 1_700_000_000.0 // DAY * DAY
+
+
+def _dt(epoch: float) -> datetime:
+    return datetime.fromtimestamp(epoch, timezone.utc)
+
+
+def _sample(agent_id: str, epoch: float, cpu: float, tasks: int = 0) -> AgentMetrics:
+    return AgentMetrics(
+        agent_id=agent_id,
+        timestamp=_dt(epoch),
+        resource_metrics=ResourceMetrics(
+            cpu_usage_percent=cpu, memory_usage_bytes=1, memory_usage_percent=20.0, disk_usage_bytes=1
+        ),
+        performance_metrics=PerformanceMetrics(tasks_completed=tasks),
+        custom_metrics={"queue": 3, "label": "not a number"}
+    )
+
+
+def _open(path) -> LocalTimeSeriesStore:
+    return LocalTimeSeriesStore(path=str(path), partition_seconds=DAY)
+
+
+@pytest_asyncio.fixture
+async def store(tmp_path):
+    store = _open(tmp_path / "tsdb")
+    await store.initialize()
+    yield store
+    await store.close()
+
+
+async def _fill(store):
+    for i in range(4):
+        for agent, cpu in (("a", 10.0), ("b", 30.0), ("c", 50.0)):
+            await store.write_agent_metrics(_sample(agent, START + 3600 * i, cpu + i, tasks=i))
+
+
+def _cpu(agent_id=None, **kwargs) -> TimeSeriesQuery:
+    return TimeSeriesQuery(
+        measurement="resource_metrics", start_time=_dt(START), end_time=_dt(START + DAY),
+        agent_id=agent_id, fields=["cpu_usage_percent"], **kwargs
+    )
+
+
+@pytest.mark.asyncio
+async def test_write_and_read_back(store):
+    await _fill(store)
+    
+    rows = await store.query_agent_metrics(_cpu("a"))
+    assert [(r["time"], r["agent_id"], r["value"]) for r in rows] == [
+        (_dt(START + 3600 * i), "a", 10.0 + i) for i in range(4)
+    ]
+    custom = await store.query_agent_metrics(TimeSeriesQuery("custom_metrics", _dt(START), agent_id="b"))
+    assert {(r["field"], r["value"]) for r in custom} == {("queue", 3.0)}
+    assert await store.query_agent_metrics(_cpu("missing")) == []
+
+
+@pytest.mark.asyncio
+async def test_agent_and_measurement_sets(store):
+    await _fill(store)
+    
+    rows = await store.query_agent_metrics(_cpu(["a", "c", "missing"]))
+    assert sorted({r["agent_id"] for r in rows}) == ["a", "c"]
+    assert len(rows) == 8
+    
+    rows = await store.query_agent_metrics(TimeSeriesQuery(
+        ["resource_metrics", "performance_metrics"], _dt(START), _dt(START + DAY),
+        agent_id="a", fields=["cpu_usage_percent", "tasks_completed"]
+    ))
+    assert {(r["measurement"], r["field"]) for r in rows} == {
+        ("resource_metrics", "cpu_usage_percent"), ("performance_metrics", "tasks_completed")
+    }
+    assert [r["time"] for r in rows] == sorted(r["time"] for r in rows)
+    
+    chunks = [chunk async for chunk in store.stream_agent_metrics(_cpu({"a", "b"}), chunk_size=3)]
+    assert [len(chunk) for chunk in chunks] == [3, 3, 2]
+
+
+def test_scan_reads_one_measurement(store):
+    with pytest.raises(ValueError):
+        list(store._scan(TimeSeriesQuery(["resource_metrics", "ai_metrics"], _dt(START))))
+
+
+@pytest.mark.asyncio
+async def test_grouped_rollup_and_pivoted_queries(store):
+    await _fill(store)
+    
+    fleet = await store.query_agent_metrics(_cpu(aggregation="mean", group_by=[]))
+    assert [(r["agent_id"], r["value"]) for r in fleet] == [(None, 31.5)]
+    
+    results = await store.query_wide({
+        "tasks": TimeSeriesQuery("performance_metrics", _dt(START), _dt(START + DAY), fields=["tasks_completed"],
+                                 aggregation="last", group_by=[], rollup="sum", pivot=True),
+        "agents": _cpu(aggregation="last", group_by=[], rollup="count", pivot=True),
+        "summary": TimeSeriesQuery(["resource_metrics", "performance_metrics"], _dt(START), _dt(START + DAY),
+                                   agent_id="b", aggregation="max", pivot=True),
+        "hourly": _cpu(aggregation="mean", window="2h", group_by=[], pivot=True),
+    })
+    assert results["tasks"][0].values == {"tasks_completed": 9.0}
+    assert results["agents"][0].values == {"cpu_usage_percent": 3.0}
+    
+    summary = {row.tags["measurement"]: row for row in results["summary"]}
+    assert summary["resource_metrics"].tags["agent_id"] == "b"
+    assert summary["resource_metrics"].values["cpu_usage_percent"] == 33.0
+    assert summary["performance_metrics"].values["tasks_completed"] == 3.0
+    
+    assert [(row.time, row.tags, row.values) for row in results["hourly"]] == [
+        (_dt(START + 7200), {}, {"cpu_usage_percent": 30.5}),
+        (_dt(START + 14400), {}, {"cpu_usage_percent": 32.5}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_reopen_recovers_points_and_ignores_torn_record(tmp_path):
+    store = _open(tmp_path)
+    await store.initialize()
+    await _fill(store)
+    await store.close()
+    
+    # A crash mid-append leaves a partial trailing record
+    segment = tmp_path / "resource_metrics" / f"{int(START)}.seg"
+    with open(segment, "ab") as f:
+        f.write(b"\x01" * (RECORD.size // 2))
+    
+    reopened = _open(tmp_path)
+    await reopened.initialize()
+    try:
+        assert len(await reopened.query_agent_metrics(_cpu())) == 12
+        assert await reopened.last_point_time("resource_metrics") == _dt(START + 3 * 3600)
+        await reopened.write_agent_metrics(_sample("d", START + 7200, 70.0))
+        assert sorted({r["agent_id"] for r in await reopened.query_agent_metrics(_cpu())}) == ["a", "b", "c", "d"]
+    finally:
+        await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_expiry_drops_whole_partitions(store):
+    for day in range(3):
+        await store.write_agent_metrics(_sample("a", START + day * DAY + 60, 10.0 + day))
+    
+    assert await store.drop_before("resource_metrics", _dt(START + DAY + 3600)) == 1
+    rows = await store.query_agent_metrics(TimeSeriesQuery("resource_metrics", _dt(START), agent_id="a",
+                                                           fields=["cpu_usage_percent"]))
+    assert [r["value"] for r in rows] == [11.0, 12.0]
+    assert not os.path.exists(os.path.join(store.path, "resource_metrics", f"{int(START)}.seg"))
+    # Other measurements keep their partitions until their own cutoff
+    assert len(await store.query_agent_metrics(TimeSeriesQuery("performance_metrics", _dt(START)))) == 24
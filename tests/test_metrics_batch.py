@@ -0,0 +1,98 @@
+"""
+Tests for the batched metrics ingestion endpoint.
+"""
+
+import gzip
+import json
+import zlib
+
+import pytest
+
+from src.config import settings
+from src.core.metrics_collector import metrics_collector
+
+from .conftest import make_agent
+
+URL = "/api/v1/agents/metrics:batch"
+
+
+def _sample(agent_id: str, timestamp: str, cpu: float = 10.0) -> dict:
+    return {
+        "agent_id": agent_id,
+        "timestamp": timestamp,
+        "resource_metrics": {
+            "cpu_usage_percent": cpu,
+            "memory_usage_bytes": 1,
+            "memory_usage_percent": 1.0,
+            "disk_usage_bytes": 1
+        },
+        "performance_metrics": {}
+    }
+
+
+async def _register(api_client, count: int = 1) -> list:
+    return [(await api_client.registry.register_agent(make_agent(f"agent-{i}"))).agent_id for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_batch_orders_mixed_timestamps_per_agent(api_client):
+    first, second = await _register(api_client, 2)
+    samples = [
+        _sample(first, "2024-01-01T00:00:03+00:00", cpu=3.0),
+        _sample(second, "2024-01-01T00:00:02", cpu=2.0),
+        _sample(first, "2024-01-01T00:00:01", cpu=1.0),
+        _sample(first, "2024-01-01T02:00:02+02:00", cpu=2.0),
+        _sample("unknown-agent", "2024-01-01T00:00:00"),
+    ]
+    
+    response = await api_client.post(URL, json={"metrics": samples})
+    
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "partial"
+    assert (body["accepted"], body["rejected"], body["agents"]) == (4, 1, 2)
+    assert body["unknown_agents"] == ["unknown-agent"]
+    recent = await metrics_collector.get_recent_metrics(first)
+    assert [m.resource_metrics.cpu_usage_percent for m in recent] == [1.0, 2.0, 3.0]
+    assert len(await metrics_collector.get_recent_metrics(second)) == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_over_limit_is_rejected_before_validation(api_client, monkeypatch):
+    monkeypatch.setattr(settings.monitoring, "max_metrics_batch_size", 2)
+    [agent_id] = await _register(api_client)
+    
+    # Malformed samples: a 413 (not a 422) shows the count is checked first
+    response = await api_client.post(URL, json={"metrics": [{}, {}, {}]})
+    assert response.status_code == 413
+    
+    samples = [_sample(agent_id, f"2024-01-01T00:00:0{i}") for i in range(2)]
+    response = await api_client.post(URL, json={"metrics": samples})
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encoding, compress", [("gzip", gzip.compress), ("deflate", zlib.compress)])
+async def test_compressed_batch_is_decoded(api_client, encoding, compress):
+    [agent_id] = await _register(api_client)
+    body = json.dumps({"metrics": [_sample(agent_id, "2024-01-01T00:00:00")]}).encode()
+    
+    response = await api_client.post(
+        URL, content=compress(body), headers={"Content-Type": "application/json", "Content-Encoding": encoding}
+    )
+    
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
+
+
+@pytest.mark.asyncio
+async def test_invalid_or_oversized_compressed_body_is_rejected(api_client, monkeypatch):
+    headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    response = await api_client.post(URL, content=b"not gzip", headers=headers)
+    assert response.status_code == 422
+    
+    monkeypatch.setattr(settings.monitoring, "max_metrics_body_bytes", 1024)
+    bomb = gzip.compress(json.dumps({"metrics": [], "padding": " " * 4096}).encode())
+    response = await api_client.post(URL, content=bomb, headers=headers)
+    assert response.status_code == 422
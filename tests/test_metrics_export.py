@@ -0,0 +1,135 @@
+"""
+Tests for streaming historical metrics exports from the embedded store.
+"""
+
+import csv
+import io
+import json
+import time
+from datetime import datetime, timezone
+
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+
+from src.api import metrics as metrics_api
+from src.communication import export_format
+from src.core.metrics_collector import metrics_collector
+from src.database.local_tsdb import LocalTimeSeriesStore
+from src.models import AgentMetrics, MetricsQuery, PerformanceMetrics, ResourceMetrics
+
+DAY = 86400
+# Recent enough to be read from the raw tier
+START = (time.time() - 3 * 3600) // 3600 * 3600
+URL = "/api/v1/metrics/export"
+
+
+def _dt(epoch: float) -> datetime:
+    return datetime.fromtimestamp(epoch, timezone.utc)
+
+
+def _sample(agent_id: str, epoch: float, cpu: float) -> AgentMetrics:
+    return AgentMetrics(
+        agent_id=agent_id,
+        timestamp=_dt(epoch),
+        resource_metrics=ResourceMetrics(
+            cpu_usage_percent=cpu, memory_usage_bytes=1, memory_usage_percent=20.0, disk_usage_bytes=1
+        ),
+        performance_metrics=PerformanceMetrics()
+    )
+
+
+@pytest_asyncio.fixture
+async def store(tmp_path, monkeypatch):
+    store = LocalTimeSeriesStore(path=str(tmp_path / "tsdb"), partition_seconds=DAY)
+    await store.initialize()
+    for i in range(5):
+        for agent_id, cpu in (("a", 10.0), ("b", 30.0)):
+            await store.write_agent_metrics(_sample(agent_id, START + 60 * i, cpu + i))
+    monkeypatch.setattr(metrics_collector, "timeseries_store", store)
+    yield store
+    await store.close()
+
+
+@pytest_asyncio.fixture
+async def client():
+    app = FastAPI()
+    app.include_router(metrics_api.router, prefix="/api/v1/metrics")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+def _params(**overrides) -> dict:
+    params = {
+        "agent_ids": ["a"],
+        "metric_names": ["cpu_usage_percent"],
+        "start_time": _dt(START).isoformat(),
+        "end_time": _dt(START + 3600).isoformat(),
+    }
+    params.update(overrides)
+    return params
+
+
+@pytest.mark.asyncio
+async def test_stream_yields_store_rows_in_chunks(store):
+    query = MetricsQuery(
+        agent_ids=["a", "b"], start_time=_dt(START), end_time=_dt(START + 3600), metric_names=["cpu_usage_percent"]
+    )
+    chunks = [chunk async for chunk in metrics_collector.stream_metrics(query, ["a", "b"], chunk_size=2)]
+    
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1, 2, 2, 1]
+    rows = [row for chunk in chunks for row in chunk]
+    assert [row["agent_id"] for row in rows] == ["a"] * 5 + ["b"] * 5
+    assert {row["field"] for row in rows} == {"cpu_usage_percent"}
+    assert [row["value"] for row in rows[:5]] == [10.0, 11.0, 12.0, 13.0, 14.0]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_export(store, client):
+    response = await client.get(URL, params=_params())
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "metrics.ndjson" in response.headers["content-disposition"]
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["value"] for row in rows] == [10.0, 11.0, 12.0, 13.0, 14.0]
+    assert set(rows[0]) == set(export_format.EXPORT_COLUMNS)
+    assert rows[0]["agent_id"] == "a"
+    assert rows[0]["measurement"] == "resource_metrics"
+
+
+@pytest.mark.asyncio
+async def test_csv_export_of_an_aggregated_query(store, client):
+    response = await client.get(URL, params=_params(agent_ids=["b"], aggregation="max", interval="5m", format="csv"))
+    
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == list(export_format.EXPORT_COLUMNS)
+    assert len(rows) == 2
+    assert float(rows[1][4]) == 34.0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("params, status", [
+    ({"format": "xml"}, 400),
+    ({"start_time": _dt(START + 3600).isoformat(), "end_time": _dt(START).isoformat()}, 422),
+    ({"aggregation": "median-ish"}, 422),
+])
+async def test_invalid_exports_fail_before_streaming(store, client, params, status):
+    response = await client.get(URL, params=_params(**params))
+    assert response.status_code == status
+
+
+@pytest.mark.asyncio
+async def test_arrow_export_without_pyarrow(store, client, monkeypatch):
+    monkeypatch.setattr(export_format, "PYARROW_AVAILABLE", False)
+    response = await client.get(URL, params=_params(format="arrow"))
+    assert response.status_code == 406
+
+
+@pytest.mark.asyncio
+async def test_export_without_a_store(client, monkeypatch):
+    monkeypatch.setattr(metrics_collector, "timeseries_store", None)
+    response = await client.get(URL, params=_params())
+    assert response.status_code == 503
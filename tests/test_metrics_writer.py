@@ -0,0 +1,122 @@
+"""
+Tests for the background batching metrics writer.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from src.core import metrics_writer as writer_module
+from src.core.metrics_writer import MetricsWriter
+from src.models import AgentMetrics, PerformanceMetrics, ResourceMetrics
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _sample(agent_id: str) -> AgentMetrics:
+    return AgentMetrics(
+        agent_id=agent_id,
+        timestamp=START,
+        resource_metrics=ResourceMetrics(
+            cpu_usage_percent=1.0, memory_usage_bytes=1, memory_usage_percent=1.0, disk_usage_bytes=1
+        ),
+        performance_metrics=PerformanceMetrics()
+    )
+
+
+class FlakySink:
+    """Fails the first ``failures`` writes, then records every batch"""
+    
+    def __init__(self, failures: int = 0, raises: bool = False):
+        self.failures = failures
+        self.raises = raises
+        self.attempts = 0
+        self.batches = []
+    
+    async def __call__(self, lines):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            if self.raises:
+                raise ConnectionError("backend down")
+            return False
+        self.batches.append(list(lines))
+        return True
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    recorded = []
+    real_sleep = asyncio.sleep
+    
+    async def record_sleep(delay):
+        recorded.append(delay)
+        await real_sleep(0)
+    
+    monkeypatch.setattr(writer_module.asyncio, "sleep", record_sleep)
+    return recorded
+
+
+def _writer(sink, **kwargs) -> MetricsWriter:
+    kwargs.setdefault("flush_interval", 60.0)
+    return MetricsWriter(sink, lambda metrics: [metrics.agent_id], retry_base_delay=1.0, retry_max_delay=3.0, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_retried_with_capped_backoff(delays):
+    sink = FlakySink(failures=3, raises=True)
+    writer = _writer(sink, batch_size=2, max_retries=3)
+    await writer.start()
+    writer.submit(_sample("a"))
+    writer.submit(_sample("b"))
+    await writer.stop()
+    
+    assert sink.batches == [["a", "b"]]
+    assert delays == [1.0, 2.0, 3.0]
+    stats = writer.get_stats()
+    assert stats["write_errors"] == 3
+    assert stats["write_retries"] == 3
+    assert stats["written_points"] == 2
+    assert stats["failed_points"] == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_is_given_up_after_max_retries(delays):
+    sink = FlakySink(failures=2)
+    writer = _writer(sink, batch_size=1, max_retries=1)
+    await writer.start()
+    writer.submit(_sample("a"))
+    writer.submit(_sample("b"))
+    await writer.stop()
+    
+    assert sink.batches == [["b"]]
+    stats = writer.get_stats()
+    assert stats["failed_points"] == 1
+    assert stats["written_points"] == 1
+
+
+@pytest.mark.asyncio
+async def test_queued_samples_are_drained_into_size_bounded_batches():
+    sink = FlakySink()
+    writer = _writer(sink, batch_size=3)
+    await writer.start()
+    for agent_id in "abcdefg":
+        writer.submit(_sample(agent_id))
+    await writer.stop()
+    
+    assert sink.batches == [["a", "b", "c"], ["d", "e", "f"], ["g"]]
+
+
+@pytest.mark.asyncio
+async def test_partial_batch_flushes_after_interval():
+    sink = FlakySink()
+    writer = _writer(sink, batch_size=100, flush_interval=0.01)
+    await writer.start()
+    writer.submit(_sample("a"))
+    for _ in range(100):
+        if sink.batches:
+            break
+        await asyncio.sleep(0.01)
+    
+    assert sink.batches == [["a"]]
+    await writer.stop()
@@ -0,0 +1,77 @@
+"""
+Tests for the mergeable quantile sketch and its wire form.
+"""
+
+import sys
+
+import pytest
+
+from src.utils.quantiles import QuantileSketch
+
+
+def _sketch(*values: float) -> QuantileSketch:
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def test_round_trip_preserves_quantiles():
+    sketch = _sketch(0.0, *range(1, 101))
+    restored = QuantileSketch.from_dict(sketch.to_dict())
+    assert restored.count == 101
+    assert restored.zero_count == 1
+    assert restored.quantiles([0.5, 0.99]) == sketch.quantiles([0.5, 0.99])
+
+
+def test_quantile_of_largest_finite_value():
+    sketch = _sketch(sys.float_info.max)
+    assert sketch.quantile(0.5) == sys.float_info.max
+    assert QuantileSketch.from_dict(sketch.to_dict()).quantile(0.5) == sys.float_info.max
+
+
+def test_merge_rebuckets_other_accuracy():
+    fine, coarse = QuantileSketch(0.01), QuantileSketch(0.05)
+    for value in range(1, 1001):
+        coarse.add(float(value))
+    fine.merge(coarse)
+    
+    assert fine.accuracy == 0.01
+    assert fine.count == 1000
+    for q, expected in ((0.5, 500.0), (0.99, 990.0)):
+        assert abs(fine.quantile(q) - expected) / expected <= 0.06
+
+
+def test_merge_rebuckets_extreme_values():
+    coarse = QuantileSketch(0.5)
+    coarse.add(sys.float_info.max, count=3)
+    coarse.add(5e-324)
+    fine = QuantileSketch(0.01)
+    fine.merge(coarse)
+    assert fine.count == 4
+    assert fine.quantile(0.99) >= sys.float_info.max * 0.98
+
+
+@pytest.mark.parametrize("overrides", [
+    {"buckets": {"100000": 1}},
+    {"buckets": {"-100000": 1}},
+    {"buckets": {"5": -1}, "count": -1},
+    {"zero_count": -1, "count": -1, "buckets": {}},
+    {"count": 5},
+    {"count": 1, "buckets": {"5": 2}},
+    {"buckets": {"x": 1}},
+    {"buckets": None},
+    {"min": None},
+    {"max": float("inf")},
+    {"accuracy": 2.0},
+])
+def test_from_dict_rejects_payloads_to_dict_cannot_produce(overrides):
+    data = _sketch(1.0, 2.0, 3.0).to_dict()
+    data.update(overrides)
+    with pytest.raises(ValueError):
+        QuantileSketch.from_dict(data)
+
+
+def test_from_dict_rejects_non_mapping():
+    with pytest.raises(ValueError):
+        QuantileSketch.from_dict([1, 2, 3])
@@ -0,0 +1,154 @@
+"""
+Tests for the polled-query result cache.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from src.core.result_cache import QueryResultCache
+from src.database.connection import DatabaseManager
+
+NOW = 1_700_000_000.0
+
+
+class FakeRedis:
+    """Minimal async get/set store recording the expiry of each write"""
+    
+    def __init__(self):
+        self.data = {}
+        self.expiry_ms = {}
+    
+    async def get(self, key):
+        return self.data.get(key)
+    
+    async def set(self, key, value, px=None):
+        self.data[key] = value
+        self.expiry_ms[key] = px
+
+
+class Clock:
+    def __init__(self, now: float = NOW):
+        self.now = now
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+def _cache(redis=None, clock=None, **kwargs) -> QueryResultCache:
+    return QueryResultCache(lambda: redis, bucket=15, settle=600, settled_ttl=3600, clock=clock or Clock(), **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_settled_results_expire_after_settled_ttl():
+    redis = FakeRedis()
+    clock = Clock()
+    cache = _cache(redis, clock)
+    stop = datetime.fromtimestamp(NOW - 7200, timezone.utc)
+    calls = []
+    
+    async def compute():
+        calls.append(1)
+        return {"value": len(calls)}
+    
+    assert await cache.get_or_compute("q", {"agent": "a"}, compute, stop=stop) == {"value": 1}
+    (key,) = redis.expiry_ms
+    assert key.endswith(":settled")
+    assert redis.expiry_ms[key] == 3600 * 1000
+    
+    clock.now += 3599
+    redis.data.clear()
+    assert await cache.get_or_compute("q", {"agent": "a"}, compute, stop=stop) == {"value": 1}
+    clock.now += 2
+    assert await cache.get_or_compute("q", {"agent": "a"}, compute, stop=stop) == {"value": 2}
+
+
+@pytest.mark.asyncio
+async def test_initialize_shares_through_manager_redis():
+    manager = DatabaseManager()
+    cache = _cache()
+    cache.initialize(manager)
+    
+    async def compute():
+        return [1, 2, 3]
+    
+    await cache.get_or_compute("q", {}, compute)
+    assert cache.get_stats()["shared_hits"] == 0
+    
+    manager.redis_client = FakeRedis()
+    other = _cache()
+    other.initialize(manager)
+    await cache.get_or_compute("q", {"x": 1}, compute)
+    assert await other.get_or_compute("q", {"x": 1}, compute) == [1, 2, 3]
+    assert other.get_stats()["shared_hits"] == 1
+
+
+class SlowQuery:
+    """Query that blocks until released, counting how often it runs"""
+    
+    def __init__(self, error: Exception = None):
+        self.calls = 0
+        self.error = error
+        self.release = asyncio.Event()
+    
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return {"calls": self.calls}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_computation():
+    cache = _cache()
+    query = SlowQuery()
+    waiters = [asyncio.ensure_future(cache.get_or_compute("q", {"agent": "a"}, query)) for _ in range(5)]
+    await asyncio.sleep(0)
+    
+    # One caller going away must not cancel the others' result
+    waiters[0].cancel()
+    query.release.set()
+    results = await asyncio.gather(*waiters[1:])
+    
+    assert results == [{"calls": 1}] * 4
+    assert query.calls == 1
+    stats = cache.get_stats()
+    assert (stats["computed"], stats["coalesced"], stats["inflight"]) == (1, 4, 0)
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter_and_are_not_cached():
+    cache = _cache()
+    query = SlowQuery(error=RuntimeError("store down"))
+    waiters = [asyncio.ensure_future(cache.get_or_compute("q", {}, query)) for _ in range(3)]
+    await asyncio.sleep(0)
+    query.release.set()
+    
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert query.calls == 1
+    
+    query.error = None
+    assert await cache.get_or_compute("q", {}, query) == {"calls": 2}
+
+
+@pytest.mark.asyncio
+async def test_live_queries_share_a_result_within_their_time_bucket():
+    clock = Clock(NOW - NOW % 15)
+    cache = _cache(clock=clock)
+    calls = []
+    
+    async def compute():
+        calls.append(1)
+        return len(calls)
+    
+    params = {"agent_ids": ["b", "a"], "aggregation": None}
+    assert await cache.get_or_compute("q", params, compute) == 1
+    clock.now += 14
+    # Same query with its list in another order and unset parameters dropped
+    assert await cache.get_or_compute("q", {"agent_ids": ["a", "b", "a"]}, compute) == 1
+    clock.now += 1
+    assert await cache.get_or_compute("q", params, compute) == 2
+    assert await cache.get_or_compute("other", params, compute) == 3
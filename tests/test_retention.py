@@ -0,0 +1,125 @@
+"""
+Tests for retention tier selection and the downsampling compactor.
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+import pytest_asyncio
+
+from src.config import RetentionTier
+from src.core.retention import RetentionCompactor, select_tier, tier_measurement
+from src.database.influx_client import TimeSeriesQuery
+from src.database.local_tsdb import LocalTimeSeriesStore
+
+NOW = 1_700_000_000.0 // 3600 * 3600
+HOUR = 3600
+
+TIERS = [
+    RetentionTier(name="raw", resolution=0, retention_hours=48),
+    RetentionTier(name="1m", resolution=60, retention_hours=30 * 24),
+    RetentionTier(name="1h", resolution=3600, retention_hours=365 * 24),
+]
+
+
+def _dt(epoch: float) -> datetime:
+    return datetime.fromtimestamp(epoch, timezone.utc)
+
+
+def test_recent_range_reads_raw_points():
+    assert select_tier(TIERS, NOW - HOUR, now=NOW).name == "raw"
+
+
+def test_mean_uses_coarsest_tier_dividing_the_window():
+    start = NOW - 3 * 24 * HOUR
+    assert select_tier(TIERS, start, 300, now=NOW, stop=NOW - 24 * HOUR, aggregation="mean").name == "1m"
+    assert select_tier(TIERS, start, 3600, now=NOW, stop=NOW - 24 * HOUR, aggregation="mean").name == "1h"
+
+
+def test_stale_rollup_skipped_while_raw_covers_range():
+    assert select_tier(TIERS, NOW - HOUR, 3600, now=NOW, stop=NOW, aggregation="mean").name == "raw"
+
+
+@pytest.mark.parametrize("aggregation", ["max", "min", "sum", "count", "first", "last"])
+def test_non_mean_aggregations_never_read_rollups(aggregation):
+    start = NOW - 60 * 24 * HOUR
+    assert select_tier(TIERS, start, 3600, now=NOW, stop=NOW - 24 * HOUR, aggregation=aggregation).name == "raw"
+
+
+def test_range_beyond_every_tier_uses_longest_retained():
+    assert select_tier(TIERS, NOW - 400 * 24 * HOUR, now=NOW).name == "1h"
+
+
+@pytest_asyncio.fixture
+async def store(tmp_path):
+    store = LocalTimeSeriesStore(path=str(tmp_path / "tsdb"), partition_seconds=86400)
+    await store.initialize()
+    yield store
+    await store.close()
+
+
+async def _write_cpu(store, start: float, count: int, step: float = 30.0):
+    await store.write_records([
+        ("resource_metrics", "agent-1", "cpu_usage_percent", start + i * step, float(i))
+        for i in range(count)
+    ])
+
+
+@pytest.mark.asyncio
+async def test_compactor_writes_window_means(store):
+    # Two hours of 30s samples ending at NOW
+    await _write_cpu(store, NOW - 2 * HOUR, 240)
+    compactor = RetentionCompactor(lambda: store, TIERS[:2], ["resource_metrics"], lag=0, max_windows=10_000)
+    await compactor.run_once(NOW)
+    
+    rows = await store.query_agent_metrics(TimeSeriesQuery(
+        measurement=tier_measurement("resource_metrics", TIERS[1]),
+        start_time=_dt(NOW - 2 * HOUR),
+        end_time=_dt(NOW),
+        agent_id="agent-1",
+        fields=["cpu_usage_percent"]
+    ))
+    assert len(rows) == 120
+    # Each minute holds samples i and i + 1
+    assert [row["value"] for row in rows[:3]] == [0.5, 2.5, 4.5]
+    assert compactor.get_stats()["errors"] == 0
+
+
+@pytest.mark.asyncio
+async def test_compactor_recovers_watermark_after_restart(store):
+    await _write_cpu(store, NOW - HOUR, 120)
+    compactor = RetentionCompactor(lambda: store, TIERS[:2], ["resource_metrics"], lag=0, max_windows=10_000)
+    await compactor.run_once(NOW)
+    written = compactor.get_stats()["points_written"]
+    assert written == 60
+    
+    restarted = RetentionCompactor(lambda: store, TIERS[:2], ["resource_metrics"], lag=0, max_windows=10_000)
+    await restarted.run_once(NOW)
+    assert restarted.get_stats()["points_written"] == 0
+
+
+@pytest.mark.asyncio
+async def test_compactor_leaves_incomplete_windows_for_later(store):
+    await _write_cpu(store, NOW - 10 * 60, 20)
+    compactor = RetentionCompactor(lambda: store, TIERS[:2], ["resource_metrics"], lag=120, max_windows=10_000)
+    await compactor.run_once(NOW)
+    assert compactor.get_stats()["points_written"] == 8  # minutes older than the lag
+    
+    await compactor.run_once(NOW + 120)
+    assert compactor.get_stats()["points_written"] == 10
+
+
+@pytest.mark.asyncio
+async def test_compactor_expires_points_past_retention(store):
+    await _write_cpu(store, NOW - 72 * HOUR, 10)
+    await _write_cpu(store, NOW - HOUR, 10)
+    compactor = RetentionCompactor(lambda: store, TIERS[:1], ["resource_metrics"], lag=0)
+    await compactor.run_once(NOW)
+    
+    rows = await store.query_agent_metrics(TimeSeriesQuery(
+        measurement="resource_metrics",
+        start_time=_dt(NOW - 100 * HOUR),
+        end_time=_dt(NOW),
+        agent_id="agent-1"
+    ))
+    assert len(rows) == 10
@@ -0,0 +1,68 @@
+"""
+Tests for the columnar metrics ring buffer.
+"""
+
+from datetime import datetime, timezone
+
+from src.storage.ring_buffer import MetricsRingBuffer
+from src.models import AgentMetrics, PerformanceMetrics, ResourceMetrics
+
+
+def _sample(epoch: float, **custom) -> AgentMetrics:
+    return AgentMetrics(
+        agent_id="agent-1",
+        timestamp=datetime.fromtimestamp(epoch, timezone.utc),
+        resource_metrics=ResourceMetrics(
+            cpu_usage_percent=epoch % 100,
+            memory_usage_bytes=1,
+            memory_usage_percent=10.0,
+            disk_usage_bytes=1
+        ),
+        performance_metrics=PerformanceMetrics(),
+        custom_metrics=custom
+    )
+
+
+def _fill(buffer: MetricsRingBuffer, *epochs: float) -> MetricsRingBuffer:
+    for epoch in epochs:
+        buffer.append(_sample(epoch, seq=epoch))
+    return buffer
+
+
+def test_late_samples_are_kept_in_time_order():
+    buffer = _fill(MetricsRingBuffer("agent-1", capacity=10), 10, 20, 40, 30, 50, 5)
+    
+    assert buffer.timestamps().tolist() == [5, 10, 20, 30, 40, 50]
+    assert buffer.column("cpu_usage_percent").tolist() == [5, 10, 20, 30, 40, 50]
+    assert buffer.custom_column("seq") == [5, 10, 20, 30, 40, 50]
+    assert buffer.oldest_timestamp() == 5
+    assert buffer.latest_value("cpu_usage_percent") == 50
+
+
+def test_full_buffer_drops_samples_older_than_its_window():
+    buffer = _fill(MetricsRingBuffer("agent-1", capacity=3), 10, 20, 30)
+    _fill(buffer, 5)
+    assert buffer.timestamps().tolist() == [10, 20, 30]
+    
+    _fill(buffer, 25)
+    assert buffer.timestamps().tolist() == [20, 25, 30]
+    assert [m.custom_metrics["seq"] for m in buffer.materialize()] == [20, 25, 30]
+
+
+def test_insert_across_compaction():
+    buffer = MetricsRingBuffer("agent-1", capacity=4)
+    _fill(buffer, *range(0, 100, 10))
+    _fill(buffer, 75, 95, 65)
+    
+    assert buffer.timestamps().tolist() == [75, 80, 90, 95]
+    assert len(buffer) == 4
+
+
+def test_columns_grow_with_samples_up_to_capacity():
+    buffer = MetricsRingBuffer("agent-1", capacity=1000)
+    assert len(buffer.column("cpu_usage_percent").obj) < 100
+    
+    _fill(buffer, *range(5000))
+    assert len(buffer) == 1000
+    assert buffer.timestamps().tolist() == list(range(4000, 5000))
+    assert len(buffer.column("cpu_usage_percent").obj) == 1250
@@ -0,0 +1,128 @@
+"""
+Tests for the timer wheel scheduler, driven tick by tick.
+"""
+
+import asyncio
+
+import pytest
+
+from src.core.scheduler import TimerWheel
+
+
+async def _advance(wheel: TimerWheel, ticks: int):
+    """Step the wheel as its loop would, letting fired jobs run after each tick"""
+    for _ in range(ticks):
+        wheel._current_tick += 1
+        wheel._advance()
+        await asyncio.sleep(0)
+
+
+def _recorder(wheel: TimerWheel, fired: list, name: str):
+    async def callback():
+        fired.append((name, wheel._current_tick))
+    return callback
+
+
+@pytest.mark.asyncio
+async def test_periodic_and_one_shot_timers():
+    wheel = TimerWheel(slots=8)
+    fired = []
+    wheel.schedule("periodic", 3, _recorder(wheel, fired, "periodic"))
+    wheel.schedule("once", 2, _recorder(wheel, fired, "once"), repeat=False)
+    wheel.schedule("delayed", 5, _recorder(wheel, fired, "delayed"), initial_delay=1)
+    
+    await _advance(wheel, 9)
+    
+    assert fired == [
+        ("delayed", 1), ("once", 2), ("periodic", 3), ("delayed", 6), ("periodic", 6), ("periodic", 9)
+    ]
+    assert "once" not in wheel
+    assert len(wheel) == 2
+
+
+@pytest.mark.asyncio
+async def test_intervals_longer_than_the_wheel_wait_full_rotations():
+    wheel = TimerWheel(slots=4)
+    fired = []
+    wheel.schedule("slow", 10, _recorder(wheel, fired, "slow"))
+    
+    await _advance(wheel, 20)
+    
+    assert fired == [("slow", 10), ("slow", 20)]
+
+
+@pytest.mark.asyncio
+async def test_cancel_and_reschedule():
+    wheel = TimerWheel(slots=8)
+    fired = []
+    wheel.schedule("a", 2, _recorder(wheel, fired, "a"))
+    wheel.schedule("b", 2, _recorder(wheel, fired, "b"))
+    assert wheel.cancel("a")
+    assert not wheel.cancel("a")
+    # Rescheduling a key replaces its timer instead of adding a second one
+    wheel.schedule("b", 3, _recorder(wheel, fired, "b2"))
+    
+    await _advance(wheel, 6)
+    
+    assert fired == [("b2", 3), ("b2", 6)]
+    assert len(wheel) == 1
+
+
+@pytest.mark.asyncio
+async def test_run_still_in_progress_is_skipped():
+    wheel = TimerWheel(slots=8)
+    release = asyncio.Event()
+    runs = []
+    
+    async def slow():
+        runs.append(wheel._current_tick)
+        await release.wait()
+    
+    wheel.schedule("slow", 1, slow)
+    await _advance(wheel, 3)
+    assert runs == [1]
+    
+    release.set()
+    await asyncio.sleep(0)
+    await _advance(wheel, 1)
+    assert runs == [1, 4]
+    await wheel.stop()
+
+
+@pytest.mark.asyncio
+async def test_failing_job_keeps_its_timer():
+    wheel = TimerWheel(slots=8)
+    runs = []
+    
+    async def failing():
+        runs.append(wheel._current_tick)
+        raise RuntimeError("boom")
+    
+    wheel.schedule("failing", 1, failing)
+    await _advance(wheel, 2)
+    
+    assert runs == [1, 2]
+    assert "failing" in wheel
+
+
+@pytest.mark.asyncio
+async def test_running_wheel_fires_and_stop_cancels_jobs():
+    wheel = TimerWheel(tick=0.01)
+    fired = asyncio.Event()
+    cancelled = []
+    
+    async def job():
+        fired.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+    
+    wheel.schedule("job", 0.01, job)
+    await wheel.start()
+    await asyncio.wait_for(fired.wait(), 1)
+    await wheel.stop()
+    
+    assert cancelled == [True]
+    assert not wheel.is_running
@@ -0,0 +1,151 @@
+"""
+Tests for the agent-side metrics spool and its replay to the monitor.
+"""
+
+import gzip
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+import pytest_asyncio
+
+from src.agents import client as client_module
+from src.agents.client import AgentConfig, AgentMonitorClient
+from src.agents.spool import MetricsSpool
+from src.models import AgentMetrics, PerformanceMetrics, ResourceMetrics
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _sample(i: int) -> AgentMetrics:
+    return AgentMetrics(
+        agent_id="agent-1",
+        timestamp=START + timedelta(seconds=i),
+        resource_metrics=ResourceMetrics(
+            cpu_usage_percent=float(i), memory_usage_bytes=1, memory_usage_percent=1.0, disk_usage_bytes=1
+        ),
+        performance_metrics=PerformanceMetrics()
+    )
+
+
+def _payload_size() -> int:
+    return len(_sample(0).model_dump_json().encode())
+
+
+@pytest_asyncio.fixture
+async def spool(tmp_path):
+    spool = MetricsSpool(str(tmp_path / "spool.sqlite3"), max_bytes=3 * _payload_size(), max_age=3600)
+    await spool.open()
+    yield spool
+    spool.close()
+
+
+async def _cpu_values(spool) -> list:
+    return [json.loads(payload)["resource_metrics"]["cpu_usage_percent"] for _, payload in await spool.peek(100)]
+
+
+@pytest.mark.asyncio
+async def test_size_cap_drops_oldest_samples(spool):
+    for i in range(5):
+        await spool.append(_sample(i))
+    
+    assert await _cpu_values(spool) == [2.0, 3.0, 4.0]
+    assert len(spool) == 3
+    assert spool.size_bytes <= spool.max_bytes
+    assert spool.dropped == 2
+
+
+@pytest.mark.asyncio
+async def test_age_cap_drops_stale_samples(spool):
+    for i in range(3):
+        await spool.append(_sample(i))
+    spool._conn.execute("UPDATE samples SET created_at = ? WHERE id <= 2", (time.time() - 7200,))
+    
+    assert await _cpu_values(spool) == [2.0]
+    assert len(spool) == 1
+    assert spool.dropped == 2
+
+
+@pytest.mark.asyncio
+async def test_reopened_spool_keeps_samples_and_counters(spool):
+    for i in range(2):
+        await spool.append(_sample(i))
+    spool.close()
+    
+    reopened = MetricsSpool(spool.path, max_bytes=spool.max_bytes, max_age=spool.max_age)
+    await reopened.open()
+    try:
+        assert len(reopened) == 2
+        assert reopened.size_bytes == 2 * _payload_size()
+        await reopened.remove((await reopened.peek(1))[0][0])
+        assert await _cpu_values(reopened) == [1.0]
+    finally:
+        reopened.close()
+
+
+@pytest_asyncio.fixture
+async def agent_client(tmp_path, monkeypatch):
+    config = AgentConfig(
+        monitor_url="http://monitor", agent_name="agent", spool_path=str(tmp_path / "client.sqlite3"),
+        replay_batch_size=2, retry_base_delay=1.0, retry_max_delay=5.0
+    )
+    client = AgentMonitorClient(config)
+    delays = []
+    
+    async def record_sleep(delay):
+        delays.append(delay)
+    
+    # Deterministic backoff: always the full cap, and no real waiting
+    monkeypatch.setattr(client_module.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(client_module.asyncio, "sleep", record_sleep)
+    client.delays = delays
+    await client._spool.open()
+    yield client
+    client._spool.close()
+    await client._http_client.aclose()
+
+
+def _respond_with(client, *outcomes):
+    """Serve replay requests with the given status codes (or raise for None)"""
+    requests = []
+    outcomes = list(outcomes)
+    
+    def handler(request):
+        requests.append(json.loads(gzip.decompress(request.content))["metrics"])
+        outcome = outcomes.pop(0)
+        if outcome is None:
+            raise httpx.ConnectError("monitor down", request=request)
+        return httpx.Response(outcome, json={})
+    
+    client._http_client = httpx.AsyncClient(base_url="http://monitor", transport=httpx.MockTransport(handler))
+    return requests
+
+
+@pytest.mark.asyncio
+async def test_replay_backs_off_until_monitor_accepts(agent_client):
+    for i in range(3):
+        await agent_client._spool.append(_sample(i))
+    requests = _respond_with(agent_client, 503, 503, None, 200, 200)
+    
+    await agent_client._replay_spool()
+    
+    assert agent_client.delays == [1.0, 2.0, 4.0, 5.0, 0]
+    assert [[m["resource_metrics"]["cpu_usage_percent"] for m in batch] for batch in requests] == [
+        [0.0, 1.0], [0.0, 1.0], [0.0, 1.0], [0.0, 1.0], [2.0]
+    ]
+    assert len(agent_client._spool) == 0
+
+
+@pytest.mark.asyncio
+async def test_replay_discards_batches_rejected_with_4xx(agent_client):
+    for i in range(3):
+        await agent_client._spool.append(_sample(i))
+    requests = _respond_with(agent_client, 400, 200)
+    
+    await agent_client._replay_spool()
+    
+    assert len(requests) == 2
+    assert agent_client.delays == [1.0, 0]
+    assert len(agent_client._spool) == 0
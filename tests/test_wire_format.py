@@ -0,0 +1,125 @@
+"""
+Round-trip and error tests for the metrics wire formats.
+"""
+
+import struct
+from datetime import datetime, timezone
+
+import pytest
+
+from src.communication.wire_format import (
+    BINARY, BINARY_FIELDS, JSON, MSGPACK, MSGPACK_AVAILABLE,
+    BatchTooLargeError, WireFormatError, decode_binary_frame, decode_metrics, encode_metrics
+)
+from src.models import AgentMetrics, AIMetrics, PerformanceMetrics, ResourceMetrics
+
+FORMATS = [
+    JSON,
+    pytest.param(MSGPACK, marks=pytest.mark.skipif(not MSGPACK_AVAILABLE, reason="msgpack not installed")),
+    BINARY,
+]
+
+TIMESTAMP = datetime(2024, 1, 1, 12, 30, 15, 250000, tzinfo=timezone.utc)
+
+
+def _minimal() -> AgentMetrics:
+    """Only required fields; every optional field left as None"""
+    return AgentMetrics(
+        agent_id="agent-min",
+        timestamp=TIMESTAMP,
+        resource_metrics=ResourceMetrics(
+            cpu_usage_percent=12.5, memory_usage_bytes=1024, memory_usage_percent=3.0, disk_usage_bytes=2048
+        ),
+        performance_metrics=PerformanceMetrics()
+    )
+
+
+def _full() -> AgentMetrics:
+    """Every field set, including the response time percentiles, AI metrics and extras"""
+    return AgentMetrics(
+        agent_id="agent-full-é",
+        timestamp=TIMESTAMP,
+        resource_metrics=ResourceMetrics(
+            cpu_usage_percent=99.5, memory_usage_bytes=2 ** 40, memory_usage_percent=80.0,
+            disk_usage_bytes=2 ** 41, disk_io_read_bytes=1, disk_io_write_bytes=2,
+            network_io_rx_bytes=3, network_io_tx_bytes=4, gpu_usage_percent=55.5, gpu_memory_usage_bytes=2 ** 33
+        ),
+        performance_metrics=PerformanceMetrics(
+            tasks_completed=10, tasks_failed=1, tasks_pending=2, average_response_time_ms=120.5,
+            throughput_per_second=3.25, error_rate=0.1, success_rate=0.9, uptime_seconds=3600,
+            response_time_p50_ms=100.0, response_time_p90_ms=180.0, response_time_p99_ms=240.0,
+            response_time_max_ms=310.0
+        ),
+        ai_metrics=AIMetrics(
+            model_inference_time_ms=45.0, model_accuracy=0.95, confidence_score=0.8, tokens_processed=5000,
+            tokens_per_second=110.0, context_length=8192, api_calls_made=7, api_call_latency_ms=210.0
+        ),
+        custom_metrics={"queue_depth": 4, "region": "eu"},
+        health_checks={"db": True, "cache": False},
+        alerts=["slow"],
+        sketches={"response_time_ms": {"accuracy": 0.01, "count": 1, "sum": 5.0, "min": 5.0, "max": 5.0,
+                                       "zero_count": 0, "buckets": {"81": 1}}}
+    )
+
+
+def _frame(samples) -> bytearray:
+    return bytearray(encode_metrics(samples, BINARY))
+
+
+@pytest.mark.parametrize("content_type", FORMATS)
+@pytest.mark.parametrize("sample", [_minimal(), _full()], ids=["minimal", "full"])
+def test_round_trip(content_type, sample):
+    decoded = decode_metrics(encode_metrics([sample], content_type, batch=True), content_type)
+    assert decoded == [sample]
+    assert decoded[0].ai_metrics == sample.ai_metrics
+
+
+@pytest.mark.parametrize("content_type", FORMATS)
+def test_batch_round_trip_keeps_order(content_type):
+    samples = [_full(), _minimal(), _full()]
+    assert decode_metrics(encode_metrics(samples, content_type, batch=True), content_type) == samples
+
+
+@pytest.mark.parametrize("content_type", [JSON, BINARY])
+def test_naive_timestamps_are_utc(content_type):
+    sample = _minimal()
+    sample.timestamp = TIMESTAMP.replace(tzinfo=None)
+    (decoded,) = decode_metrics(encode_metrics([sample], content_type, batch=True), content_type)
+    assert decoded.timestamp.replace(tzinfo=timezone.utc) == TIMESTAMP
+
+
+def test_percentile_fields_have_binary_ids():
+    fields = {field for _, field, _ in BINARY_FIELDS}
+    assert {"response_time_p50_ms", "response_time_p90_ms", "response_time_p99_ms", "response_time_max_ms"} <= fields
+
+
+def test_unknown_mask_bits_are_rejected():
+    frame = _frame([_minimal()])
+    offset = 8 + 2 + len("agent-min")
+    timestamp, mask = struct.unpack_from("<dQ", frame, offset)
+    struct.pack_into("<dQ", frame, offset, timestamp, mask | 1 << len(BINARY_FIELDS))
+    with pytest.raises(WireFormatError, match="Unknown field ids"):
+        decode_binary_frame(bytes(frame))
+
+
+@pytest.mark.parametrize("cut", [0, 3, 8, 12, 30, -5, -1])
+def test_truncated_frames_are_rejected(cut):
+    frame = bytes(_frame([_full(), _minimal()]))
+    with pytest.raises(WireFormatError):
+        decode_binary_frame(frame[:cut] if cut >= 0 else frame[:len(frame) + cut])
+
+
+def test_trailing_bytes_and_bad_magic_are_rejected():
+    frame = bytes(_frame([_minimal()]))
+    with pytest.raises(WireFormatError, match="Trailing"):
+        decode_binary_frame(frame + b"\0")
+    with pytest.raises(WireFormatError, match="magic"):
+        decode_binary_frame(b"XXXX" + frame[4:])
+
+
+@pytest.mark.parametrize("content_type", FORMATS)
+def test_sample_limit_is_checked_before_decoding(content_type):
+    body = encode_metrics([_minimal()] * 3, content_type, batch=True)
+    with pytest.raises(BatchTooLargeError):
+        decode_metrics(body, content_type, max_samples=2)
+    assert len(decode_metrics(body, content_type, max_samples=3)) == 3